@@ -0,0 +1,109 @@
+"""
+Author: rciszek
+
+Compares the background model backends on a sample video, so that the
+cheapest backend detecting the movement of a camera well enough can be
+chosen for it.
+
+Usage:
+    python BackendComparison.py VIDEO [--backends mog2 knn difference average] [--max-frames N] [analysis parameters]
+
+Every frame is decoded once and passed to each backend. For every backend
+the analysis frame rate and the agreement of its movement with the reference
+backend, MOG2 by default, are reported: the fraction of frames with the same
+movement state and the recall and precision of the detected movement time.
+A table is printed to stderr and the results as JSON to stdout.
+"""
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from VideoAnalyzer import BACKENDS, FrameSeries, detectEvents
+from BatchProcessor import BatchProcessor
+from Benchmark import accuracy
+from HeadlessBatch import addAnalysisArguments, analysisParameters, EXIT_OK, EXIT_FAILED
+
+def compareBackends(file_path, parameters, backends=None, reference='mog2', analysis_width=None, max_frames=None):
+    """
+    Analyzes a video with several backends in a single pass.
+
+    Arguments:
+        file_path:      Path of the video file.
+        parameters:     VideoAnalyzer parameters shared by the backends.
+        backends:       Names of the compared backends, by default all.
+        reference:      Name of the backend the others are compared with.
+        analysis_width: Optional width into which the frames are downscaled.
+        max_frames:     Optional number of frames analyzed.
+
+    Outputs:
+        results:        Dict with the number of frames, the decoding frame
+                        rate and a dict of the results of every backend.
+    """
+    backends = list(backends or BACKENDS)
+    if reference not in backends:
+        backends.insert(0, reference)
+    processor = BatchProcessor(parameters, None, analysis_width, prefetch=0)
+    file_path = file_path.replace('\\','/')
+    videoReader, region = processor.openVideo(file_path)
+    videoAnalyzers = { backend : processor.createAnalyzer(dict(parameters, backend = backend), videoReader, region) for backend in backends }
+    frameSeries = { backend : FrameSeries(videoReader.frames + 1) for backend in backends }
+    seconds = { backend : 0.0 for backend in backends }
+    decode_seconds = 0.0
+    frames = 0
+
+    try:
+        while max_frames is None or frames < max_frames:
+            begin_time = time.perf_counter()
+            frame = videoReader.nextFrame()
+            decode_seconds += time.perf_counter() - begin_time
+            if frame is None:
+                break
+            position = videoReader.currentPositionInSeconds()
+            for backend in backends:
+                begin_time = time.perf_counter()
+                foreground_mask, ratio = videoAnalyzers[backend].foregroundRatio(frame)
+                seconds[backend] += time.perf_counter() - begin_time
+                frameSeries[backend].append(position, ratio)
+            frames += 1
+    finally:
+        videoReader.close()
+
+    threshold = parameters['movement_threshold']
+    reference_movement = frameSeries[reference].ratios() > threshold
+    reference_events = detectEvents(frameSeries[reference].times(), reference_movement)
+    results = {}
+    for backend in backends:
+        movement = frameSeries[backend].ratios() > threshold
+        events = detectEvents(frameSeries[backend].times(), movement)
+        results[backend] = dict( fps = round(frames / seconds[backend], 1) if seconds[backend] > 0 else 0.0,
+                                 speedup = round(seconds[reference] / seconds[backend], 2) if seconds[backend] > 0 else 0.0,
+                                 frame_agreement = round(float(np.mean(movement == reference_movement)), 3) if frames > 0 else 0.0,
+                                 **accuracy(events.tolist(), reference_events.tolist()) )
+    return dict( file = file_path, frames = frames, reference = reference,
+                 decode_fps = round(frames / decode_seconds, 1) if decode_seconds > 0 else 0.0, backends = results )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compares the throughput and the agreement of the background model backends on a sample video.')
+    parser.add_argument('video', help='Sample video file.')
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS), help='Compared backends.')
+    parser.add_argument('--reference', choices=list(BACKENDS), default='mog2', help='Backend the others are compared with.')
+    parser.add_argument('--max-frames', type=int, default=None, help='Analyzes at most this many frames.')
+    parser.add_argument('--analysis-width', type=int, default=None, help='Width into which the frames are downscaled before the analysis.')
+    addAnalysisArguments(parser)
+    arguments = parser.parse_args(argv)
+
+    try:
+        comparison = compareBackends(arguments.video, analysisParameters(arguments), arguments.backends, arguments.reference, arguments.analysis_width, arguments.max_frames)
+    except (OSError, ValueError) as e:
+        print("Comparison failed: %s" % e, file=sys.stderr)
+        return EXIT_FAILED
+
+    print('%-12s %10s %8s %10s %8s %10s' % ('backend', 'fps', 'speedup', 'agreement', 'recall', 'precision'), file=sys.stderr)
+    for backend, result in comparison['backends'].items():
+        print('%-12s %10.1f %8.2f %10.3f %8.3f %10.3f' % (backend, result['fps'], result['speedup'], result['frame_agreement'], result['recall'], result['precision']), file=sys.stderr)
+    print(json.dumps(comparison))
+    return EXIT_OK
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,900 @@
+"""
+Author: rciszek
+"""
+import multiprocessing
+import threading
+import glob
+import os
+import re
+import signal
+import time
+import cv2
+import numpy as np
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from VideoReader import VideoReader
+from VideoAnalyzer import VideoAnalyzer, FrameSeries, detectEvents
+from RatioCache import RatioCache
+from RegionOfInterest import loadRegion
+from Instrumentation import StageTimer
+from VideoIndex import VideoIndex
+from JobManifest import JobManifest
+from ResultStore import ResultStore
+
+_cancel_event = None
+_progress_queue = None
+
+#The number of analyzed frames between progress reports
+PROGRESS_INTERVAL = 100
+#The number of concurrent ffprobe processes used for probing
+PROBE_THREADS = 8
+#Seconds of analysis between the checkpoints of a resumable video
+CHECKPOINT_PERIOD = 30.0
+
+def initWorker(cancel_event, progress_queue):
+    """
+    Initializes a worker process of a pool running processInWorker.
+
+    Arguments:
+        cancel_event:   multiprocessing.Event stopping the analyses when set.
+        progress_queue: multiprocessing.Queue receiving (file path, frames)
+                        tuples as the files are analyzed.
+    """
+    global _cancel_event, _progress_queue
+    _cancel_event = cancel_event
+    _progress_queue = progress_queue
+    #Interrupts are handled by the parent, which sets the cancel event, so
+    #that a worker stops at its next frame instead of failing its task.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    #Each worker analyzes a file of its own, so OpenCV's internal threading
+    #would only oversubscribe the cores.
+    cv2.setNumThreads(1)
+
+def _reportProgress(file_path):
+    return lambda frames: _progress_queue.put((file_path, frames))
+
+def processInWorker(processor, file_path):
+    """
+    Analyzes a video in a worker process initialized by initWorker and
+    returns the result of processor.processFile.
+    """
+    return processor.processFile(file_path, _cancel_event, _reportProgress(file_path))
+
+def _analyzeSegment(processor, file_path, segment):
+    return processor.analyzeSegment(file_path, *segment, cancel=_cancel_event, progress=_reportProgress(file_path))
+
+def probeFile(processor, file_path):
+    """
+    Returns the duration and the number of frames of the given video, or
+    zeros if the video cannot be probed.
+    """
+    try:
+        width, height, fps, duration, frames = processor.videoProperties(file_path)
+    except Exception:
+        return 0.0, 0
+    if frames <= 0:
+        frames = int(duration * fps)
+    return duration, frames
+
+def findVideoFiles(source):
+    """
+    Returns the video files found recursively from the source folder.
+    """
+    return glob.glob(source+'/**/*.avi', recursive=True)
+
+def mergeWindows(windows, gap=0.0):
+    """
+    Merges overlapping time windows and windows separated by at most gap
+    seconds.
+
+    Arguments:
+        windows:    List of [start, end] windows.
+
+    Outputs:
+        merged:     Sorted list of disjoint [start, end] windows.
+    """
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def skippedFraction(windows, duration):
+    """
+    Returns the fraction of a video not decoded at full rate by the second
+    pass of the two-pass detection.
+
+    Arguments:
+        windows:    Sorted list of [start, end, warmup_start] windows as
+                    returned by BatchProcessor.findCandidates. The warm-up
+                    before each window is counted as decoded.
+        duration:   Duration of the video in seconds.
+    """
+    if duration <= 0:
+        return 0.0
+    decoded = 0.0
+    decoded_end = 0.0
+    for start, end, warmup_start in windows:
+        end = end if end is not None else duration
+        decoded += max(0.0, end - max(warmup_start, decoded_end))
+        decoded_end = max(decoded_end, end)
+    return max(0.0, 1.0 - decoded / duration)
+
+def combineSegments(results, contiguous=True):
+    """
+    Concatenates the per-frame series of consecutive segments of a video.
+
+    Arguments:
+        results:    Segment results as returned by BatchProcessor.analyzeSegment,
+                    in temporal order.
+        contiguous: If False, the segments are separate windows of the video.
+                    A frame without movement is then inserted at the first
+                    frame following each window, so that an event open at
+                    the end of a window is closed there.
+
+    Outputs:
+        times:      Array of frame times.
+        ratios:     Array of foreground ratios.
+    """
+    times = []
+    ratios = []
+    for result in results:
+        times.append(result['times'])
+        ratios.append(result['ratios'])
+        if not contiguous and result['end_time'] is not None:
+            times.append(np.array([result['end_time']], dtype=np.float64))
+            ratios.append(np.zeros(1, dtype=np.float64))
+    if not times:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+    return np.concatenate(times), np.concatenate(ratios)
+
+
+class BatchProcessor:
+    """
+        Analyzes single video files and writes the detected movement events
+        into the target folder. The processor holds only plain parameters, so
+        it can be pickled to worker processes, each of which creates its own
+        VideoReader and VideoAnalyzer for every file.
+
+        Arguments:
+            parameters:     VideoAnalyzer parameters as returned by
+                            VideoAnalyzer.getParameters.
+            target:         Folder into which the event files are written.
+            analysis_width: Optional width into which the frames are
+                            downscaled before the analysis.
+            prefetch:       Depth of the queue of frames decoded ahead of the
+                            analysis. Zero disables the prefetch thread.
+            segment_length: If set, videos longer than one and a half segments
+                            are split into segments of this many seconds which
+                            are analyzed in parallel.
+            segment_warmup: Seconds analyzed before each segment to let the
+                            background model converge. Defaults to twice the
+                            history of the background model.
+            cache_folder:   If set, the per-frame foreground ratios are stored
+                            into this folder. Videos found in the cache are not
+                            analyzed again; their events are derived from the
+                            cached ratios using the current movement threshold.
+            two_pass:       If set, a coarse pass over a downscaled stream of
+                            every coarse_step:th frame first locates candidate
+                            movement windows, and only those windows, widened
+                            by guard_band seconds, are analyzed at full rate.
+            coarse_width:   Frame width of the coarse pass.
+            coarse_step:    Frame stride of the coarse pass.
+            coarse_threshold: Movement threshold of the coarse pass. Defaults
+                            to half of the movement threshold, favouring recall.
+            guard_band:     Seconds added before and after each candidate.
+            min_duration:   Events shorter than this many seconds are dropped.
+            merge_gap:      Events separated by at most this many seconds are
+                            merged.
+            series_format:  If 'npz' or 'parquet', the per-frame times, ratios
+                            and movement states are also written next to the
+                            event file in this format.
+            instrument:     If set, the time spent in each stage of the
+                            processing is recorded and written as
+                            <video name>.timing.json into the target folder.
+            index_path:     Optional path of a VideoIndex database from which
+                            the video properties are taken instead of probing
+                            every video with ffprobe.
+            resume:         If set, completed videos are recorded into a
+                            JobManifest in the target folder and skipped by
+                            later batches while their events are current. A
+                            video analyzed as a single segment is
+                            checkpointed periodically and when cancelled, and
+                            resumed from its checkpoint.
+            results_path:   Optional path of a ResultStore database into
+                            which the events are written instead of an
+                            event file for every video.
+    """
+
+    SERIES_FORMATS = ('npz', 'parquet')
+
+
+    def __init__(self, parameters, target, analysis_width=None, prefetch=4, segment_length=None, segment_warmup=None, cache_folder=None,
+                 two_pass=False, coarse_width=160, coarse_step=5, coarse_threshold=None, guard_band=2.0,
+                 min_duration=0.0, merge_gap=0.0, series_format=None, instrument=False, index_path=None, resume=False, results_path=None):
+        self.parameters = dict(parameters)
+        self.target = target
+        self.analysis_width = analysis_width
+        self.prefetch = prefetch
+        self.segment_length = segment_length
+        self.segment_warmup = segment_warmup
+        self.ratioCache = RatioCache(cache_folder) if cache_folder else None
+        self.two_pass = two_pass
+        self.coarse_width = coarse_width
+        self.coarse_step = max(1, int(coarse_step))
+        self.coarse_threshold = coarse_threshold
+        self.guard_band = guard_band
+        self.min_duration = min_duration
+        self.merge_gap = merge_gap
+        if series_format is not None and series_format not in BatchProcessor.SERIES_FORMATS:
+            raise ValueError("Unsupported series format: %s" % series_format)
+        if series_format == 'parquet':
+            import pyarrow
+        self.series_format = series_format
+        self.instrument = instrument
+        self.videoIndex = VideoIndex(index_path) if index_path else None
+        self.jobManifest = JobManifest(target) if resume else None
+        self.resultStore = ResultStore(results_path) if results_path else None
+
+    def outputName(self, file_path):
+        """
+        Returns the name of the output file of the given video or None if the
+        video name is not supported.
+        """
+        captured = re.search('(?<=/)([A-Za-z0-9\-_]+)(?=.avi)', file_path, re.IGNORECASE)
+        if captured is None:
+            return None
+        return captured.group(0)
+
+    def findVideoFiles(self, source):
+        """
+        Returns the video files of the source folder, refreshing the video
+        index if one is used.
+        """
+        if self.videoIndex is not None:
+            return self.videoIndex.refresh(source)
+        return findVideoFiles(source)
+
+    def videoProperties(self, file_path):
+        """
+        Returns the (width, height, fps, duration, frames) of the given video,
+        from the video index if it is up to date and by probing otherwise.
+        """
+        if self.videoIndex is not None:
+            properties = self.videoIndex.properties(file_path)
+            if properties is not None:
+                return properties
+        return VideoReader.getVideoProperties(file_path)
+
+    def openVideo(self, file_path, position=0.0, target_width=None, frame_step=1, prefetch=None):
+        """
+        Opens a grayscale analysis reader for the given video, cropped to the
+        region of interest defined for the video. The frames are downscaled
+        to target_width, by default to the analysis width, and prefetched to
+        the depth of the processor unless another prefetch is given.
+
+        Outputs:
+            videoReader:    The opened VideoReader.
+            region:         The RegionOfInterest of the video or None.
+        """
+        region = loadRegion(file_path)
+        videoReader = VideoReader(file_path, grayscale=True, target_width=target_width or self.analysis_width, buffer_count=2, prefetch=self.prefetch if prefetch is None else prefetch, position=position,
+                                  crop=region.crop if region is not None else None, frame_step=frame_step, properties=self.videoProperties(file_path))
+        return videoReader, region
+
+    def regionMask(self, videoReader, region):
+        """
+        Returns the polygon of the region rasterized to the frames of the
+        reader, or None if there is no region.
+        """
+        if region is None or videoReader is None:
+            return None
+        return region.createMask(videoReader.frame_width, videoReader.frame_height, videoReader.width, videoReader.height, videoReader.crop)
+
+    def createAnalyzer(self, parameters=None, videoReader=None, region=None, region_mask=None):
+        """
+        Creates a VideoAnalyzer using the given parameters, by default those of
+        the processor. The polygon of the region, if any, is rasterized to
+        the frames of the reader, unless an already rasterized region_mask is
+        given.
+        """
+        videoAnalyzer = VideoAnalyzer(**(parameters or self.parameters))
+        if region_mask is None:
+            region_mask = self.regionMask(videoReader, region)
+        if region_mask is not None:
+            videoAnalyzer.setRegionMask(region_mask)
+        return videoAnalyzer
+
+    def seriesSettings(self, file_path):
+        """
+        Returns the settings other than the analyzer parameters affecting the
+        per-frame series of the given video.
+        """
+        region = loadRegion(file_path)
+        return dict(analysis_width = self.analysis_width, segment_length = self.segment_length, segment_warmup = self.segment_warmup,
+                    region = region.toDict() if region is not None else None)
+
+    def outputSettings(self, file_path):
+        """
+        Returns every setting affecting the output files of the given video.
+        """
+        settings = self.seriesSettings(file_path)
+        settings.update(self.resultSettings(), series_format = self.series_format)
+        if self.resultStore is not None:
+            settings['results'] = JobManifest.key(self.resultStore.path)
+        return settings
+
+    def resultSettings(self, parameters=None):
+        """
+        Returns the settings common to every video affecting the events
+        detected with the given parameters, by default those of the processor.
+        """
+        return dict(parameters = { k : v if isinstance(v, str) else float(v) for k, v in (parameters or self.parameters).items() }, analysis_width = self.analysis_width,
+                    two_pass = self.two_pass, coarse_width = self.coarse_width, coarse_step = self.coarse_step, coarse_threshold = self.coarse_threshold,
+                    guard_band = self.guard_band, min_duration = self.min_duration, merge_gap = self.merge_gap)
+
+    def cacheKey(self, file_path):
+        """
+        Returns the ratio cache key of the given video.
+        """
+        return self.ratioCache.key(file_path, self.parameters, self.seriesSettings(file_path))
+
+    def checkpointKey(self, file_path):
+        """
+        Returns the checkpoint key of the given video.
+        """
+        return self.jobManifest.checkpoints.key(file_path, self.parameters, self.seriesSettings(file_path))
+
+    def pendingFiles(self, video_files):
+        """
+        Returns the videos whose events are missing or out of date according
+        to the job manifest, or all videos if no manifest is used. With a
+        results store, videos whose events are not in the store are pending
+        as well.
+        """
+        if self.jobManifest is None:
+            return list(video_files)
+        jobs = []
+        for file_path in video_files:
+            file_name = self.outputName(file_path.replace('\\','/'))
+            output_path = self.target + "/" + str(file_name) + ".csv" if self.resultStore is None else None
+            jobs.append((file_path, self.outputSettings(file_path), output_path))
+        pending = self.jobManifest.pending(jobs)
+        if self.resultStore is None:
+            return pending
+        #The manifest cannot tell whether the store has been deleted or recreated
+        pending = set(pending)
+        analyzed = self.resultStore.analyzed(self.resultSettings())
+        return [file_path for file_path in video_files if file_path in pending or JobManifest.key(file_path) not in analyzed]
+
+    def recordCompleted(self, file_path):
+        """
+        Records the given video as completed into the job manifest.
+        """
+        if self.jobManifest is not None:
+            self.jobManifest.complete(file_path, self.outputSettings(file_path))
+
+    def segmentFile(self, file_path):
+        """
+        Splits the given video into segments.
+
+        Outputs:
+            segments:   List of (start, end, warmup_start) tuples in seconds.
+                        The end of the last segment is None.
+        """
+        segments = [(0.0, None, 0.0)]
+        if not self.segment_length or self.two_pass or self.outputName(file_path.replace('\\','/')) is None:
+            return segments
+        if self.ratioCache is not None and self.ratioCache.contains(self.cacheKey(file_path)):
+            return segments
+
+        width, height, fps, duration, frames = self.videoProperties(file_path)
+        if fps <= 0 or duration < 1.5 * self.segment_length:
+            return segments
+
+        starts = np.arange(0.0, duration - 0.5 * self.segment_length, self.segment_length)
+        segments = []
+        for i in range(0, len(starts)):
+            end = float(starts[i+1]) if i+1 < len(starts) else None
+            segments.append((float(starts[i]), end, self.warmupStart(float(starts[i]), fps)))
+        return segments
+
+    def warmupStart(self, start, fps):
+        """
+        Returns the frame-aligned position from which the background model is
+        warmed up before the given start.
+        """
+        warmup = self.segment_warmup
+        if warmup is None:
+            warmup = 2.0 * float(self.parameters.get('history', 100)) / fps
+        return np.floor(max(0.0, start - warmup) * fps) / fps
+
+    def analyzeSegment(self, file_path, start=0.0, end=None, warmup_start=0.0, cancel=None, progress=None, checkpoint=None):
+        """
+        Computes the foreground ratios of the frames of a single video falling
+        between start (exclusive) and end (inclusive). The frames from
+        warmup_start onwards are passed to the background model but not
+        reported. The optional progress callable receives the number of
+        frames analyzed since its previous call. The optional checkpoint
+        callable receives the times and ratios of the segment analyzed so
+        far every CHECKPOINT_PERIOD seconds and when the analysis is
+        cancelled.
+
+        Outputs:
+            result:     Dict with the keys 'completed', 'frames', 'seconds',
+                        'times' and 'ratios', the per-frame series of the
+                        segment, and 'end_time', the time of the first frame
+                        after the segment or None at the end of the video,
+                        and 'timings', the StageTimer of the segment.
+        """
+        file_path = file_path.replace('\\','/')
+        result = dict(completed = False, frames = 0, seconds = 0.0, end_time = None)
+        timer = StageTimer(self.instrument)
+
+        begin_time = time.perf_counter()
+        videoReader, region = self.openVideo(file_path, warmup_start)
+        videoAnalyzer = self.createAnalyzer(videoReader=videoReader, region=region)
+        videoAnalyzer.timer = timer
+        capacity = ((end if end is not None else videoReader.duration) - start) * videoReader.fps
+        frameSeries = FrameSeries(capacity + 1 if capacity > 0 else 1024)
+        checkpoint_time = time.perf_counter()
+
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    break
+
+                start_time = timer.now()
+                frame = videoReader.nextFrame()
+                timer.record('read', start_time)
+                position = videoReader.currentPositionInSeconds()
+
+                if frame is None or (end is not None and position > end):
+                    result['completed'] = True
+                    if frame is not None:
+                        result['end_time'] = position
+                    break
+
+                foreground_mask, ratio = videoAnalyzer.foregroundRatio(frame)
+                start_time = timer.now()
+                if position > start:
+                    frameSeries.append(position, ratio)
+                    if frameSeries.size % PROGRESS_INTERVAL == 0:
+                        if progress is not None:
+                            progress(PROGRESS_INTERVAL)
+                        if checkpoint is not None and time.perf_counter() - checkpoint_time > CHECKPOINT_PERIOD:
+                            checkpoint(frameSeries.times(), frameSeries.ratios())
+                            checkpoint_time = time.perf_counter()
+                timer.record('track', start_time)
+        finally:
+            videoReader.close()
+
+        if checkpoint is not None and not result['completed'] and frameSeries.size > 0:
+            checkpoint(frameSeries.times(), frameSeries.ratios())
+
+        result['times'] = frameSeries.times()
+        result['ratios'] = frameSeries.ratios()
+        result['frames'] = frameSeries.size
+        result['timings'] = timer
+        result['seconds'] = time.perf_counter() - begin_time
+        return result
+
+    def finishSegments(self, file_path, results, contiguous=True):
+        """
+        Combines the segment results of a video and writes the events if
+        every segment was completed. The ratios of contiguous segments are
+        stored into the ratio cache.
+
+        Outputs:
+            result:     Dict with the keys 'completed', 'frames', 'seconds'
+                        and 'timings', the merged StageTimer of the segments.
+        """
+        for segment_result in results:
+            if isinstance(segment_result, Exception):
+                raise segment_result
+        timer = StageTimer(self.instrument)
+        for segment_result in results:
+            timer.merge(segment_result['timings'])
+        result = dict(completed = all(r['completed'] for r in results), frames = sum(r['frames'] for r in results), seconds = sum(r['seconds'] for r in results), timings = timer)
+        if result['completed']:
+            start_time = timer.now()
+            times, ratios = combineSegments(results, contiguous)
+            self.writeResults(file_path, times, ratios)
+            if self.ratioCache is not None and contiguous:
+                self.ratioCache.store(self.cacheKey(file_path), times, ratios)
+            timer.record('write', start_time)
+            if self.instrument:
+                timer.write(self.target + "/" + self.outputName(file_path.replace('\\','/')) + ".timing.json")
+        return result
+
+    def findCandidates(self, file_path, cancel=None):
+        """
+        Performs the coarse pass of the two-pass detection.
+
+        Outputs:
+            windows:    List of [start, end, warmup_start] windows to analyze
+                        at full rate, or None if the pass was cancelled.
+            duration:   Duration of the video.
+            frames:     The number of frames analyzed by the coarse pass.
+        """
+        videoReader, region = self.openVideo(file_path, target_width=self.coarse_width, frame_step=self.coarse_step)
+        fps = videoReader.fps
+        duration = videoReader.duration
+        scale = videoReader.frame_width / float(videoReader.inputSize()[0]) if videoReader.width > 0 else 1.0
+        parameters = dict(self.parameters)
+        parameters['history'] = max(1, int(round(float(parameters.get('history', 100)) / self.coarse_step)))
+        parameters['open_kernel_size'] = max(1, int(round(float(parameters.get('open_kernel_size', 3)) * scale)))
+        videoAnalyzer = self.createAnalyzer(parameters, videoReader, region)
+        threshold = self.coarse_threshold if self.coarse_threshold is not None else 0.5 * float(self.parameters['movement_threshold'])
+        step_seconds = self.coarse_step / fps if fps > 0 else 0.0
+
+        windows = []
+        frames = 0
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    return None, duration, frames
+                frame = videoReader.nextFrame()
+                if frame is None:
+                    break
+                foreground_mask, ratio = videoAnalyzer.foregroundRatio(frame)
+                frames += 1
+                if threshold < ratio:
+                    position = videoReader.currentPositionInSeconds()
+                    windows.append([max(0.0, position - step_seconds - self.guard_band), position + self.guard_band])
+        finally:
+            videoReader.close()
+
+        warmup_gap = 2.0 * float(self.parameters.get('history', 100)) / fps if self.segment_warmup is None else self.segment_warmup
+        windows = mergeWindows(windows, warmup_gap)
+        return [[start, end if end < duration else None, self.warmupStart(start, fps)] for start, end in windows], duration, frames
+
+    def processTwoPass(self, file_path, cancel=None, progress=None):
+        """
+        Detects the movement events of a single video using the coarse and
+        the full-rate pass.
+
+        Outputs:
+            result:     Dict with the keys of processFile and 'skipped', the
+                        fraction of the video not decoded at full rate, the
+                        warm-up before each window counted as decoded, and
+                        'coarse_frames'.
+        """
+        begin_time = time.perf_counter()
+        windows, duration, coarse_frames = self.findCandidates(file_path, cancel)
+        result = dict(completed = False, frames = 0, seconds = 0.0, skipped = 0.0, coarse_frames = coarse_frames)
+        if windows is None:
+            return result
+
+        results = []
+        for start, end, warmup_start in windows:
+            segment_result = self.analyzeSegment(file_path, start, end, warmup_start, cancel, progress)
+            results.append(segment_result)
+            if not segment_result['completed']:
+                break
+
+        result.update(self.finishSegments(file_path, results, contiguous=False))
+        result['skipped'] = skippedFraction(windows, duration)
+        result['seconds'] = time.perf_counter() - begin_time
+        return result
+
+    def processCached(self, file_path):
+        """
+        Writes the events of the given video using the cached ratios.
+
+        Outputs:
+            result:     Result dict as returned by processFile or None if the
+                        video is not found in the cache.
+        """
+        begin_time = time.perf_counter()
+        series = self.ratioCache.load(self.cacheKey(file_path))
+        if series is None:
+            return None
+        times, ratios = series
+        self.writeResults(file_path, times, ratios)
+        return dict(completed = True, frames = len(times), seconds = time.perf_counter() - begin_time)
+
+    def writeResults(self, file_path, times, ratios):
+        """
+        Derives the events of the given video from its per-frame series and
+        writes them into the target folder, together with the series if a
+        series format is set.
+        """
+        movement = ratios > self.parameters['movement_threshold']
+        self.writeEvents(file_path, detectEvents(times, movement, self.min_duration, self.merge_gap))
+        if self.series_format is not None:
+            self.writeSeries(file_path, times, ratios, movement)
+
+    def writeEvents(self, file_path, events):
+        """
+        Writes the events of the given video into the results store if one is
+        used, and into the target folder otherwise.
+        """
+        file_name = self.outputName(file_path.replace('\\','/'))
+        if self.resultStore is not None:
+            self.resultStore.addEvents(file_path, file_name, [(self.resultSettings(), events)])
+            return
+        np.savetxt(self.target  + "/" + file_name+".csv",np.array(events), delimiter=",", fmt='%.2f')
+
+    def writeSeries(self, file_path, times, ratios, movement):
+        """
+        Writes the per-frame series of the given video into the target folder
+        as columns 'time', 'ratio' and 'movement'.
+        """
+        file_name = self.outputName(file_path.replace('\\','/'))
+        if self.series_format == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.table({ 'time' : times, 'ratio' : ratios, 'movement' : movement })
+            pyarrow.parquet.write_table(table, self.target + "/" + file_name + ".parquet")
+        else:
+            np.savez_compressed(self.target + "/" + file_name + ".npz", time = times, ratio = ratios, movement = movement)
+
+    def processFile(self, file_path, cancel=None, progress=None):
+        """
+        Detects the movement events of a single video file.
+
+        Arguments:
+            file_path:  Path of the video file.
+            cancel:     Optional event. The analysis is stopped once it is set.
+            progress:   Optional callable receiving the number of frames
+                        analyzed since its previous call.
+
+        Outputs:
+            result:     Dict with the keys 'completed', indicating whether the
+                        events were written, 'frames', the number of analyzed
+                        frames, and 'seconds', the wall time of the analysis.
+        """
+        file_path = file_path.replace('\\','/')
+
+        if self.outputName(file_path) is None or (cancel is not None and cancel.is_set()):
+            return dict(completed = False, frames = 0, seconds = 0.0)
+
+        if self.ratioCache is not None:
+            result = self.processCached(file_path)
+            if result is not None:
+                return result
+
+        if self.two_pass:
+            return self.processTwoPass(file_path, cancel, progress)
+
+        if self.jobManifest is not None:
+            return self.processResumable(file_path, cancel, progress)
+
+        return self.finishSegments(file_path, [self.analyzeSegment(file_path, cancel=cancel, progress=progress)])
+
+    def processResumable(self, file_path, cancel=None, progress=None):
+        """
+        Detects the movement events of a single video file, resuming from its
+        checkpoint if one exists. The background model is warmed up on the
+        frames preceding the checkpoint as for a segment.
+
+        Outputs:
+            result:     Dict with the keys of processFile and 'resumed', the
+                        position in seconds from which the analysis was
+                        resumed.
+        """
+        key = self.checkpointKey(file_path)
+        results = []
+        start = 0.0
+        warmup_start = 0.0
+        series = self.jobManifest.loadCheckpoint(key)
+        if series is not None and len(series[0]) > 0:
+            times, ratios = series
+            start = float(times[-1])
+            warmup_start = self.warmupStart(start, self.videoProperties(file_path)[2])
+            results.append(dict(completed = True, frames = 0, seconds = 0.0, times = times, ratios = ratios, end_time = None, timings = StageTimer(self.instrument)))
+
+        def store(times, ratios):
+            self.jobManifest.storeCheckpoint(key, *combineSegments(results + [dict(times = times, ratios = ratios, end_time = None)]))
+
+        results.append(self.analyzeSegment(file_path, start, None, warmup_start, cancel, progress, store))
+        result = self.finishSegments(file_path, results)
+        if result['completed']:
+            self.jobManifest.discardCheckpoint(key)
+        result['resumed'] = start
+        return result
+
+
+class ParallelBatch:
+    """
+        Distributes video files, or segments of long video files, to a pool
+        of worker processes. The files are probed beforehand and processed
+        longest first, so that the batch does not end with a single long
+        file processed alone. Progress is reported in frames.
+
+        Arguments:
+            processor:  BatchProcessor used for the individual files.
+            workers:    The number of worker processes. With a single worker
+                        the files are processed in the calling thread.
+    """
+
+    #Seconds between progress reports of the pool
+    PROGRESS_PERIOD = 0.5
+
+    def __init__(self, processor, workers=None):
+        self.processor = processor
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.failed = []
+        self.completed = 0
+        self.frames = 0
+        self.results = {}
+        self.timer = StageTimer(True)
+        self.current = 0
+        self.estimates = {}
+        self.reported = {}
+        if self.workers > 1:
+            self.cancel_event = multiprocessing.Event()
+        else:
+            self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """
+        Stops the batch. Running workers stop at their next frame and files
+        not yet started are skipped.
+        """
+        self.cancel_event.set()
+
+    def isCancelled(self):
+        return self.cancel_event.is_set()
+
+    def probeFiles(self, video_files):
+        """
+        Probes the given files concurrently.
+
+        Outputs:
+            properties: Dict mapping file paths to (duration, frames) tuples.
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=PROBE_THREADS) as executor:
+                return dict(zip(video_files, executor.map(lambda f: probeFile(self.processor, f), video_files)))
+        finally:
+            #The probe threads have opened index connections of their own
+            if self.processor.videoIndex is not None:
+                self.processor.videoIndex.close()
+
+    def framesDone(self):
+        """
+        Returns the number of finished frames, estimated from the progress
+        reports and capped to the probed length of each file.
+        """
+        return sum(min(self.reported[f], self.estimates[f]) for f in self.reported)
+
+    def framesTotal(self):
+        return sum(self.estimates.values())
+
+    def run(self, video_files, progress=None):
+        """
+        Processes the given video files.
+
+        Arguments:
+            video_files:    List of video file paths.
+            progress:       Optional callable receiving the number of finished
+                            frames, the total number of frames, the number of
+                            finished files and the total number of files.
+                            Files found current in the job manifest of the
+                            processor are skipped and not included.
+
+        Outputs:
+            failed:         List of (file path, error message) tuples.
+        """
+        self.failed = []
+        self.completed = 0
+        self.frames = 0
+        self.results = {}
+        self.timer = StageTimer(True)
+
+        pending = self.processor.pendingFiles(video_files)
+        self.current = len(video_files) - len(pending)
+        video_files = pending
+        total = len(video_files)
+
+        properties = self.probeFiles(video_files)
+        video_files = sorted(video_files, key=lambda f: properties[f][0], reverse=True)
+        self.estimates = { f : max(1, properties[f][1]) for f in video_files }
+        self.reported = { f : 0 for f in video_files }
+
+        def report(finished):
+            if progress is not None:
+                progress(self.framesDone(), self.framesTotal(), finished, total)
+
+        if total == 0:
+            #Every file is current; the batch is complete without any work
+            report(0)
+            return self.failed
+
+        if self.workers == 1:
+            for i in range(0,total):
+                file_path = video_files[i]
+                self.__collect(file_path, lambda: self.__processInline(file_path, lambda frames: self.__advance(file_path, frames, report, i)))
+                report(i+1)
+            return self.failed
+
+        parts = {}
+        finished = 0
+        progress_queue = multiprocessing.Queue()
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker, initargs=(self.cancel_event, progress_queue))
+        try:
+            futures = {}
+            for file_path in video_files:
+                segments = self.__segmentFile(file_path)
+                if len(segments) > 1:
+                    parts[file_path] = [None] * len(segments)
+                    for k in range(0, len(segments)):
+                        futures[executor.submit(_analyzeSegment, self.processor, file_path, segments[k])] = (file_path, k)
+                else:
+                    futures[executor.submit(processInWorker, self.processor, file_path)] = (file_path, None)
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=ParallelBatch.PROGRESS_PERIOD, return_when=FIRST_COMPLETED)
+                self.__drainProgress(progress_queue)
+                for future in done:
+                    file_path, k = futures[future]
+                    if k is not None:
+                        try:
+                            parts[file_path][k] = future.result()
+                        except Exception as e:
+                            parts[file_path][k] = e
+                        if any(part is None for part in parts[file_path]):
+                            continue
+                        self.__collect(file_path, lambda: self.processor.finishSegments(file_path, parts[file_path]))
+                    else:
+                        self.__collect(file_path, future.result)
+                    finished += 1
+                report(finished)
+        except KeyboardInterrupt:
+            #Running workers stop at their next frame, queued files are dropped
+            self.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            progress_queue.close()
+        return self.failed
+
+    def __advance(self, file_path, frames, report, finished):
+        self.reported[file_path] += frames
+        report(finished)
+
+    def __drainProgress(self, progress_queue):
+        while True:
+            try:
+                file_path, frames = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.reported[file_path] += frames
+
+    def __processInline(self, file_path, progress):
+        segments = self.processor.segmentFile(file_path)
+        if len(segments) == 1:
+            return self.processor.processFile(file_path, self.cancel_event, progress)
+        return self.processor.finishSegments(file_path, [self.processor.analyzeSegment(file_path, *segment, cancel=self.cancel_event, progress=progress) for segment in segments])
+
+    def __segmentFile(self, file_path):
+        try:
+            return self.processor.segmentFile(file_path)
+        except Exception:
+            return [(0.0, None, 0.0)]
+
+    def __collect(self, file_path, result):
+        try:
+            result = result()
+        except Exception as e:
+            self.failed.append((file_path, str(e)))
+            return
+        finally:
+            #A finished file counts as fully done, whatever its probed length
+            self.reported[file_path] = self.estimates.get(file_path, 0)
+        self.results[file_path] = result
+        self.frames += result['frames']
+        if 'timings' in result:
+            self.timer.merge(result['timings'])
+        if result['completed']:
+            self.completed += 1
+            try:
+                self.processor.recordCompleted(file_path)
+            except Exception as e:
+                self.failed.append((file_path, "Manifest not updated: %s" % e))
@@ -0,0 +1,272 @@
+"""
+Author: rciszek
+
+Reproducible performance benchmark of the reading, analysis and batch
+processing stages using synthetic videos.
+
+Usage:
+    python Benchmark.py [--output results.json] [--compare previous.json] [--quick]
+
+The synthetic videos are generated deterministically into a work folder:
+a static textured background with a moving blob during known intervals,
+at several resolutions, lengths and codecs. For every video the benchmark
+measures frames per second and peak resident memory of decoding alone,
+analysis alone, cycling a small ring of decoded frames, and end-to-end
+processing of the single file, and finally
+the throughput of the whole batch at several worker counts. Each
+measurement runs in a fresh process so that peak memory is attributable to
+it. The known movement intervals are compared with the detected events to
+report the recall and precision of the detected movement time.
+
+The results are written as JSON. Given a previous result file, the relative
+change of every throughput figure is printed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from VideoReader import VideoReader
+from VideoAnalyzer import VideoAnalyzer
+from BatchProcessor import BatchProcessor, ParallelBatch
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+FPS = 25
+SEED = 20190101
+ANALYSIS_FRAMES = 500
+#Decoded frames cycled through by the analysis measurement
+ANALYSIS_RING = 16
+
+FULL_VIDEOS = [ dict( width = 640, height = 480, seconds = 60, codec = 'MJPG' ),
+                dict( width = 1280, height = 720, seconds = 60, codec = 'MJPG' ),
+                dict( width = 1920, height = 1080, seconds = 30, codec = 'MJPG' ),
+                dict( width = 1280, height = 720, seconds = 60, codec = 'XVID' ),
+                dict( width = 640, height = 480, seconds = 300, codec = 'XVID' ) ]
+QUICK_VIDEOS = [ dict( width = 320, height = 240, seconds = 20, codec = 'MJPG' ),
+                 dict( width = 640, height = 480, seconds = 20, codec = 'XVID' ) ]
+
+DEFAULT_PARAMETERS = dict( movement_threshold = 0.001, history = 100, mixtures = 5, background_ratio = 0.8, complexity_reduction_threshold = 0.05, open_kernel_size = 5 )
+
+def movementIntervals(seconds):
+    """
+    Returns the ground truth movement intervals of a synthetic video. The
+    first quarter is left still so that the background model converges.
+    """
+    return [ [0.25 * seconds, 0.4 * seconds], [0.55 * seconds, 0.6 * seconds], [0.75 * seconds, 0.9 * seconds] ]
+
+def videoName(specification):
+    return 'synthetic_%dx%d_%ds_%s' % (specification['width'], specification['height'], specification['seconds'], specification['codec'])
+
+def generateVideo(path, width, height, seconds, codec, seed=SEED):
+    """
+    Writes a deterministic synthetic video with a blob moving during the
+    intervals returned by movementIntervals.
+    """
+    random = np.random.RandomState(seed)
+    background = cv2.GaussianBlur(random.randint(0, 256, (height, width, 3)).astype(np.uint8), (0, 0), 3)
+    intervals = movementIntervals(seconds)
+    radius = max(4, height // 12)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), FPS, (width, height))
+    try:
+        for i in range(0, int(seconds * FPS)):
+            t = i / float(FPS)
+            frame = background.copy()
+            for start, end in intervals:
+                if start <= t < end:
+                    phase = (t - start) / (end - start)
+                    x = int(radius + phase * (width - 2 * radius))
+                    y = int(height / 2 + np.sin(phase * 4 * np.pi) * height / 4)
+                    cv2.circle(frame, (x, y), radius, (255, 255, 255), -1)
+            noise = random.randint(-3, 4, frame.shape)
+            writer.write(np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    finally:
+        writer.release()
+
+def generateVideos(folder, specifications):
+    """
+    Generates the synthetic videos missing from the folder.
+
+    Outputs:
+        videos:     List of (path, specification) tuples.
+    """
+    os.makedirs(folder, exist_ok=True)
+    videos = []
+    for specification in specifications:
+        path = os.path.join(folder, videoName(specification) + '.avi').replace('\\','/')
+        if not os.path.isfile(path):
+            generateVideo(path, specification['width'], specification['height'], specification['seconds'], specification['codec'])
+        videos.append((path, specification))
+    return videos
+
+def peakMemory():
+    """
+    Returns the peak resident memory of the process and its waited-for
+    children in megabytes, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / scale, 1)
+
+def measureDecode(path):
+    videoReader = VideoReader(path, grayscale=True, buffer_count=2)
+    frames = 0
+    begin_time = time.perf_counter()
+    while videoReader.nextFrame() is not None:
+        frames += 1
+    elapsed = time.perf_counter() - begin_time
+    videoReader.close()
+    return dict( frames = frames, seconds = elapsed )
+
+def measureAnalysis(path):
+    """
+    Measures the analysis of ANALYSIS_FRAMES frames without decoding. Only a
+    ring of ANALYSIS_RING frames is decoded in advance and analyzed
+    cyclically, so the reported peak memory is that of the analysis and a
+    few frames rather than of the frames held by the harness.
+    """
+    videoReader = VideoReader(path, grayscale=True)
+    ring = []
+    while len(ring) < ANALYSIS_RING:
+        frame = videoReader.nextFrame()
+        if frame is None:
+            break
+        ring.append(frame)
+    videoReader.close()
+    frames = ANALYSIS_FRAMES if ring else 0
+    videoAnalyzer = VideoAnalyzer(**DEFAULT_PARAMETERS)
+    begin_time = time.perf_counter()
+    for i in range(0, frames):
+        videoAnalyzer.detectMovement(ring[i % len(ring)])
+    return dict( frames = frames, seconds = time.perf_counter() - begin_time )
+
+def measureFile(path, target):
+    processor = BatchProcessor(DEFAULT_PARAMETERS, target)
+    begin_time = time.perf_counter()
+    result = processor.processFile(path)
+    elapsed = time.perf_counter() - begin_time
+    events = np.loadtxt(os.path.join(target, processor.outputName(path) + '.csv'), delimiter=',', ndmin=2)
+    return dict( frames = result['frames'], seconds = elapsed, events = events.tolist() )
+
+def measureBatch(paths, target, workers):
+    parallelBatch = ParallelBatch(BatchProcessor(DEFAULT_PARAMETERS, target), workers)
+    begin_time = time.perf_counter()
+    failed = parallelBatch.run(paths)
+    return dict( frames = parallelBatch.frames, seconds = time.perf_counter() - begin_time, failed = len(failed) )
+
+def _measure(connection, function, arguments):
+    try:
+        measurement = function(*arguments)
+        measurement['peak_rss_mb'] = peakMemory()
+        connection.send(measurement)
+    except Exception as e:
+        connection.send(dict( error = str(e) ))
+    finally:
+        connection.close()
+
+def measureIsolated(function, *arguments):
+    """
+    Runs a measurement in a fresh process and adds the frame rate to it.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(sender, function, arguments))
+    process.start()
+    sender.close()
+    measurement = receiver.recv()
+    process.join()
+    if 'error' not in measurement:
+        measurement['seconds'] = round(measurement['seconds'], 4)
+        measurement['fps'] = round(measurement['frames'] / measurement['seconds'], 1) if measurement['seconds'] > 0 else 0.0
+    return measurement
+
+def accuracy(events, intervals):
+    """
+    Compares detected events with the ground truth intervals.
+
+    Outputs:
+        accuracy:   Dict with the recall, the fraction of true movement time
+                    covered by events, and the precision, the fraction of
+                    event time overlapping true movement.
+    """
+    overlap = sum(max(0.0, min(e[1], i[1]) - max(e[0], i[0])) for e in events for i in intervals)
+    true_time = sum(i[1] - i[0] for i in intervals)
+    detected_time = sum(e[1] - e[0] for e in events)
+    return dict( recall = round(overlap / true_time, 3) if true_time > 0 else 0.0,
+                 precision = round(overlap / detected_time, 3) if detected_time > 0 else 0.0,
+                 events = len(events) )
+
+def compare(results, previous):
+    """
+    Prints the relative change of the throughput figures against a previous
+    result file.
+    """
+    previous_videos = { v['name'] : v for v in previous.get('videos', []) }
+    for video in results['videos']:
+        if video['name'] not in previous_videos:
+            continue
+        for stage in ('decode', 'analysis', 'file'):
+            current = video[stage].get('fps')
+            earlier = previous_videos[video['name']][stage].get('fps')
+            if current and earlier:
+                print('%-36s %-9s %9.1f fps %+7.1f %%' % (video['name'], stage, current, 100.0 * (current - earlier) / earlier))
+    previous_batches = { b['workers'] : b for b in previous.get('batch', []) }
+    for batch in results['batch']:
+        earlier = previous_batches.get(batch['workers'], {}).get('fps')
+        if batch.get('fps') and earlier:
+            print('%-36s %-9s %9.1f fps %+7.1f %%' % ('batch', '%d workers' % batch['workers'], batch['fps'], 100.0 * (batch['fps'] - earlier) / earlier))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the movement detection using synthetic videos.')
+    parser.add_argument('--output', default='benchmark.json', help='File into which the results are written.')
+    parser.add_argument('--compare', default=None, help='Previous result file to compare against.')
+    parser.add_argument('--work-folder', default=os.path.join(tempfile.gettempdir(), 'movement_benchmark'), help='Folder of the synthetic videos.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts of the batch benchmark.')
+    parser.add_argument('--quick', action='store_true', help='Uses a few small videos only.')
+    arguments = parser.parse_args(argv)
+
+    videos = generateVideos(os.path.join(arguments.work_folder, 'videos'), QUICK_VIDEOS if arguments.quick else FULL_VIDEOS)
+    target = os.path.join(arguments.work_folder, 'events')
+    os.makedirs(target, exist_ok=True)
+
+    results = dict( timestamp = time.strftime('%Y-%m-%dT%H:%M:%S'), platform = platform.platform(), python = platform.python_version(),
+                    opencv = cv2.__version__, cpu_count = os.cpu_count(), parameters = DEFAULT_PARAMETERS, videos = [], batch = [] )
+
+    for path, specification in videos:
+        video = dict( name = videoName(specification), specification = specification )
+        video['decode'] = measureIsolated(measureDecode, path)
+        video['analysis'] = measureIsolated(measureAnalysis, path)
+        video['file'] = measureIsolated(measureFile, path, target)
+        video['accuracy'] = accuracy(video['file'].pop('events', []), movementIntervals(specification['seconds']))
+        results['videos'].append(video)
+        print('%-36s decode %8.1f fps  analysis %8.1f fps  file %8.1f fps  recall %.3f  precision %.3f' % (video['name'],
+              video['decode'].get('fps', 0), video['analysis'].get('fps', 0), video['file'].get('fps', 0), video['accuracy']['recall'], video['accuracy']['precision']), file=sys.stderr)
+
+    paths = [path for path, specification in videos]
+    for workers in arguments.workers:
+        batch = measureIsolated(measureBatch, paths, target, workers)
+        batch['workers'] = workers
+        results['batch'].append(batch)
+        print('batch with %d workers: %.1f fps' % (workers, batch.get('fps', 0)), file=sys.stderr)
+
+    with open(arguments.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
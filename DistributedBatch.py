@@ -0,0 +1,178 @@
+"""
+Author: rciszek
+
+Batch detection of movement events on several machines sharing a
+filesystem, coordinated through a work queue.
+
+Usage:
+    python DistributedBatch.py submit QUEUE SOURCE TARGET [--follow] [analysis parameters]
+    python DistributedBatch.py work QUEUE [--workers N] [--exit-when-empty]
+    python DistributedBatch.py status QUEUE [--follow]
+
+submit enumerates the videos of the source folder into the queue together
+with the processor configured by the options of HeadlessBatch. work runs
+worker processes leasing and analyzing the videos, on as many machines as
+needed, and writes the events into the target folder of each batch. status
+prints the combined progress of every worker as a line of JSON, repeatedly
+with --follow until no video is queued or being analyzed.
+
+The queue, the source and the target have to be visible at the same paths
+on every machine. Relative paths are made absolute on submission. The job
+manifest, the video index and the results store are not supported, as their
+SQLite files use WAL, which does not work on network filesystems; the queue
+itself records the completed videos.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from WorkQueue import QUEUE_BACKENDS, SQLiteWorkQueue, QueueWorker
+from HeadlessBatch import addProcessorArguments, addAnalysisArguments, createProcessor, usageError, EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_INTERRUPTED
+
+#Seconds between the status lines of --follow
+FOLLOW_INTERVAL = 10.0
+#Options naming files or folders, stored as absolute paths
+PATH_OPTIONS = ('source', 'target', 'cache', 'sweep')
+#Options not supported in distributed batches
+LOCAL_OPTIONS = ('resume', 'index', 'results')
+#Options of the queue rather than of the processor
+QUEUE_OPTIONS = ('command', 'queue', 'queue_backend', 'lease_seconds', 'follow')
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Detects movement events on several machines through a shared work queue.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help='Adds the videos of a folder to the queue.')
+    addQueueArguments(submit)
+    submit.add_argument('source', help='Folder searched recursively for .avi files.')
+    submit.add_argument('target', help='Folder into which the event files are written.')
+    submit.add_argument('--follow', action='store_true', help='Prints the progress of the batch until it is finished.')
+    addProcessorArguments(submit)
+    addAnalysisArguments(submit)
+
+    work = commands.add_parser('work', help='Analyzes videos leased from the queue.')
+    addQueueArguments(work)
+    work.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='The number of worker processes on this machine.')
+    work.add_argument('--heartbeat-interval', type=float, default=QueueWorker.HEARTBEAT_INTERVAL, help='Seconds between the heartbeats of a worker.')
+    work.add_argument('--exit-when-empty', action='store_true', help='Stops once no video is queued or being analyzed.')
+
+    status = commands.add_parser('status', help='Prints the combined progress of the workers.')
+    addQueueArguments(status)
+    status.add_argument('--batch', type=int, default=None, help='Reports only the given batch.')
+    status.add_argument('--follow', action='store_true', help='Prints the progress until no video is queued or being analyzed.')
+    return parser.parse_args(argv)
+
+def addQueueArguments(parser):
+    parser.add_argument('queue', help='Path of the work queue, on a filesystem shared by every machine.')
+    parser.add_argument('--queue-backend', choices=list(QUEUE_BACKENDS), default='sqlite', help='Implementation of the work queue.')
+    parser.add_argument('--lease-seconds', type=float, default=SQLiteWorkQueue.LEASE_SECONDS, help='Seconds after which a video whose worker has stopped sending heartbeats is queued again.')
+
+def openQueue(arguments):
+    return QUEUE_BACKENDS[arguments.queue_backend](arguments.queue, arguments.lease_seconds)
+
+def follow(workQueue, batch=None, repeat=True):
+    """
+    Prints the status of the queue, repeatedly until no video is queued or
+    being analyzed if repeat is set. Expired leases are queued again.
+
+    Outputs:
+        status:     The last status.
+    """
+    while True:
+        workQueue.requeueExpired()
+        status = workQueue.status(batch)
+        print(json.dumps(status))
+        sys.stdout.flush()
+        if not repeat or status['queued'] + status['leased'] == 0:
+            return status
+        time.sleep(FOLLOW_INTERVAL)
+
+def processorOptions(arguments):
+    """
+    Returns the processor options of the parsed submit arguments as a dict,
+    with absolute paths.
+    """
+    options = { k : v for k, v in vars(arguments).items() if k not in QUEUE_OPTIONS }
+    for name in PATH_OPTIONS:
+        if options.get(name) is not None:
+            options[name] = os.path.abspath(options[name]).replace('\\','/')
+    return options
+
+def processorFromOptions(options):
+    """
+    Creates the processor of a batch from its stored options.
+    """
+    return createProcessor(argparse.Namespace(**options))
+
+def runWorker(workQueue, heartbeat_interval, exit_when_empty):
+    """
+    Runs a QueueWorker in a worker process until it is stopped or the queue
+    is empty.
+    """
+    queueWorker = QueueWorker(workQueue, processorFromOptions, heartbeat_interval=heartbeat_interval, exit_when_empty=exit_when_empty)
+    signal.signal(signal.SIGTERM, lambda signum, frame: queueWorker.stop())
+    try:
+        queueWorker.run()
+    except KeyboardInterrupt:
+        pass
+
+def submit(arguments):
+    if not os.path.isdir(arguments.source):
+        print("Source folder not found: %s" % arguments.source, file=sys.stderr)
+        return EXIT_FAILED
+    unsupported = ['--' + name for name in LOCAL_OPTIONS if getattr(arguments, name)]
+    if unsupported:
+        print("Not supported in distributed batches: %s" % ', '.join(unsupported), file=sys.stderr)
+        return EXIT_USAGE
+    error = usageError(arguments)
+    if error is not None:
+        print(error, file=sys.stderr)
+        return EXIT_USAGE
+    os.makedirs(arguments.target, exist_ok=True)
+    options = processorOptions(arguments)
+    processor = processorFromOptions(options)
+    video_files = processor.findVideoFiles(options['source'])
+    workQueue = openQueue(arguments)
+    batch = workQueue.submit(options, video_files)
+    print(json.dumps(dict( batch = batch, files = len(video_files) )))
+    sys.stdout.flush()
+    if arguments.follow:
+        status = follow(workQueue, batch)
+        return EXIT_FAILED if status['failed'] > 0 else EXIT_OK
+    return EXIT_OK
+
+def work(arguments):
+    workQueue = openQueue(arguments)
+    processes = [multiprocessing.Process(target=runWorker, args=(workQueue, arguments.heartbeat_interval, arguments.exit_when_empty))
+                 for i in range(0, max(1, arguments.workers))]
+    for process in processes:
+        process.start()
+    def terminate(signum, frame):
+        #Terminated workers return their videos to the queue
+        for process in processes:
+            process.terminate()
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        #The workers receive the interrupt too and return their videos
+        for process in processes:
+            process.join()
+        return EXIT_INTERRUPTED
+    return EXIT_OK
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    if arguments.command == 'submit':
+        return submit(arguments)
+    if arguments.command == 'work':
+        return work(arguments)
+    status = follow(openQueue(arguments), arguments.batch, arguments.follow)
+    return EXIT_FAILED if status['failed'] > 0 else EXIT_OK
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Author: rciszek
+"""
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+class SharedFrameRing:
+    """
+        Ring of frame slots in shared memory. The ring is created by the
+        decoding process and attached to by name in the analyzing processes,
+        into which it is pickled by its name only.
+
+        Arguments:
+            shape:  Shape of the uint8 frames, as given by
+                    VideoReader.frameShape.
+            slots:  The number of frames in the ring.
+            name:   Name of an existing ring to attach to. A new ring is
+                    created if not given.
+    """
+
+    def __init__(self, shape, slots=8, name=None):
+        self.shape = tuple(int(v) for v in shape)
+        self.slots = max(1, int(slots))
+        frame_bytes = int(np.prod(self.shape))
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=max(1, frame_bytes * self.slots))
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self.memory.buf)
+
+    def __getstate__(self):
+        return dict( shape = self.shape, slots = self.slots, name = self.memory.name )
+
+    def __setstate__(self, state):
+        self.__init__(state['shape'], state['slots'], state['name'])
+
+    def frame(self, index):
+        """
+        Returns a view of the slot of the frame with the given index.
+        """
+        return self.frames[index % self.slots]
+
+    def close(self):
+        """
+        Detaches from the ring, and frees it if this process created it.
+        Views of the frames must not be used afterwards.
+        """
+        self.frames = None
+        try:
+            self.memory.close()
+        except BufferError:
+            #A view is still referenced; the mapping is released with it
+            pass
+        if self.owner:
+            self.memory.unlink()
+            self.owner = False
+
+
+class FrameSubscriber:
+    """
+        Receives the frames published by a FrameTransport in an analyzing
+        process.
+    """
+
+    def __init__(self, ring, messages, free_slots):
+        self.ring = ring
+        self.messages = messages
+        self.free_slots = free_slots
+
+    def frames(self):
+        """
+        Yields (index, position, frame) tuples until the end of the video. The
+        frame is a view of the shared slot, valid until the next frame is
+        requested, after which the slot may be overwritten.
+        """
+        held = False
+        while True:
+            if held:
+                self.free_slots.release()
+                held = False
+            message = self.messages.get()
+            if message is None:
+                return
+            index, position = message
+            held = True
+            yield index, position, self.ring.frame(index)
+
+    def close(self):
+        self.ring.close()
+
+
+class FrameTransport:
+    """
+        Distributes decoded frames to several analyzing processes without
+        copying pixel data. Frames are read from the ffmpeg pipe directly into
+        the slots of a SharedFrameRing, and each subscriber receives only the
+        index and the position of every frame through a queue of its own.
+
+        Every subscriber has a semaphore counting the slots it has released.
+        The publisher takes one from each before reusing a slot, so a slot
+        is never overwritten before every subscriber is done with it, and the
+        decoding waits whenever the slowest subscriber is a full ring behind.
+        The time spent waiting is accumulated into wait_seconds.
+
+        Subscribers have to be passed to the analyzing processes when the
+        processes are created.
+
+        Arguments:
+            ring:           The SharedFrameRing of the frames.
+            subscribers:    The number of subscribers.
+    """
+
+    #Seconds between the checks of cancellation while waiting for a slot
+    WAIT_PERIOD = 0.1
+
+    def __init__(self, ring, subscribers):
+        self.ring = ring
+        self.messages = [multiprocessing.Queue() for i in range(0, subscribers)]
+        self.free_slots = [multiprocessing.Semaphore(ring.slots) for i in range(0, subscribers)]
+        self.wait_seconds = 0.0
+
+    def subscriber(self, index):
+        return FrameSubscriber(self.ring, self.messages[index], self.free_slots[index])
+
+    def publish(self, videoReader, cancel=None, progress=None, alive=None):
+        """
+        Reads the frames of the reader into the ring and announces them to
+        the subscribers until the end of the video. The reader must not
+        prefetch.
+
+        Arguments:
+            videoReader:    The VideoReader of the frames.
+            cancel:         Optional event. Publishing is stopped once it is
+                            set.
+            progress:       Optional callable receiving the index of every
+                            published frame.
+            alive:          Optional callable returning False once a
+                            subscriber has failed, so that publishing does not
+                            wait for it forever.
+
+        Outputs:
+            completed:      False if publishing was cancelled.
+        """
+        index = 0
+        try:
+            while True:
+                wait_time = time.perf_counter()
+                for free_slots in self.free_slots:
+                    while not free_slots.acquire(timeout=FrameTransport.WAIT_PERIOD):
+                        if cancel is not None and cancel.is_set():
+                            return False
+                        if alive is not None and not alive():
+                            raise RuntimeError("A frame subscriber has stopped")
+                self.wait_seconds += time.perf_counter() - wait_time
+                if cancel is not None and cancel.is_set():
+                    return False
+                if not videoReader.nextFrameInto(self.ring.frame(index)):
+                    return True
+                position = videoReader.currentPositionInSeconds()
+                for messages in self.messages:
+                    messages.put((index, position))
+                if progress is not None:
+                    progress(index)
+                index += 1
+        finally:
+            for messages in self.messages:
+                messages.put(None)
+
+    def close(self):
+        for messages in self.messages:
+            messages.close()
+        self.ring.close()
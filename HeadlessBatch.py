@@ -0,0 +1,197 @@
+"""
+Author: rciszek
+
+Command-line batch detection of movement events. Only the analysis modules
+are imported, so the batch can be run on machines without a display server
+or PyQt.
+
+Usage:
+    python HeadlessBatch.py SOURCE TARGET [--workers N] [analysis parameters]
+    python HeadlessBatch.py SOURCE TARGET --watch [--settle-seconds S] [analysis parameters]
+
+A single line of JSON with the throughput statistics of the batch is printed
+to stdout. The exit code is 0 when every file was processed, 1 when some
+files failed, 2 when the options cannot be combined and 130 when the batch
+was interrupted.
+
+With --watch the source folder is watched until the process is interrupted or
+terminated, and a line of JSON is printed for every analyzed file.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from BatchProcessor import BatchProcessor, ParallelBatch
+from VideoAnalyzer import BACKENDS
+from ParameterSweep import ParameterSweep, expandGrid
+from WatchFolder import WatchFolder
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+TIMING_FILE = 'timing.json'
+#Options of the batch processor which a parameter sweep does not support
+SWEEP_UNSUPPORTED = ('cache', 'segment_length', 'segment_warmup', 'two_pass', 'series_format', 'resume', 'timing', 'watch')
+#Options which apply to a parameter sweep only
+SWEEP_ONLY = ('group_processes',)
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Detects movement events from the video files of a folder.')
+    parser.add_argument('source', help='Folder searched recursively for .avi files.')
+    parser.add_argument('target', help='Folder into which the event files are written.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='The number of worker processes.')
+    addProcessorArguments(parser)
+    parser.add_argument('--watch', action='store_true', help='Keeps watching the source folder and analyzes new files once they are no longer written. Implies --resume.')
+    parser.add_argument('--settle-seconds', type=float, default=30.0, help='Seconds a watched file must stay unchanged before it is analyzed.')
+    parser.add_argument('--poll-interval', type=float, default=10.0, help='Seconds between rescans of the watched folder when filesystem notifications are not available.')
+    addAnalysisArguments(parser)
+    return parser.parse_args(argv)
+
+def addProcessorArguments(parser):
+    """
+    Adds the options of the batch processor to the argument parser.
+    """
+    parser.add_argument('--analysis-width', type=int, default=None, help='Width into which the frames are downscaled before the analysis.')
+    parser.add_argument('--prefetch', type=int, default=4, help='The number of frames decoded ahead of the analysis.')
+    parser.add_argument('--segment-length', type=float, default=None, help='Splits long videos into segments of this many seconds analyzed in parallel.')
+    parser.add_argument('--segment-warmup', type=float, default=None, help='Seconds analyzed before each segment to warm up the background model.')
+    parser.add_argument('--cache', default=None, help='Folder of the per-frame ratio cache. Re-running with only a new threshold reuses the cached ratios.')
+    parser.add_argument('--sweep', default=None, help='JSON file of a parameter grid. Every configuration is analyzed in a single pass and written into its own folder.')
+    parser.add_argument('--group-processes', action='store_true', help='Analyzes every background model of a sweep in its own process, fed from frames decoded once into shared memory.')
+    parser.add_argument('--two-pass', action='store_true', help='Analyzes at full rate only the windows where a coarse pass finds movement.')
+    parser.add_argument('--coarse-width', type=int, default=160, help='Frame width of the coarse pass.')
+    parser.add_argument('--coarse-step', type=int, default=5, help='Frame stride of the coarse pass.')
+    parser.add_argument('--coarse-threshold', type=float, default=None, help='Movement threshold of the coarse pass. Defaults to half of the movement threshold.')
+    parser.add_argument('--guard-band', type=float, default=2.0, help='Seconds analyzed at full rate around each coarse detection.')
+    parser.add_argument('--min-duration', type=float, default=0.0, help='Drops events shorter than this many seconds.')
+    parser.add_argument('--merge-gap', type=float, default=0.0, help='Merges events separated by at most this many seconds.')
+    parser.add_argument('--series-format', choices=BatchProcessor.SERIES_FORMATS, default=None, help='Also writes the per-frame series of every video in this format.')
+    parser.add_argument('--index', default=None, help='SQLite file of the video index. Only new or modified videos are probed on repeated runs.')
+    parser.add_argument('--results', default=None, help='SQLite file into which the events of every video are written instead of an event file per video.')
+    parser.add_argument('--resume', action='store_true', help='Skips videos whose events are current according to the job manifest of the target folder and resumes interrupted videos from their checkpoints.')
+    parser.add_argument('--timing', action='store_true', help='Records the time spent in each processing stage and writes per-file and per-batch timing reports.')
+
+def addAnalysisArguments(parser):
+    """
+    Adds the VideoAnalyzer parameters to the argument parser.
+    """
+    parser.add_argument('--movement-threshold', type=float, default=0.001, help='Ratio of changed pixels regarded as movement.')
+    parser.add_argument('--open-kernel-size', type=int, default=5, help='Size of the opening kernel.')
+    parser.add_argument('--history', type=int, default=100, help='The number of past frames included in the analysis.')
+    parser.add_argument('--mixtures', type=int, default=5, help='The number of mixtures used for foreground segmentation.')
+    parser.add_argument('--background-ratio', type=float, default=0.8, help='Background ratio for foreground segmentation.')
+    parser.add_argument('--complexity-reduction-threshold', type=float, default=0.05, help='Complexity reduction threshold for foreground segmentation.')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='mog2', help='Background model used for foreground segmentation.')
+
+def analysisParameters(arguments):
+    """
+    Returns the VideoAnalyzer parameters contained in the parsed arguments.
+    """
+    return dict( movement_threshold = arguments.movement_threshold, history = arguments.history, mixtures = arguments.mixtures, background_ratio = arguments.background_ratio, complexity_reduction_threshold = arguments.complexity_reduction_threshold, open_kernel_size = arguments.open_kernel_size, backend = arguments.backend )
+
+def optionFlags(arguments, names):
+    return ['--' + name.replace('_', '-') for name in names if getattr(arguments, name, None)]
+
+def usageError(arguments):
+    """
+    Returns the error message of options which the processor configured by
+    the arguments does not support, or None if every option is supported.
+    """
+    if arguments.sweep is None:
+        unsupported = optionFlags(arguments, SWEEP_ONLY)
+        return "Requires --sweep: %s" % ', '.join(unsupported) if unsupported else None
+    unsupported = optionFlags(arguments, SWEEP_UNSUPPORTED)
+    return "Not supported with --sweep: %s" % ', '.join(unsupported) if unsupported else None
+
+def createProcessor(arguments, resume=False):
+    """
+    Creates the BatchProcessor, or the ParameterSweep if a grid is given,
+    configured by the parsed arguments. The target folder must exist.
+    """
+    if arguments.sweep is not None:
+        with open(arguments.sweep) as f:
+            configurations = expandGrid(json.load(f), analysisParameters(arguments))
+        return ParameterSweep(configurations, arguments.target, arguments.analysis_width, arguments.prefetch, arguments.min_duration, arguments.merge_gap, arguments.index, arguments.group_processes, arguments.results)
+    return BatchProcessor(analysisParameters(arguments), arguments.target, arguments.analysis_width, arguments.prefetch, arguments.segment_length, arguments.segment_warmup, arguments.cache,
+                          arguments.two_pass, arguments.coarse_width, arguments.coarse_step, arguments.coarse_threshold, arguments.guard_band,
+                          arguments.min_duration, arguments.merge_gap, arguments.series_format, arguments.timing, arguments.index, arguments.resume or resume, arguments.results)
+
+def reportFile(file_path, result):
+    """
+    Prints a line of JSON on a file analyzed by a watch.
+    """
+    if isinstance(result, Exception):
+        print(json.dumps(dict( file = file_path, completed = False, error = str(result) )))
+    else:
+        print(json.dumps(dict( file = file_path, completed = result['completed'], frames = result['frames'], seconds = round(result['seconds'], 3) )))
+    sys.stdout.flush()
+
+def watch(processor, arguments):
+    """
+    Watches the source folder until interrupted or terminated.
+    """
+    watchFolder = WatchFolder(processor, arguments.source, arguments.workers, arguments.settle_seconds, arguments.poll_interval, reportFile)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watchFolder.cancel())
+    try:
+        watchFolder.run()
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    return EXIT_OK
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+
+    if not os.path.isdir(arguments.source):
+        print("Source folder not found: %s" % arguments.source, file=sys.stderr)
+        return EXIT_FAILED
+    error = usageError(arguments)
+    if error is not None:
+        print(error, file=sys.stderr)
+        return EXIT_USAGE
+    os.makedirs(arguments.target, exist_ok=True)
+
+    processor = createProcessor(arguments, arguments.watch)
+
+    if arguments.watch:
+        return watch(processor, arguments)
+
+    parallelBatch = ParallelBatch(processor, arguments.workers)
+
+    begin_time = time.perf_counter()
+    video_files = processor.findVideoFiles(arguments.source)
+    exit_code = EXIT_OK
+    try:
+        failed = parallelBatch.run(video_files)
+    except KeyboardInterrupt:
+        parallelBatch.cancel()
+        failed = parallelBatch.failed
+        exit_code = EXIT_INTERRUPTED
+    elapsed = time.perf_counter() - begin_time
+
+    for file_path, error in failed:
+        print("Failed: %s: %s" % (file_path, error), file=sys.stderr)
+    if failed and exit_code == EXIT_OK:
+        exit_code = EXIT_FAILED
+    if arguments.sweep is not None:
+        processor.writeReport(parallelBatch.results)
+    if arguments.timing:
+        parallelBatch.timer.write(os.path.join(arguments.target, TIMING_FILE))
+        print("Timing: %s" % parallelBatch.timer.summary(), file=sys.stderr)
+
+    statistics = dict( files = len(video_files), current = parallelBatch.current, completed = parallelBatch.completed, failed = len(failed),
+                       skipped = len(video_files) - parallelBatch.current - parallelBatch.completed - len(failed),
+                       workers = parallelBatch.workers, configurations = len(getattr(processor, 'configurations', [processor.parameters])), frames = parallelBatch.frames, seconds = round(elapsed, 3),
+                       files_per_second = round(len(video_files) / elapsed, 3) if elapsed > 0 else 0.0,
+                       frames_per_second = round(parallelBatch.frames / elapsed, 1) if elapsed > 0 else 0.0 )
+    if arguments.two_pass:
+        skipped = [r['skipped'] for r in parallelBatch.results.values() if 'skipped' in r]
+        statistics['skipped_fraction'] = round(sum(skipped) / len(skipped), 3) if skipped else 0.0
+    print(json.dumps(statistics))
+    sys.stdout.flush()
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Author: rciszek
+"""
+import json
+import math
+import time
+
+class StageTimer:
+    """
+        Low-overhead timing of the stages of the frame processing loop. For
+        every stage the cumulative time, the number of calls and a histogram
+        of call durations with logarithmic bins are kept, from which the
+        percentiles are estimated. Timers are plain objects, so they can be
+        returned from worker processes and merged.
+
+        Usage:
+            start = timer.now()
+            ...
+            start = timer.record('stage', start)
+
+        While the timer is disabled now returns 0 and record returns
+        immediately, so instrumented code runs at practically full speed.
+        The timer can be enabled and disabled at any time; a stage started
+        while the timer was disabled is not recorded.
+
+        Arguments:
+            enabled:    Whether the timer records.
+    """
+
+    #Histogram bins per decade and the shortest duration binned, in seconds
+    BINS_PER_DECADE = 20
+    MIN_EXPONENT = -7
+    BIN_COUNT = 9 * BINS_PER_DECADE
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.seconds = {}
+        self.calls = {}
+        self.histograms = {}
+        self.stages = []
+
+    def now(self):
+        """
+        Returns the current time if the timer is enabled, otherwise 0.
+        """
+        if self.enabled:
+            return time.perf_counter()
+        return 0
+
+    def record(self, stage, start):
+        """
+        Records the time elapsed since start for the stage.
+
+        Outputs:
+            now:    The current time, to be used as the start of the next stage.
+        """
+        if not self.enabled:
+            return 0
+        now = time.perf_counter()
+        if start == 0:
+            #The timer was enabled after the stage started
+            return now
+        duration = now - start
+        if stage not in self.seconds:
+            self.stages.append(stage)
+            self.seconds[stage] = 0.0
+            self.calls[stage] = 0
+            self.histograms[stage] = [0] * StageTimer.BIN_COUNT
+        self.seconds[stage] += duration
+        self.calls[stage] += 1
+        self.histograms[stage][self.binIndex(duration)] += 1
+        return now
+
+    def binIndex(self, duration):
+        if duration <= 0:
+            return 0
+        index = int((math.log10(duration) - StageTimer.MIN_EXPONENT) * StageTimer.BINS_PER_DECADE)
+        return min(max(index, 0), StageTimer.BIN_COUNT - 1)
+
+    def percentile(self, stage, q):
+        """
+        Estimates the q:th percentile of the call duration of the stage in
+        seconds.
+        """
+        histogram = self.histograms[stage]
+        limit = q / 100.0 * self.calls[stage]
+        cumulative = 0
+        for index in range(0, len(histogram)):
+            cumulative += histogram[index]
+            if cumulative >= limit and cumulative > 0:
+                return 10 ** (StageTimer.MIN_EXPONENT + (index + 0.5) / StageTimer.BINS_PER_DECADE)
+        return 0.0
+
+    def merge(self, other):
+        """
+        Adds the recordings of another timer into this one.
+        """
+        for stage in other.stages:
+            if stage not in self.seconds:
+                self.stages.append(stage)
+                self.seconds[stage] = 0.0
+                self.calls[stage] = 0
+                self.histograms[stage] = [0] * StageTimer.BIN_COUNT
+            self.seconds[stage] += other.seconds[stage]
+            self.calls[stage] += other.calls[stage]
+            self.histograms[stage] = [a + b for a, b in zip(self.histograms[stage], other.histograms[stage])]
+
+    def totalSeconds(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        """
+        Returns the recordings as a dict suitable for JSON.
+        """
+        total = self.totalSeconds()
+        stages = {}
+        for stage in self.stages:
+            calls = self.calls[stage]
+            stages[stage] = dict( seconds = round(self.seconds[stage], 4), calls = calls,
+                                  share = round(self.seconds[stage] / total, 4) if total > 0 else 0.0,
+                                  mean_ms = round(1000.0 * self.seconds[stage] / calls, 4) if calls > 0 else 0.0,
+                                  p50_ms = round(1000.0 * self.percentile(stage, 50), 4),
+                                  p90_ms = round(1000.0 * self.percentile(stage, 90), 4),
+                                  p99_ms = round(1000.0 * self.percentile(stage, 99), 4) )
+        return dict( total_seconds = round(total, 4), stages = stages )
+
+    def summary(self):
+        """
+        Returns a single line summary of the share of each stage.
+        """
+        total = self.totalSeconds()
+        if total <= 0:
+            return 'no timings recorded'
+        return ' | '.join('%s %.2fs (%.0f%%)' % (stage, self.seconds[stage], 100.0 * self.seconds[stage] / total) for stage in self.stages)
+
+    def write(self, path):
+        """
+        Writes the report into the given JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,131 @@
+"""
+Author: rciszek
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from RatioCache import RatioCache
+
+class JobManifest:
+    """
+        Records the completed videos of a batch in the target folder, so that
+        an interrupted or repeated batch processes only the videos whose
+        events are missing or out of date, and keeps the checkpoints of
+        videos interrupted mid-way.
+
+        A video is current if the manifest records it as completed with the
+        same file size, modification time and settings, and its event file
+        still exists. Checkpoints are the partial per-frame series of a video
+        and are keyed like the ratio cache, so a checkpoint of a modified
+        video or of other settings is never resumed.
+
+        Every thread opens a connection of its own, and the manifest holds
+        only its paths when pickled, so it can be passed to worker processes.
+
+        Arguments:
+            target:     Folder of the batch output.
+    """
+
+    MANIFEST_FILE = '.manifest.sqlite'
+    CHECKPOINT_FOLDER = '.checkpoints'
+
+    def __init__(self, target):
+        self.path = os.path.join(target, JobManifest.MANIFEST_FILE)
+        self.checkpoints = RatioCache(os.path.join(target, JobManifest.CHECKPOINT_FOLDER))
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self):
+        """
+        Returns the connection of the manifest for the calling thread,
+        creating the database if needed.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                      path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, settings TEXT, completed REAL)''')
+            connection.commit()
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    @staticmethod
+    def key(file_path):
+        return os.path.abspath(file_path).replace('\\','/')
+
+    @staticmethod
+    def settingsKey(settings):
+        """
+        Returns the hash of a dict of settings.
+        """
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def pending(self, jobs):
+        """
+        Returns the videos which are not current.
+
+        Arguments:
+            jobs:   List of (file path, settings, output path) tuples, where
+                    settings is a dict of every setting affecting the output.
+                    The output path is None if the output is not a file of
+                    its own.
+
+        Outputs:
+            pending:    List of the file paths of the videos to process, in
+                        the order of the jobs.
+        """
+        entries = { row[0] : row[1:] for row in self.connect().execute('SELECT path, size, mtime, settings FROM jobs') }
+        pending = []
+        for file_path, settings, output_path in jobs:
+            entry = entries.get(JobManifest.key(file_path))
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                pending.append(file_path)
+                continue
+            if entry != (stat.st_size, stat.st_mtime_ns, JobManifest.settingsKey(settings)) or (output_path is not None and not os.path.isfile(output_path)):
+                pending.append(file_path)
+        return pending
+
+    def complete(self, file_path, settings):
+        """
+        Records the video as completed with the given settings.
+        """
+        stat = os.stat(file_path)
+        connection = self.connect()
+        connection.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?)',
+                           (JobManifest.key(file_path), stat.st_size, stat.st_mtime_ns, JobManifest.settingsKey(settings), time.time()))
+        connection.commit()
+
+    def loadCheckpoint(self, key):
+        """
+        Returns the checkpointed (times, ratios) series of the key or None.
+        """
+        return self.checkpoints.load(key)
+
+    def storeCheckpoint(self, key, times, ratios):
+        self.checkpoints.store(key, times, ratios)
+
+    def discardCheckpoint(self, key):
+        try:
+            os.remove(self.checkpoints.path(key))
+        except OSError:
+            pass
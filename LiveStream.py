@@ -0,0 +1,357 @@
+"""
+Author: rciszek
+
+Real-time movement detection from a live source: any input ffmpeg can read,
+such as an RTSP or HTTP URL, a capture device or a named pipe.
+
+Usage:
+    python LiveStream.py URL [--policy drop|skip|degrade] [--max-latency SECONDS] [--output events.csv] [analysis parameters]
+
+Every movement event is printed as a line of JSON as soon as it ends and,
+if an output file is given, appended to it as a row of the event CSV files.
+The stream is analyzed until it ends or the process is interrupted.
+"""
+import argparse
+import collections
+import json
+import math
+import signal
+import sys
+import threading
+import time
+import numpy as np
+from VideoReader import VideoReader
+from VideoAnalyzer import VideoAnalyzer, MovementTracker
+from HeadlessBatch import addAnalysisArguments, analysisParameters, EXIT_OK, EXIT_FAILED, EXIT_INTERRUPTED
+
+class LiveReader(VideoReader):
+    """
+        Reads a live source in real time. A receiver thread drains the ffmpeg
+        pipe as fast as the source delivers frames into a queue holding at
+        most max_latency seconds of frames, so a slow consumer never stalls
+        the source and the frames it gets are never older than the latency
+        bound. When the queue is full the oldest frame is dropped.
+
+        How the reader keeps up when the analysis is slower than the source
+        is chosen by the policy:
+            drop:       Frames are analyzed in order and the oldest ones are
+                        dropped at the latency bound.
+            skip:       While frames are queued, skip - 1 frames are dropped
+                        for every frame returned.
+            degrade:    When the queue is more than half full, ffmpeg is
+                        restarted decoding frames of half the width, at most
+                        MAX_LEVEL times. Once the latency has stayed below
+                        half of max_latency for RECOVERY_SECONDS, the width
+                        is doubled again. The source is reopened on every
+                        change, so the policy needs a source which can be
+                        reopened, such as a stream URL.
+
+        Positions are counted from the frames received, including dropped
+        ones and those sent while ffmpeg was restarted, so event times follow
+        the stream. start_time is the wall clock time at which the stream was
+        opened.
+
+        Arguments:
+            url:            The source given to ffmpeg.
+            grayscale:      If True, ffmpeg decodes single channel frames.
+            target_width:   Optional width into which the frames are downscaled
+                            by ffmpeg.
+            policy:         One of POLICIES.
+            max_latency:    Seconds of frames kept in the queue.
+            skip:           Frame stride of the skip policy.
+            crop:           Optional (x, y, width, height) rectangle into which
+                            ffmpeg crops the frames.
+            input_options:  Optional list of extra ffmpeg input options, such
+                            as ['-rtsp_transport', 'tcp'].
+            properties:     Optional (width, height, fps, duration, frames)
+                            tuple. Sources which cannot be probed without
+                            consuming them, such as named pipes, need it.
+    """
+
+    POLICIES = ('drop', 'skip', 'degrade')
+    MAX_LEVEL = 3
+    #Seconds of low latency after which the degrade policy restores a level
+    RECOVERY_SECONDS = 30.0
+
+    def __init__(self, url, grayscale=True, target_width=None, policy='drop', max_latency=1.0, skip=2, crop=None, input_options=None, properties=None):
+        if policy not in LiveReader.POLICIES:
+            raise ValueError("Unsupported policy: %s" % policy)
+        self.policy = policy
+        self.max_latency = float(max_latency)
+        self.skip = max(2, int(skip))
+        self.input_options = list(input_options or [])
+        self.level = 0
+        self.targetLevel = 0
+        self.calmSince = None
+        self.received = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.streamEnded = False
+        if properties is None:
+            properties = self.getVideoProperties(url)
+        width, height, fps = properties[0:3]
+        if width <= 0 or height <= 0:
+            raise ValueError("Cannot read stream: %s" % url)
+        if fps <= 0:
+            fps = VideoReader.DEFAULT_FPS
+        self.start_time = time.time()
+        self.pipeLock = threading.Lock()
+        super().__init__(url, grayscale, target_width, 0, 1, 0, crop, 1, (width, height, fps, 0.0, 0))
+        self.base_width = self.frame_width
+
+    def inputArguments(self, file_name, position):
+        return ['-fflags', 'nobuffer', '-flags', 'low_delay'] + self.input_options + ['-i', file_name]
+
+    def startPrefetch(self):
+        """
+        Starts the thread receiving frames into the queue.
+        """
+        self.frameQueue = collections.deque(maxlen=max(1, int(math.ceil(self.max_latency * self.fps))))
+        self.frameAvailable = threading.Condition()
+        self.prefetchStop = threading.Event()
+        self.prefetchThread = threading.Thread(target=self.receiveFrames, args=(self.frameQueue, self.prefetchStop), daemon=True)
+        self.prefetchThread.start()
+
+    def reopen(self, level):
+        """
+        Restarts ffmpeg decoding frames of the width of the given level.
+        Called only by the receiver thread, which alone reads the pipe. The
+        pipe is replaced under pipeLock, so a pipe is never started once
+        close has begun.
+
+        Outputs:
+            reopened:   False if the reader is being closed.
+        """
+        with self.pipeLock:
+            if self.prefetchStop.is_set():
+                return False
+            pipe = self.pipe
+            pipe.stdout.close()
+            pipe.kill()
+            self.frame_width, self.frame_height = self.outputSize(max(2, self.base_width // 2 ** level))
+            self.pipe = VideoReader.popen(self.pipeCommand(self.file_path, 0))
+        return True
+
+    def receiveFrames(self, frameQueue, stop):
+        """
+        Reads frames into the queue until the stream ends or until stopped.
+        """
+        index = 0
+        level = 0
+        restart_time = None
+        while not stop.is_set():
+            if level != self.targetLevel:
+                level = self.targetLevel
+                restart_time = time.perf_counter()
+                if not self.reopen(level):
+                    return
+            try:
+                frame = self.readFrame()
+            except (ValueError, OSError):
+                frame = None
+            with self.frameAvailable:
+                if frame is None:
+                    self.streamEnded = True
+                    self.frameAvailable.notify_all()
+                    return
+                if restart_time is not None:
+                    #Frames sent by the source during the restart are counted as dropped
+                    missed = int(round((time.perf_counter() - restart_time) * self.fps))
+                    index += missed
+                    self.dropped += missed
+                    restart_time = None
+                if len(frameQueue) == frameQueue.maxlen:
+                    self.dropped += 1
+                frameQueue.append((index, time.perf_counter(), frame, level))
+                self.received += 1
+                self.frameAvailable.notify_all()
+            index += 1
+
+    def stopPrefetch(self):
+        if self.prefetchThread is None:
+            return
+        self.prefetchStop.set()
+        with self.frameAvailable:
+            self.frameAvailable.notify_all()
+        self.prefetchThread.join()
+        self.prefetchThread = None
+
+    def close(self):
+        """
+        Stops the receiver thread and ffmpeg. The receiver is stopped and the
+        pipe killed under pipeLock, so the pipe killed is the current one and
+        a restart of the degrade policy cannot replace it afterwards.
+        """
+        if self.prefetchThread is not None:
+            with self.pipeLock:
+                self.prefetchStop.set()
+                self.pipe.kill()
+            self.stopPrefetch()
+        self.pipe.stdout.close()
+        self.pipe.kill()
+
+    def nextFrame(self):
+        """
+        Returns the next frame according to the policy, waiting for the
+        source if no frame is queued. Returns None once the stream has ended.
+        """
+        if self.endOfStream:
+            return None
+        with self.frameAvailable:
+            while not self.frameQueue and not self.streamEnded and not self.prefetchStop.is_set():
+                self.frameAvailable.wait(0.1)
+            if not self.frameQueue:
+                self.endOfStream = True
+                return None
+
+            now = time.perf_counter()
+            while len(self.frameQueue) > 1 and now - self.frameQueue[0][1] > self.max_latency:
+                self.frameQueue.popleft()
+                self.dropped += 1
+            if self.policy == 'skip':
+                for i in range(0, min(self.skip - 1, len(self.frameQueue) - 1)):
+                    self.frameQueue.popleft()
+                    self.dropped += 1
+            elif self.policy == 'degrade':
+                self.adjustLevel(now)
+            index, arrival, frame, self.level = self.frameQueue.popleft()
+
+        self.currentPositionInFrames = index + 1
+        self.latency = now - arrival
+        return frame
+
+    def adjustLevel(self, now):
+        """
+        Raises the degradation level when the queue is more than half full,
+        and lowers it once the latency has stayed low for RECOVERY_SECONDS.
+        The level is not changed again until the frames of the previous
+        change are returned.
+        """
+        if self.targetLevel != self.level:
+            return
+        if len(self.frameQueue) > self.frameQueue.maxlen // 2:
+            self.targetLevel = min(LiveReader.MAX_LEVEL, self.level + 1)
+            self.calmSince = None
+        elif self.level > 0 and now - self.frameQueue[0][1] < self.max_latency / 2:
+            if self.calmSince is None:
+                self.calmSince = now
+            elif now - self.calmSince >= LiveReader.RECOVERY_SECONDS:
+                self.targetLevel = self.level - 1
+                self.calmSince = None
+        else:
+            self.calmSince = None
+
+    def statistics(self):
+        """
+        Returns the counts of received and dropped frames, the latency of the
+        latest frame and the degradation level as a dict.
+        """
+        return dict( received = self.received, dropped = self.dropped, latency = round(self.latency, 3), level = self.level )
+
+
+class LiveMonitor:
+    """
+        Detects movement from a LiveReader in real time. Events are passed to
+        the callback as soon as they end. When the reader degrades or
+        restores the resolution, the background model is recreated for the
+        new frame size with a proportionally scaled opening kernel.
+
+        Arguments:
+            liveReader:     The LiveReader of the source.
+            parameters:     VideoAnalyzer parameters.
+            callback:       Optional callable receiving every [start, end]
+                            event, in seconds from the start of the stream.
+    """
+
+    def __init__(self, liveReader, parameters, callback=None):
+        self.liveReader = liveReader
+        self.parameters = dict(parameters)
+        self.callback = callback
+        self.stopEvent = threading.Event()
+        self.movementTracker = MovementTracker()
+        self.frames = 0
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def createAnalyzer(self, level):
+        parameters = dict(self.parameters)
+        parameters['open_kernel_size'] = max(1, int(round(float(parameters.get('open_kernel_size', 3)) / 2 ** level)))
+        videoAnalyzer = VideoAnalyzer(**parameters)
+        return videoAnalyzer
+
+    def run(self):
+        """
+        Analyzes the stream until it ends or the monitor is stopped.
+
+        Outputs:
+            events:     Array of the [start, end] events.
+        """
+        level = self.liveReader.level
+        videoAnalyzer = self.createAnalyzer(level)
+        while not self.stopEvent.is_set():
+            frame = self.liveReader.nextFrame()
+            if frame is None:
+                break
+            if self.liveReader.level != level:
+                level = self.liveReader.level
+                videoAnalyzer = self.createAnalyzer(level)
+            foreground_mask, movement = videoAnalyzer.detectMovement(frame)
+            self.frames += 1
+            event = self.movementTracker.update(movement, self.liveReader.currentPositionInSeconds())
+            if event is not None and self.callback is not None:
+                self.callback(event)
+        return self.movementTracker.getEvents()
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Detects movement events from a live source in real time.')
+    parser.add_argument('url', help='Source readable by ffmpeg, such as an RTSP URL, a device or a named pipe.')
+    parser.add_argument('--output', default=None, help='CSV file into which the events are appended as they end.')
+    parser.add_argument('--policy', choices=LiveReader.POLICIES, default='drop', help='How to keep up when the analysis is slower than the source.')
+    parser.add_argument('--max-latency', type=float, default=1.0, help='Frames older than this many seconds are dropped.')
+    parser.add_argument('--skip', type=int, default=2, help='Frame stride of the skip policy.')
+    parser.add_argument('--analysis-width', type=int, default=None, help='Width into which the frames are downscaled before the analysis.')
+    parser.add_argument('--size', default=None, help='WIDTHxHEIGHT of the source. Given together with --fps, the source is not probed.')
+    parser.add_argument('--fps', type=float, default=None, help='Frame rate of the source.')
+    parser.add_argument('--input-option', action='append', default=[], help='Extra ffmpeg input option, repeated for each argument.')
+    addAnalysisArguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    properties = None
+    if arguments.size is not None and arguments.fps is not None:
+        width, height = [int(v) for v in arguments.size.lower().split('x')]
+        properties = (width, height, arguments.fps, 0.0, 0)
+
+    try:
+        liveReader = LiveReader(arguments.url, True, arguments.analysis_width, arguments.policy, arguments.max_latency, arguments.skip,
+                                input_options=arguments.input_option, properties=properties)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_FAILED
+
+    def report(event):
+        print(json.dumps(dict( start = round(event[0], 2), end = round(event[1], 2),
+                               wall_start = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(liveReader.start_time + event[0])),
+                               **liveReader.statistics() )))
+        sys.stdout.flush()
+        if arguments.output is not None:
+            with open(arguments.output, 'a') as f:
+                np.savetxt(f, np.array([event]), delimiter=",", fmt='%.2f')
+
+    liveMonitor = LiveMonitor(liveReader, analysisParameters(arguments), report)
+    signal.signal(signal.SIGTERM, lambda signum, frame: liveMonitor.stop())
+    exit_code = EXIT_OK
+    try:
+        liveMonitor.run()
+    except KeyboardInterrupt:
+        exit_code = EXIT_INTERRUPTED
+    finally:
+        liveReader.close()
+    print("Frames analyzed: %d, %s" % (liveMonitor.frames, json.dumps(liveReader.statistics())), file=sys.stderr)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,648 +1,914 @@
-from PyQt5.QtWidgets import QMainWindow, QAction, qApp, QApplication,QFileDialog,QHBoxLayout,QLabel,QWidget,QVBoxLayout,QSlider,QGridLayout,QLineEdit,QGroupBox,QFormLayout, QSpacerItem,QSizePolicy,QPushButton,QDialog,QDialogButtonBox,QProgressBar 
-from PyQt5.QtGui import QIcon,QPixmap,QImage,QFont,QDoubleValidator,QIntValidator 
-from PyQt5 import QtGui 
-from PyQt5 import QtCore
-from PyQt5.QtCore import QThread, pyqtSignal, Qt,QLocale
-from VideoReader import VideoReader
-from VideoAnalyzer import VideoAnalyzer, MovementTracker
-import cv2
-import numpy as np
-import logging,re,glob,time,sys,locale
-import logging.config
-from deployment import resource_path,loadStyleSheet
-from time import sleep
-
-
-class MotionDetector(QMainWindow):
-    
-    def __init__(self):
-        super().__init__()
-        
-        self.initUI()
-        
-        
-    def initUI(self):
-        
-        self.setWindowTitle('MovementDetector')
-      
-        openFileAct = QAction('Open', self)        
-        openFileAct.setShortcut('Ctrl+O')
-        openFileAct.setStatusTip('Open a single file')
-        openFileAct.triggered.connect(self.showFileDialog)     
-        
-        batchProcessAct = QAction('Batch process', self)        
-        batchProcessAct.setShortcut('Ctrl+B')
-        batchProcessAct.setStatusTip('Process multiple files')
-        batchProcessAct.triggered.connect(self.showBatchDialog)     
-        
-        exitAct = QAction('&Exit', self)        
-        exitAct.setShortcut('Ctrl+Q')
-        exitAct.setStatusTip('Exit application')
-        exitAct.triggered.connect(qApp.quit)
-        
-        aboutAct = QAction('&About', self)        
-        aboutAct.setStatusTip('About MovementDetector')
-        aboutAct.triggered.connect(self.showAboutDialog)        
-
-        self.statusBar()
-
-        menubar = self.menuBar()
-        fileMenu = menubar.addMenu('&File')
-        fileMenu.addAction(openFileAct)      
-        fileMenu.addAction(batchProcessAct)           
-        fileMenu.addAction(exitAct)     
-        
-        aboutMenu = menubar.addMenu('&Help')
-        aboutMenu.addAction(aboutAct)           
-        self.showVideoPlaybackView()
- 
-
-  
-    def showVideoPlaybackView(self, maximize=True):
-        self.videoWidget = VideoWidget()
-        self.videoWidget.playbackStarted.connect(lambda : self.showMaximized() )
-
-        self.setCentralWidget(self.videoWidget)
-        if maximize:
-            self.showMaximized()     
-      
-    def showFileDialog(self):
-
-        fname = QFileDialog.getOpenFileName(self, 'Open file', '/home')
-
-        if fname[0]:
-            self.videoWidget.displayVideo(fname[0])   
-
-            
-    def showAboutDialog(self):
-        self.videoWidget.videoThread.pause()
-        dialog = AboutDialog()
-        dialog.exec_()    
-            
-    def showBatchDialog(self):
-        dialog = BatchDialog()
-        return_code = dialog.exec_()
-        if return_code == QDialog.Accepted:
-            parameters, source_path, target_path = dialog.getParameters()                           
-            self.performBatchAnalysis(VideoAnalyzer(**parameters),source_path,target_path)
-                
-    def performBatchAnalysis(self,videoAnalyser,source_folder,target_folder):
-        progressWidget = ProgressWidget()
-      
-        self.closeVideoPlayback()
-        progressWidget.cancelButton.clicked.connect(self.cancelBatch)
-        self.setCentralWidget(progressWidget)
-
-        self.batchAnalyzer = BatchAnalyzer(videoAnalyser,source_folder,target_folder)
-        self.batchAnalyzer.progressed.connect(progressWidget.updateProgress)
-        self.batchAnalyzer.start()
-        
-    def cancelBatch(self):
-        self.batchAnalyzer.stopBatch()
-        self.showVideoPlaybackView(maximize=False)
-                       
-    def closeEvent(self, evnt):
-        self.videoWidget.videoThread.terminate()
-        super().closeEvent(evnt)
-        
-        
-    def closeVideoPlayback(self):
-        if self.videoWidget.videoThread.videoReader != None:
-            self.videoWidget.videoThread.videoReader.close()
-            while self.videoWidget.videoThread.videoReader.isClosed() != True:
-                sleep(0.1)    
-        self.videoWidget.videoThread.terminate()  
-            
-class BatchAnalyzer(QThread):  
-     
-    progressed = pyqtSignal(int,int)   
-    
-    def __init__(self, videoAnalyser, source, target):
-        QThread.__init__(self, parent=None)        
-        self.videoAnalyzer = videoAnalyser
-        self.source = source
-        self.target = target
-        self.cancel = False
-        
-    def processFile(self, file_path):
-        file_path = file_path.replace('\\','/')
-        videoReader = VideoReader(file_path)     
-        movementTracker = MovementTracker()
-
-        captured = re.search('(?<=/)([A-Za-z0-9\-_]+)(?=.avi)', file_path, re.IGNORECASE)
-        
-        if captured is None:
-            return
-        
-        file_name = captured.group(0)
-        while True:
-            if self.cancel == True:
-                break
-            
-            frame = videoReader.nextFrame()  
-
-            if frame is None:
-                np.savetxt(self.target  + "/" + file_name+".csv",movementTracker.getEvents(), delimiter=",", fmt='%.2f')
-                break;       
-       
-            foreground_mask, movement = self.videoAnalyzer.detectMovement(frame)          
-            movementTracker.update(movement, videoReader.currentPositionInSeconds())
-        videoReader.close()
-        
-    def stopBatch(self):
-        self.cancel = True 
-
-    def run(self):  
-        video_files = glob.glob(self.source+'/**/*.avi', recursive=True)
-        for i in range(0,len(video_files)):
-            if self.cancel == False:
-                self.processFile(video_files[i])    
-            self.progressed.emit(i+1,len(video_files))
-            
-      
-        
-        
-       
-class BatchDialog(QDialog):
-    def __init__(self,parent=None):
-        
-        self.videoAnalyzer = VideoAnalyzer()
-        self.parameters = {}
-        
-        QDialog.__init__(self,parent)
-                
-        self.setupUi(self)               
-        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
-        self.setWindowFlags(self.windowFlags() & (~QtCore.Qt.WindowContextHelpButtonHint))
-     
-        
-    def setupUi(self, Dialog):
-        self.setWindowTitle("Batch detection")
-        self.resize(308, 170)
-        self.layout = QVBoxLayout(Dialog)
-        self.detectionSettingsWidget = DetectionSettingsWidget(self.videoAnalyzer)
-        self.detectionSettingsWidget.setParent(Dialog)
-        self.detectionSettingsWidget.updatedSignal.connect(self.updateProceed)
-        self.layout.addWidget(self.detectionSettingsWidget)
-        self.sourceHBox = QHBoxLayout(Dialog) 
-        self.sourceLabel = QLabel('Source:',parent=Dialog)        
-        self.sourceEditline = QLineEdit(Dialog)
-        self.sourceEditline.setReadOnly(True)
-        self.sourcePushButton = QPushButton("Select",parent=Dialog)   
-        self.sourceEditline.textChanged.connect(self.updateProceed)
-        
-        self.sourcePushButton.clicked.connect( lambda d: self.showFolderDialog(self.sourceEditline))
-        
-        self.sourceHBox.addWidget(self.sourceLabel)        
-        self.sourceHBox.addWidget(self.sourceEditline)
-        self.sourceHBox.addWidget(self.sourcePushButton)
-        self.layout.addLayout(self.sourceHBox) 
-
-       
-        self.targetHBox = QHBoxLayout(Dialog) 
-        self.targetLabel = QLabel('Target:',parent=Dialog)          
-        self.targetEditline = QLineEdit(Dialog)
-        self.targetEditline.setReadOnly(True)
-        self.targetEditline.textChanged.connect(self.updateProceed)
-        self.targetPushButton = QPushButton("Select",parent=Dialog)      
-        
-        self.targetPushButton.clicked.connect( lambda d: self.showFolderDialog(self.targetEditline))
-        self.targetHBox.addWidget(self.targetLabel)
-        self.targetHBox.addWidget(self.targetEditline)
-        self.targetHBox.addWidget(self.targetPushButton)        
-        self.layout.addLayout(self.targetHBox)    
-
-        
-        self.buttonBox = QDialogButtonBox(Dialog)
-        self.buttonBox.setGeometry(QtCore.QRect(0, 250, 310, 32))
-        self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
-        self.buttonBox.setStandardButtons(QDialogButtonBox.Cancel|QDialogButtonBox.Ok)
-        self.buttonBox.button(QDialogButtonBox.Cancel).clicked.connect(Dialog.reject)
-        self.buttonBox.button(QDialogButtonBox.Ok).clicked.connect(Dialog.accept)    
-        self.buttonBox.button(QDialogButtonBox.Ok).setText("Detect")
-        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
-        self.layout.addWidget(self.buttonBox)
-        
-    def getParameters(self):
-        return self.parameters, self.source_path, self.target_path        
-      
-        
-    def showFolderDialog(self, targetedLineEdit):
-        dname = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
-
-        if len(dname) > 0:
-            targetedLineEdit.setText(dname)
-        
-    def updateProceed(self):
-
-        self.parameters = self.videoAnalyzer.getParameters()
-        
-        if self.detectionSettingsWidget.allSettingsValid() and ( self.targetEditline.text() is not '') and ( self.sourceEditline.text() is not ''):
-            self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(True)
-            self.source_path = self.sourceEditline.text()
-            self.target_path = self.targetEditline.text()  
-        else:
-            self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
-        
-class AboutDialog(QDialog):
-    def __init__(self,parent=None):
-        
-        QDialog.__init__(self,parent)
-              
-        self.setupUi(self)               
-        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
-        self.setWindowFlags(self.windowFlags() & (~QtCore.Qt.WindowContextHelpButtonHint))
-     
-        
-    def setupUi(self, Dialog):
-        self.setWindowTitle("About")
-        self.resize(100, 120)
-        
-        self.layout = QHBoxLayout(Dialog)
-        self.vbox = QVBoxLayout(Dialog)
-        self.vbox.setAlignment(Qt.AlignHCenter)
-        self.layout.addLayout(self.vbox)
-        
-        self.nameLabel = QLabel("MovementDetector")
-        self.infoHbox = QHBoxLayout(Dialog)
-        self.infoLabel = QLabel("Version: 0.3 Support: ciszek@uef.fi")  
-        self.infoLabel.setMaximumWidth(100)
-        self.infoLabel.setWordWrap(True)         
-        
-        self.vbox.addWidget(self.nameLabel)
-        self.vbox.addWidget(self.infoLabel)
-        self.vbox.addStretch(1)
-        self.buttonHBox = QHBoxLayout()
-        
-        self.buttonBox = QDialogButtonBox(Dialog)
-
-
-        self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
-        self.buttonBox.setStandardButtons(QDialogButtonBox.Ok)
-        self.buttonBox.button(QDialogButtonBox.Ok).clicked.connect(Dialog.accept)   
-        self.buttonHBox.addStretch(1)
-        self.buttonHBox.addWidget(self.buttonBox)
-        self.buttonHBox.addStretch(1)       
-        self.vbox.addLayout(self.buttonHBox)
-
-
-        
-class ProgressWidget(QWidget):
-
-
-    progress_in_progress_style = loadStyleSheet(resource_path('stylesheets/progress_in_progress.css'))  
-    progress_completed_style = loadStyleSheet(resource_path('stylesheets/progress_completed.css'))
-  
-    
-    def __init__(self,):
-        super().__init__()
-        self.vbox = QVBoxLayout() 
-
-        self.outerHbox = QHBoxLayout()  
-        
-        self.outerHbox.setContentsMargins(30, 0, 30, 0)  
-     
-        self.outerHbox.addLayout(self.vbox)
-       
-                    
-        self.progressBar = QProgressBar(self)  
-        self.progressBar.setStyleSheet(ProgressWidget.progress_in_progress_style) 
-        self.progressBar.setValue(0)
-        
-        self.vbox.addStretch(1)   
-        self.vbox.setSpacing(10)
-        self.vbox.setAlignment(Qt.AlignHCenter)
-        self.vbox.addWidget(self.progressBar)
-        
-        self.buttonHBox = QHBoxLayout()
-        
-        self.cancelButton = QPushButton("Cancel")
-        self.cancelButton.setFixedWidth(50)  
-        self.buttonHBox.addStretch(1)           
-        self.buttonHBox.addWidget(self.cancelButton)
-        self.buttonHBox.addStretch(1)           
-        self.vbox.addLayout(self.buttonHBox)
-        self.vbox.addStretch(1)          
-
-        self.setLayout(self.outerHbox )
-        
-        
-        
-        
-        
-    def updateProgress(self, currentProgress, maximum):
-        self.progressBar.setMaximum(maximum)  
-        self.progressBar.setValue(currentProgress)  
-        
-        if currentProgress == maximum:
-            self.doCompleted()
-        
-        
-    def doCompleted(self):
-        self.progressBar.setStyleSheet(ProgressWidget.progress_completed_style)   
-        self.cancelButton.setText("Ok")
-
-     
-        
-class VideoWidget(QWidget):
-    
-    playbackStarted = pyqtSignal()
-    
-    def __init__(self):
-        super().__init__()
-        self.videoAnalyzer = VideoAnalyzer()        
-        self.videoThread = VideoThread(self);
-        self.__layout()
-        self.toggleVideoControls(False)
-
-    def toggleVideoControls(self, state):
-        for child in self.findChildren(QWidget):
-            child.setEnabled(state)
-        
-
-    def __layout(self):
-        
-        self.original = QLabel(self)
-        self.processed = QLabel(self)  
-        
-        self.originalPixmap = QPixmap(50,50)
-        self.originalPixmap.fill(QtCore.Qt.transparent)
-        self.original.setPixmap(self.originalPixmap)
-        self.processed.setPixmap(self.originalPixmap)  
-        
-        self.currentTimeLabel = QLabel("00:00:00")
-        self.currentTimeLabel.setFixedWidth(45)
-        self.totalTimeLabel = QLabel("00:00:00")
-        self.totalTimeLabel.setFixedWidth(45)        
-        self.timeSlider = QSlider(Qt.Horizontal, self)
-        self.timeSlider.setFocusPolicy(Qt.NoFocus)
-        self.timeSlider.setGeometry(30, 40, 100, 30)
-  
-        self.timeSlider.sliderMoved[int].connect(self.videoThread.changePosition)
-        self.detectionSettingsBox = QGroupBox("Settings")        
-        
-        self.vbox = QVBoxLayout(self)   
-        self.hbox = QHBoxLayout(self)   
-        self.hbox.setAlignment(Qt.AlignCenter)       
-        self.hbox.addWidget(self.processed)
-        self.hbox.addWidget(self.original)
-                 
-        self.vbox.addStretch(1)
-        self.vbox.addLayout(self.hbox ) 
-        
-        self.timePositionLayout = QHBoxLayout(self)  
-        self.timePositionLayout.addWidget(self.currentTimeLabel)
-        self.timePositionLayout.addWidget(self.timeSlider) 
-        self.timePositionLayout.addWidget(self.totalTimeLabel)        
-        self.vbox.addLayout(self.timePositionLayout)      
-
-        self.detectionSettingsWidget = DetectionSettingsWidget(self.videoAnalyzer)
-        
-        bottomHbox = QHBoxLayout(self)
-        bottomHbox.addStretch(1)            
-        bottomHbox.addWidget(self.detectionSettingsWidget)
-        bottomHbox.addStretch(1)  
-        
-        self.stopButton = QPushButton()
-        stopIcon = QIcon()
-        stopIcon.addPixmap(QPixmap(resource_path('icons/Stop.png')))
-        self.stopButton.setIcon(stopIcon)
-        self.stopButton.setFixedWidth(50)
-        self.stopButton.setFixedHeight(40)   
-        self.stopButton.clicked.connect( lambda: self.videoThread.pause())
-        bottomHbox.addWidget(self.stopButton)
-
-        self.playButton = QPushButton()
-        self.playButton.setFixedWidth(50)
-        self.playButton.setFixedHeight(40)
-        self.playButton.clicked.connect( lambda: self.videoThread.play())
-        
-        playIcon = QIcon()
-        playIcon.addPixmap(QPixmap(resource_path('icons/Play.png')))
-        self.playButton.setIcon(playIcon)
-        bottomHbox.addWidget(self.playButton)
-      
-        bottomHbox.addStretch(1)      
-
-        spacer = QSpacerItem(320, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-        bottomHbox.addItem(spacer)
-        bottomHbox.addStretch(1)            
-        self.vbox.addLayout(bottomHbox)      
-        self.setLayout(self.vbox )  
-        
-        
-    def displayVideo(self,file_path):
-
-        self.toggleVideoControls(True)
-        
-        videoReader = VideoReader(file_path)
-        self.totalTimeLabel.setText(time.strftime('%H:%M:%S', time.gmtime(videoReader.lengthInSeconds())))
-        self.timeSlider.setTickInterval(1)
-        self.timeSlider.setRange(0,videoReader.duration)
-
-        self.videoThread.changeOriginalPixmap.connect(lambda p: self.original.setPixmap(p))
-        self.videoThread.changeProcessedPixmap.connect(lambda p: self.processed.setPixmap(p))        
-        self.videoThread.changecurrentTime.connect(lambda t: self.__updateSlider(t))
-        self.videoThread.videoReader = videoReader
-        self.videoThread.videoAnalyzer = self.videoAnalyzer
-        self.videoThread.videoAnalyzer.updateParameters()
-        if  self.videoThread.isRunning() == False:
-            self.videoThread.start()
-        self.playbackStarted.emit()
-        
-    def __updateSlider(self, t):
-        self.currentTimeLabel.setText(time.strftime('%H:%M:%S', time.gmtime(t)))
-        self.timeSlider.setValue(t)
-        
-        
-class DetectionSettingsWidget(QWidget):
-    
-    __movementThresholdValidator = QDoubleValidator(0.000001, 1.0, 6)
-    __historyValidator = QIntValidator(1, 1000)    
-    __kernerValidator = QIntValidator(1, 20)   
-    __mixtureValidator = QIntValidator(1, 10)  
-    __backgroundRatioValidator = QDoubleValidator(0.000001, 1,6) 
-    __complexityThresholdValidator = QDoubleValidator(0.000001, 1.0, 6)    
-        
-    updatedSignal = pyqtSignal()    
-    
-    def __init__(self, videoAnalyzer):
-        super().__init__()
-
-        self.videoAnalyzer = videoAnalyzer
-        self.__layout()
-
-    
-    def __layout(self):
-        self.setFixedWidth(300)
-        hbox = QHBoxLayout()
-        hbox.setSpacing(5)
-        leftFormLayout = QFormLayout()    
-        
-        self.movementThresholdLineEdit = QLineEdit("0,001", parent=self)
-        self.movementThresholdLineEdit.setMaximumWidth(40)
-        self.movementThresholdLineEdit.setValidator(self.__movementThresholdValidator)
-        leftFormLayout.addRow(QLabel("Threshold:",parent=self),self.movementThresholdLineEdit)     
-        
-        self.kernelSizeLineEdit = QLineEdit("5",parent=self)
-        self.kernelSizeLineEdit.setMaximumWidth(40)   
-        self.kernelSizeLineEdit.setValidator(self.__kernerValidator)        
-        leftFormLayout.addRow(QLabel("Kernel:",parent=self),self.kernelSizeLineEdit)           
-        
-        middleFormLayout = QFormLayout() 
-        self.historyLineEdit = QLineEdit("100",parent=self)
-        self.historyLineEdit.setMaximumWidth(40)
-        self.historyLineEdit.setValidator(self.__historyValidator)           
-        middleFormLayout.addRow(QLabel("History:",parent=self),self.historyLineEdit)      
-        
-        self.complexityReductionThresholdLineEdit = QLineEdit("0,05",parent=self)
-        self.complexityReductionThresholdLineEdit.setMaximumWidth(40)
-        self.complexityReductionThresholdLineEdit.setValidator(self.__complexityThresholdValidator)           
-        middleFormLayout.addRow(QLabel("CRT:",parent=self),self.complexityReductionThresholdLineEdit)            
-        
-        rightFormLayout = QFormLayout()   
-         
-        self.mixtureLineEdit = QLineEdit("5",parent=self)
-        self.mixtureLineEdit.setMaximumWidth(40)
-        self.mixtureLineEdit.setValidator(self.__mixtureValidator)              
-        rightFormLayout.addRow(QLabel("Mixtures:",parent=self),self.mixtureLineEdit) 
-        
-        self.backgroundRatioLineEdit = QLineEdit("0,8",parent=self)
-        self.backgroundRatioLineEdit.setMaximumWidth(40)
-        self.backgroundRatioLineEdit.setValidator(self.__backgroundRatioValidator)           
-        rightFormLayout.addRow(QLabel("Bg ratio:",parent=self),self.backgroundRatioLineEdit)         
-   
-        hbox.addLayout(leftFormLayout)
-
-        hbox.addLayout(middleFormLayout)   
-       
-        hbox.addLayout(rightFormLayout)
-        
-        self.movementThresholdLineEdit.textChanged.connect( lambda t: self.updateSettings(self.movementThresholdLineEdit,self.videoAnalyzer,'movement_threshold','updateParameters') )
-        self.kernelSizeLineEdit.textChanged.connect( lambda t: self.updateSettings(self.kernelSizeLineEdit,self.videoAnalyzer,'open_kernel_size','updateParameters')  )        
-        self.historyLineEdit.textChanged.connect( lambda t: self.updateSettings(self.historyLineEdit,self.videoAnalyzer,'history','updateParameters') )
-        self.complexityReductionThresholdLineEdit.textChanged.connect( lambda t: self.updateSettings(self.complexityReductionThresholdLineEdit,self.videoAnalyzer,'complexity_reduction_threshold','updateParameters')  )           
-        self.mixtureLineEdit.textChanged.connect( lambda t: self.updateSettings(self.mixtureLineEdit,self.videoAnalyzer,'mixtures','updateParameters')  ) 
-        self.backgroundRatioLineEdit.textChanged.connect( lambda t: self.updateSettings(self.backgroundRatioLineEdit,self.videoAnalyzer,'background_ratio','updateParameters')  )
-        
-        self.setLayout(hbox)
-        
-    def allSettingsValid(self):
-        for setting in self.findChildren(QLineEdit):
-            if setting.validator().validate(setting.text(), 0)[0] != QtGui.QValidator.Acceptable:
-                return False        
-        return True
-        
-    def updateSettings(self, source, target, setting, update_function_name=None):
-        
-        validator = source.validator() 
-        color = '#f6989d'
-      
-        if validator.validate(source.text(), 0)[0] == QtGui.QValidator.Acceptable:
-            color = 'white'
-            setattr( target, setting, float( source.text().replace(',', '.')))     
-
-        update_function = getattr(target, update_function_name)
-        source.setStyleSheet('QLineEdit { background-color: %s }'%color)
-        update_function()
-        self.updatedSignal.emit()
-        
-    
-class VideoThread(QThread):
-    changeOriginalPixmap = pyqtSignal(QPixmap)
-    changeProcessedPixmap = pyqtSignal(QPixmap) 
-    changecurrentTime = pyqtSignal([float])   
-    
-    def __init__(self, parent=None ):
-        QThread.__init__(self, parent=parent)
-        self.jump_to_position = -1
-        self.videoReader = None
-        self.videoAnalyzer = None
-        self.paused = False
-
-    def pause(self):
-        self.paused = True 
-        
-    def play(self):
-        self.paused = False         
-
-    def run(self):
-
-        self.Paused = False
-        
-        movementTracker = MovementTracker()        
-        
-        while True:
-            
-            begin_time = int(round(time.time() * 1000))
-            
-            if self.paused:
-                continue
-            
-            if self.jump_to_position >= 0:
-                self.videoReader.setPositionInSeconds(self.jump_to_position)
-                self.jump_to_position = -1
-            
-            frame = self.videoReader.nextFrame()    
-            
-            if frame is None or frame is []:
-                continue;
-            
-            height, width, channel, bytesPerLine = self.videoReader.getFrameData(frame)
-
-
-            foreground_mask, movement = self.videoAnalyzer.detectMovement(frame)
-            
-            movementTracker.update(movement, self.videoReader.currentPositionInSeconds())
-            
-            gs_foreground_mask = cv2.cvtColor(foreground_mask,cv2.COLOR_GRAY2RGB)
-            
-            if gs_foreground_mask is None:
-                continue
-            
-            height, width, channel, bytesPerLine = self.videoReader.getFrameData(gs_foreground_mask)
-
-            processedFrameImage = QImage(gs_foreground_mask.data, width, height, bytesPerLine, QImage.Format_RGB888)         
-            processedFramePixmap = QPixmap.fromImage(processedFrameImage)  
-
-            im2,contours,hierarchy = cv2.findContours(foreground_mask, cv2.RETR_TREE,cv2.CHAIN_APPROX_SIMPLE)
-            if len(contours) > 0 and movement:
-                for cnt in contours:
-                    x,y,w,h = cv2.boundingRect(cnt)
-                    cv2.rectangle(frame,(x,y),(x+w,y+h),(0,255,0),2)
-                
-            originalFrameImage = QImage(frame.data, width, height, bytesPerLine, QImage.Format_RGB888)
-            originalFramePixmap = QPixmap.fromImage(originalFrameImage)      
-            
-            self.changeOriginalPixmap.emit(originalFramePixmap)  
-            self.changeProcessedPixmap.emit(processedFramePixmap)  
-            self.changecurrentTime.emit(round(self.videoReader.currentPositionInSeconds()))
-            
-            delta_time = ( int(round(time.time() * 1000)) - begin_time ) / 1000.0
-
-            wait_time = np.max([(1.0/self.videoReader.fps)-delta_time,0])
-            if wait_time > 0:
-                sleep(wait_time)
-            
-    def changePosition(self,position):
-        self.jump_to_position = position
-
-    def terminate(self):
-        if self.videoReader is not None:
-            self.videoReader.close()
-        super().terminate()
-        
-        
-        
-if __name__ == '__main__':
-    #Set up logging
-
-    #logging.config.fileConfig('logging.conf')
-    #logging.getLogger('eventLog').info("Testing")
-    app=0  
-
-    locale.setlocale(locale.LC_ALL, '') 
-    app = QApplication(sys.argv)
-    ex = MotionDetector()
-    app.exec_()
+from PyQt5.QtWidgets import QMainWindow, QAction, qApp, QApplication,QFileDialog,QHBoxLayout,QLabel,QWidget,QVBoxLayout,QSlider,QGridLayout,QLineEdit,QGroupBox,QFormLayout, QSpacerItem,QSizePolicy,QPushButton,QDialog,QDialogButtonBox,QProgressBar,QActionGroup,QComboBox,QCheckBox 
+from PyQt5.QtGui import QIcon,QPixmap,QImage,QFont,QDoubleValidator,QIntValidator 
+from PyQt5 import QtGui 
+from PyQt5 import QtCore
+from PyQt5.QtCore import QThread, pyqtSignal, Qt,QLocale
+from VideoReader import VideoReader
+from ScrubPreview import ScrubPreview
+from VideoAnalyzer import VideoAnalyzer, MovementTracker, BACKENDS
+from BatchProcessor import BatchProcessor, ParallelBatch
+from Instrumentation import StageTimer
+import cv2
+import numpy as np
+import logging,re,glob,time,sys,locale,os,threading
+import logging.config
+from deployment import resource_path,loadStyleSheet
+
+
+class MotionDetector(QMainWindow):
+    
+    def __init__(self):
+        super().__init__()
+        
+        self.initUI()
+        
+        
+    def initUI(self):
+        
+        self.setWindowTitle('MovementDetector')
+      
+        openFileAct = QAction('Open', self)        
+        openFileAct.setShortcut('Ctrl+O')
+        openFileAct.setStatusTip('Open a single file')
+        openFileAct.triggered.connect(self.showFileDialog)     
+        
+        batchProcessAct = QAction('Batch process', self)        
+        batchProcessAct.setShortcut('Ctrl+B')
+        batchProcessAct.setStatusTip('Process multiple files')
+        batchProcessAct.triggered.connect(self.showBatchDialog)     
+        
+        exitAct = QAction('&Exit', self)        
+        exitAct.setShortcut('Ctrl+Q')
+        exitAct.setStatusTip('Exit application')
+        exitAct.triggered.connect(qApp.quit)
+        
+        self.timingAct = QAction('Stage timing', self)        
+        self.timingAct.setCheckable(True)
+        self.timingAct.setStatusTip('Record the time spent in each processing stage of playback, and of batches started while checked')
+        self.timingAct.toggled.connect(self.toggleTiming)     
+        
+        self.previewRate = VideoThread.DISPLAY_FPS
+        previewRateGroup = QActionGroup(self)
+        previewRateActs = []
+        for rate in (10, 15, 30, 60):
+            previewRateAct = QAction('%d fps' % rate, self, checkable=True)
+            previewRateAct.setChecked(rate == self.previewRate)
+            previewRateAct.setStatusTip('Show at most %d preview frames per second' % rate)
+            previewRateAct.triggered.connect(lambda checked, rate=rate: self.setPreviewRate(rate))
+            previewRateGroup.addAction(previewRateAct)
+            previewRateActs.append(previewRateAct)
+        
+        aboutAct = QAction('&About', self)        
+        aboutAct.setStatusTip('About MovementDetector')
+        aboutAct.triggered.connect(self.showAboutDialog)        
+
+        self.statusBar()
+
+        menubar = self.menuBar()
+        fileMenu = menubar.addMenu('&File')
+        fileMenu.addAction(openFileAct)      
+        fileMenu.addAction(batchProcessAct)           
+        fileMenu.addAction(exitAct)     
+        
+        viewMenu = menubar.addMenu('&View')
+        viewMenu.addAction(self.timingAct)      
+        previewRateMenu = viewMenu.addMenu('Preview rate')
+        for previewRateAct in previewRateActs:
+            previewRateMenu.addAction(previewRateAct)
+        
+        aboutMenu = menubar.addMenu('&Help')
+        aboutMenu.addAction(aboutAct)           
+        self.showVideoPlaybackView()
+ 
+
+  
+    def showVideoPlaybackView(self, maximize=True):
+        self.videoWidget = VideoWidget()
+        self.videoWidget.playbackStarted.connect(lambda : self.showMaximized() )
+
+        self.videoWidget.videoThread.timer.enabled = self.timingAct.isChecked()
+        self.videoWidget.videoThread.display_fps = self.previewRate
+
+        self.setCentralWidget(self.videoWidget)
+        if maximize:
+            self.showMaximized()     
+      
+    def showFileDialog(self):
+
+        fname = QFileDialog.getOpenFileName(self, 'Open file', '/home')
+
+        if fname[0]:
+            self.videoWidget.displayVideo(fname[0])   
+
+            
+    def setPreviewRate(self, rate):
+        self.previewRate = rate
+        self.videoWidget.videoThread.display_fps = rate
+            
+    def toggleTiming(self, enabled):
+        #Switches the timing of playback at once. Batch workers are separate
+        #processes, so a batch keeps the setting it was started with.
+        timer = self.videoWidget.videoThread.timer
+        if not enabled and timer.totalSeconds() > 0:
+            self.statusBar().showMessage(timer.summary())
+        timer.enabled = enabled
+            
+    def showAboutDialog(self):
+        self.videoWidget.videoThread.pause()
+        dialog = AboutDialog()
+        dialog.exec_()    
+            
+    def showBatchDialog(self):
+        dialog = BatchDialog()
+        return_code = dialog.exec_()
+        if return_code == QDialog.Accepted:
+            parameters, source_path, target_path, workers, cache_ratios = dialog.getParameters()                           
+            self.performBatchAnalysis(VideoAnalyzer(**parameters),source_path,target_path,workers,cache_ratios)
+                
+    def performBatchAnalysis(self,videoAnalyser,source_folder,target_folder,workers=None,cache_ratios=False):
+        progressWidget = ProgressWidget()
+      
+        self.closeVideoPlayback()
+        progressWidget.cancelButton.clicked.connect(self.cancelBatch)
+        self.setCentralWidget(progressWidget)
+
+        self.batchAnalyzer = BatchAnalyzer(videoAnalyser,source_folder,target_folder,workers,self.timingAct.isChecked(),cache_ratios)
+        self.batchAnalyzer.progressed.connect(progressWidget.updateProgress)
+        self.batchAnalyzer.throughputUpdated.connect(progressWidget.updateThroughput)
+        if self.timingAct.isChecked():
+            self.batchAnalyzer.finished.connect(lambda : self.statusBar().showMessage(self.batchAnalyzer.parallelBatch.timer.summary()))
+        self.batchAnalyzer.start()
+        
+    def cancelBatch(self):
+        self.batchAnalyzer.stopBatch()
+        self.showVideoPlaybackView(maximize=False)
+                       
+    def closeEvent(self, evnt):
+        self.videoWidget.closeVideo()
+        super().closeEvent(evnt)
+        
+        
+    def closeVideoPlayback(self):
+        self.videoWidget.closeVideo()  
+            
+class BatchAnalyzer(QThread):  
+     
+    progressed = pyqtSignal(int,int)   
+    throughputUpdated = pyqtSignal(float,float,int,int)
+    
+    CACHE_FOLDER = '.ratio_cache'
+    TIMING_FILE = 'timing.json'
+    INDEX_FILE = '.video_index.sqlite'
+    #Progress is emitted in per-mille, as frame counts of large archives
+    #overflow the int of Qt signals and of QProgressBar
+    PROGRESS_SCALE = 1000
+    
+    def __init__(self, videoAnalyser, source, target, workers=None, instrument=False, cache_ratios=False):
+        QThread.__init__(self, parent=None)        
+        self.videoAnalyzer = videoAnalyser
+        self.source = source
+        self.target = target
+        self.instrument = instrument
+        cache_folder = os.path.join(target, BatchAnalyzer.CACHE_FOLDER) if cache_ratios else None
+        self.batchProcessor = BatchProcessor(videoAnalyser.getParameters(), target, cache_folder=cache_folder, instrument=instrument,
+                                             index_path=os.path.join(target, BatchAnalyzer.INDEX_FILE), resume=True)
+        self.parallelBatch = ParallelBatch(self.batchProcessor, workers)
+        
+    def processFile(self, file_path):
+        return self.batchProcessor.processFile(file_path, self.parallelBatch.cancel_event)
+        
+    def stopBatch(self):
+        self.parallelBatch.cancel()
+
+    def run(self):  
+        video_files = self.batchProcessor.findVideoFiles(self.source)
+        begin_time = time.perf_counter()
+        self.parallelBatch.run(video_files, lambda frames_done, frames_total, files_done, files_total: self.reportProgress(frames_done, frames_total, files_done, files_total, begin_time))
+        if self.instrument:
+            self.parallelBatch.timer.write(os.path.join(self.target, BatchAnalyzer.TIMING_FILE))
+            
+    def reportProgress(self, frames_done, frames_total, files_done, files_total, begin_time):
+        elapsed = time.perf_counter() - begin_time
+        if elapsed > 0 and frames_done > 0:
+            frames_per_second = frames_done / elapsed
+            self.throughputUpdated.emit(frames_per_second, (frames_total - frames_done) / frames_per_second, files_done, files_total)
+        if frames_total > 0:
+            self.progressed.emit(BatchAnalyzer.PROGRESS_SCALE * min(frames_done, frames_total) // frames_total, BatchAnalyzer.PROGRESS_SCALE)
+        else:
+            self.progressed.emit(BatchAnalyzer.PROGRESS_SCALE, BatchAnalyzer.PROGRESS_SCALE)
+            
+      
+        
+        
+       
+class BatchDialog(QDialog):
+    def __init__(self,parent=None):
+        
+        self.videoAnalyzer = VideoAnalyzer()
+        self.parameters = {}
+        
+        QDialog.__init__(self,parent)
+                
+        self.setupUi(self)               
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.setWindowFlags(self.windowFlags() & (~QtCore.Qt.WindowContextHelpButtonHint))
+     
+        
+    def setupUi(self, Dialog):
+        self.setWindowTitle("Batch detection")
+        self.resize(308, 170)
+        self.layout = QVBoxLayout(Dialog)
+        self.detectionSettingsWidget = DetectionSettingsWidget(self.videoAnalyzer)
+        self.detectionSettingsWidget.setParent(Dialog)
+        self.detectionSettingsWidget.updatedSignal.connect(self.updateProceed)
+        self.layout.addWidget(self.detectionSettingsWidget)
+        self.sourceHBox = QHBoxLayout(Dialog) 
+        self.sourceLabel = QLabel('Source:',parent=Dialog)        
+        self.sourceEditline = QLineEdit(Dialog)
+        self.sourceEditline.setReadOnly(True)
+        self.sourcePushButton = QPushButton("Select",parent=Dialog)   
+        self.sourceEditline.textChanged.connect(self.updateProceed)
+        
+        self.sourcePushButton.clicked.connect( lambda d: self.showFolderDialog(self.sourceEditline))
+        
+        self.sourceHBox.addWidget(self.sourceLabel)        
+        self.sourceHBox.addWidget(self.sourceEditline)
+        self.sourceHBox.addWidget(self.sourcePushButton)
+        self.layout.addLayout(self.sourceHBox) 
+
+       
+        self.targetHBox = QHBoxLayout(Dialog) 
+        self.targetLabel = QLabel('Target:',parent=Dialog)          
+        self.targetEditline = QLineEdit(Dialog)
+        self.targetEditline.setReadOnly(True)
+        self.targetEditline.textChanged.connect(self.updateProceed)
+        self.targetPushButton = QPushButton("Select",parent=Dialog)      
+        
+        self.targetPushButton.clicked.connect( lambda d: self.showFolderDialog(self.targetEditline))
+        self.targetHBox.addWidget(self.targetLabel)
+        self.targetHBox.addWidget(self.targetEditline)
+        self.targetHBox.addWidget(self.targetPushButton)        
+        self.layout.addLayout(self.targetHBox)    
+
+        self.workersHBox = QHBoxLayout(Dialog) 
+        self.workersLabel = QLabel('Workers:',parent=Dialog)          
+        self.workersLineEdit = QLineEdit(str(os.cpu_count() or 1), parent=Dialog)
+        self.workersLineEdit.setMaximumWidth(40)
+        self.workersLineEdit.setValidator(QIntValidator(1, 256))
+        self.workersLineEdit.textChanged.connect(self.updateProceed)
+        self.workersHBox.addWidget(self.workersLabel)
+        self.workersHBox.addWidget(self.workersLineEdit)
+        self.workersHBox.addStretch(1)
+        self.layout.addLayout(self.workersHBox)    
+
+        self.cacheCheckBox = QCheckBox('Cache foreground ratios', parent=Dialog)
+        self.cacheCheckBox.setToolTip('Store the per-frame ratios into the target folder, so that the videos are not analyzed again when only the threshold changes')
+        self.layout.addWidget(self.cacheCheckBox)
+
+        
+        self.buttonBox = QDialogButtonBox(Dialog)
+        self.buttonBox.setGeometry(QtCore.QRect(0, 250, 310, 32))
+        self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
+        self.buttonBox.setStandardButtons(QDialogButtonBox.Cancel|QDialogButtonBox.Ok)
+        self.buttonBox.button(QDialogButtonBox.Cancel).clicked.connect(Dialog.reject)
+        self.buttonBox.button(QDialogButtonBox.Ok).clicked.connect(Dialog.accept)    
+        self.buttonBox.button(QDialogButtonBox.Ok).setText("Detect")
+        self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
+        self.layout.addWidget(self.buttonBox)
+        
+    def getParameters(self):
+        return self.parameters, self.source_path, self.target_path, self.workers, self.cacheCheckBox.isChecked()        
+      
+        
+    def showFolderDialog(self, targetedLineEdit):
+        dname = str(QFileDialog.getExistingDirectory(self, "Select Directory"))
+
+        if len(dname) > 0:
+            targetedLineEdit.setText(dname)
+        
+    def updateProceed(self):
+
+        self.parameters = self.videoAnalyzer.getParameters()
+        
+        workersValid = self.workersLineEdit.validator().validate(self.workersLineEdit.text(), 0)[0] == QtGui.QValidator.Acceptable
+        
+        if self.detectionSettingsWidget.allSettingsValid() and workersValid and ( self.targetEditline.text() is not '') and ( self.sourceEditline.text() is not ''):
+            self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(True)
+            self.source_path = self.sourceEditline.text()
+            self.target_path = self.targetEditline.text()  
+            self.workers = int(self.workersLineEdit.text())
+        else:
+            self.buttonBox.button(QDialogButtonBox.Ok).setEnabled(False)
+        
+class AboutDialog(QDialog):
+    def __init__(self,parent=None):
+        
+        QDialog.__init__(self,parent)
+              
+        self.setupUi(self)               
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.setWindowFlags(self.windowFlags() & (~QtCore.Qt.WindowContextHelpButtonHint))
+     
+        
+    def setupUi(self, Dialog):
+        self.setWindowTitle("About")
+        self.resize(100, 120)
+        
+        self.layout = QHBoxLayout(Dialog)
+        self.vbox = QVBoxLayout(Dialog)
+        self.vbox.setAlignment(Qt.AlignHCenter)
+        self.layout.addLayout(self.vbox)
+        
+        self.nameLabel = QLabel("MovementDetector")
+        self.infoHbox = QHBoxLayout(Dialog)
+        self.infoLabel = QLabel("Version: 0.3 Support: ciszek@uef.fi")  
+        self.infoLabel.setMaximumWidth(100)
+        self.infoLabel.setWordWrap(True)         
+        
+        self.vbox.addWidget(self.nameLabel)
+        self.vbox.addWidget(self.infoLabel)
+        self.vbox.addStretch(1)
+        self.buttonHBox = QHBoxLayout()
+        
+        self.buttonBox = QDialogButtonBox(Dialog)
+
+
+        self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
+        self.buttonBox.setStandardButtons(QDialogButtonBox.Ok)
+        self.buttonBox.button(QDialogButtonBox.Ok).clicked.connect(Dialog.accept)   
+        self.buttonHBox.addStretch(1)
+        self.buttonHBox.addWidget(self.buttonBox)
+        self.buttonHBox.addStretch(1)       
+        self.vbox.addLayout(self.buttonHBox)
+
+
+        
+class ProgressWidget(QWidget):
+
+
+    progress_in_progress_style = loadStyleSheet(resource_path('stylesheets/progress_in_progress.css'))  
+    progress_completed_style = loadStyleSheet(resource_path('stylesheets/progress_completed.css'))
+  
+    
+    def __init__(self,):
+        super().__init__()
+        self.vbox = QVBoxLayout() 
+
+        self.outerHbox = QHBoxLayout()  
+        
+        self.outerHbox.setContentsMargins(30, 0, 30, 0)  
+     
+        self.outerHbox.addLayout(self.vbox)
+       
+                    
+        self.progressBar = QProgressBar(self)  
+        self.progressBar.setStyleSheet(ProgressWidget.progress_in_progress_style) 
+        self.progressBar.setValue(0)
+        
+        self.vbox.addStretch(1)   
+        self.vbox.setSpacing(10)
+        self.vbox.setAlignment(Qt.AlignHCenter)
+        self.vbox.addWidget(self.progressBar)
+        
+        self.throughputLabel = QLabel("", parent=self)
+        self.throughputLabel.setAlignment(Qt.AlignHCenter)
+        self.vbox.addWidget(self.throughputLabel)
+        
+        self.buttonHBox = QHBoxLayout()
+        
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.setFixedWidth(50)  
+        self.buttonHBox.addStretch(1)           
+        self.buttonHBox.addWidget(self.cancelButton)
+        self.buttonHBox.addStretch(1)           
+        self.vbox.addLayout(self.buttonHBox)
+        self.vbox.addStretch(1)          
+
+        self.setLayout(self.outerHbox )
+        
+        
+        
+        
+        
+    def updateProgress(self, currentProgress, maximum):
+        self.progressBar.setMaximum(maximum)  
+        self.progressBar.setValue(currentProgress)  
+        
+        if currentProgress == maximum:
+            self.doCompleted()
+        
+        
+    def updateThroughput(self, framesPerSecond, remainingSeconds, filesDone, filesTotal):
+        #Batches may take days, so the hours are not wrapped to a day
+        minutes, seconds = divmod(int(remainingSeconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        self.throughputLabel.setText("%d/%d files   %.1f frames/s   ETA %d:%02d:%02d" % (filesDone, filesTotal, framesPerSecond, hours, minutes, seconds))
+        
+    def doCompleted(self):
+        self.progressBar.setStyleSheet(ProgressWidget.progress_completed_style)   
+        self.cancelButton.setText("Ok")
+
+     
+        
+class VideoWidget(QWidget):
+    
+    playbackStarted = pyqtSignal()
+    thumbnailReady = pyqtSignal(float, QImage)
+    
+    def __init__(self):
+        super().__init__()
+        self.videoAnalyzer = VideoAnalyzer()        
+        self.videoThread = VideoThread(self);
+        self.scrubPreview = None
+        self.thumbnailReady.connect(self.showThumbnail)
+        self.videoThread.previewReady.connect(self.showPreview)
+        self.videoThread.changecurrentTime.connect(lambda t: self.__updateSlider(t))
+        self.__layout()
+        self.toggleVideoControls(False)
+
+    def toggleVideoControls(self, state):
+        for child in self.findChildren(QWidget):
+            child.setEnabled(state)
+        
+
+    def __layout(self):
+        
+        self.original = QLabel(self)
+        self.processed = QLabel(self)  
+        
+        self.originalPixmap = QPixmap(50,50)
+        self.originalPixmap.fill(QtCore.Qt.transparent)
+        self.original.setPixmap(self.originalPixmap)
+        self.processed.setPixmap(self.originalPixmap)  
+        
+        self.currentTimeLabel = QLabel("00:00:00")
+        self.currentTimeLabel.setFixedWidth(45)
+        self.totalTimeLabel = QLabel("00:00:00")
+        self.totalTimeLabel.setFixedWidth(45)        
+        self.timeSlider = QSlider(Qt.Horizontal, self)
+        self.timeSlider.setFocusPolicy(Qt.NoFocus)
+        self.timeSlider.setGeometry(30, 40, 100, 30)
+  
+        #Dragging shows cached keyframe thumbnails; the playback decoder
+        #moves only once the slider is released
+        self.timeSlider.sliderMoved[int].connect(self.previewPosition)
+        self.timeSlider.sliderReleased.connect(lambda: self.videoThread.changePosition(self.timeSlider.value()))
+        self.detectionSettingsBox = QGroupBox("Settings")        
+        
+        self.vbox = QVBoxLayout(self)   
+        self.hbox = QHBoxLayout(self)   
+        self.hbox.setAlignment(Qt.AlignCenter)       
+        self.hbox.addWidget(self.processed)
+        self.hbox.addWidget(self.original)
+                 
+        self.vbox.addStretch(1)
+        self.vbox.addLayout(self.hbox ) 
+        
+        self.timePositionLayout = QHBoxLayout(self)  
+        self.timePositionLayout.addWidget(self.currentTimeLabel)
+        self.timePositionLayout.addWidget(self.timeSlider) 
+        self.timePositionLayout.addWidget(self.totalTimeLabel)        
+        self.vbox.addLayout(self.timePositionLayout)      
+
+        self.detectionSettingsWidget = DetectionSettingsWidget(self.videoAnalyzer)
+        
+        bottomHbox = QHBoxLayout(self)
+        self.bottomHbox = bottomHbox
+        bottomHbox.addStretch(1)            
+        bottomHbox.addWidget(self.detectionSettingsWidget)
+        bottomHbox.addStretch(1)  
+        
+        self.stopButton = QPushButton()
+        stopIcon = QIcon()
+        stopIcon.addPixmap(QPixmap(resource_path('icons/Stop.png')))
+        self.stopButton.setIcon(stopIcon)
+        self.stopButton.setFixedWidth(50)
+        self.stopButton.setFixedHeight(40)   
+        self.stopButton.clicked.connect( lambda: self.videoThread.pause())
+        bottomHbox.addWidget(self.stopButton)
+
+        self.playButton = QPushButton()
+        self.playButton.setFixedWidth(50)
+        self.playButton.setFixedHeight(40)
+        self.playButton.clicked.connect( lambda: self.videoThread.play())
+        
+        playIcon = QIcon()
+        playIcon.addPixmap(QPixmap(resource_path('icons/Play.png')))
+        self.playButton.setIcon(playIcon)
+        bottomHbox.addWidget(self.playButton)
+      
+        bottomHbox.addStretch(1)      
+
+        spacer = QSpacerItem(320, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
+        bottomHbox.addItem(spacer)
+        bottomHbox.addStretch(1)            
+        self.vbox.addLayout(bottomHbox)      
+        self.setLayout(self.vbox )  
+        
+        
+    def displayVideo(self,file_path):
+
+        self.toggleVideoControls(True)
+        
+        videoReader = VideoReader(file_path, buffer_count=2)
+        if self.scrubPreview is not None:
+            self.scrubPreview.stop()
+        self.scrubPreview = ScrubPreview(file_path, (videoReader.width, videoReader.height, videoReader.fps, videoReader.duration, videoReader.frames))
+        self.totalTimeLabel.setText(time.strftime('%H:%M:%S', time.gmtime(videoReader.lengthInSeconds())))
+        self.timeSlider.setTickInterval(1)
+        self.timeSlider.setRange(0,videoReader.duration)
+
+        self.videoAnalyzer.updateParameters()
+        self.videoThread.openVideo(videoReader, self.videoAnalyzer)
+        if  self.videoThread.isRunning() == False:
+            self.videoThread.start()
+        self.playbackStarted.emit()
+        
+    def closeVideo(self):
+        """
+        Stops the scrub preview and the playback thread, closing the video.
+        """
+        if self.scrubPreview is not None:
+            self.scrubPreview.stop()
+            self.scrubPreview = None
+        self.videoThread.terminate()
+        
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        #The two previews share the width above the controls
+        controls = self.timePositionLayout.sizeHint().height() + self.bottomHbox.sizeHint().height()
+        self.videoThread.setPreviewSize(self.width() // 2, self.height() - controls)
+        
+    def showPreview(self):
+        preview = self.videoThread.takePreview()
+        if preview is None or self.timeSlider.isSliderDown():
+            return
+        originalImage, processedImage = preview[0:2]
+        self.original.setPixmap(QPixmap.fromImage(originalImage))
+        self.processed.setPixmap(QPixmap.fromImage(processedImage))
+        
+    def __updateSlider(self, t):
+        if self.timeSlider.isSliderDown():
+            return
+        self.currentTimeLabel.setText(time.strftime('%H:%M:%S', time.gmtime(t)))
+        self.timeSlider.setValue(t)
+        
+    def previewPosition(self, position):
+        self.currentTimeLabel.setText(time.strftime('%H:%M:%S', time.gmtime(position)))
+        if self.scrubPreview is not None:
+            self.scrubPreview.request(position, self.__emitThumbnail)
+            
+    def __emitThumbnail(self, position, thumbnail):
+        #Called from the GUI thread for cached thumbnails and from the preview
+        #thread otherwise; the image has to own its data in either case
+        height, width, channel = thumbnail.shape
+        self.thumbnailReady.emit(position, QImage(thumbnail.data, width, height, channel * width, QImage.Format_RGB888).copy())
+        
+    def showThumbnail(self, position, image):
+        if self.timeSlider.isSliderDown():
+            self.original.setPixmap(QPixmap.fromImage(image).scaled(self.original.size(), Qt.KeepAspectRatio))
+        
+        
+class DetectionSettingsWidget(QWidget):
+    
+    __movementThresholdValidator = QDoubleValidator(0.000001, 1.0, 6)
+    __historyValidator = QIntValidator(1, 1000)    
+    __kernerValidator = QIntValidator(1, 20)   
+    __mixtureValidator = QIntValidator(1, 10)  
+    __backgroundRatioValidator = QDoubleValidator(0.000001, 1,6) 
+    __complexityThresholdValidator = QDoubleValidator(0.000001, 1.0, 6)    
+        
+    updatedSignal = pyqtSignal()    
+    
+    def __init__(self, videoAnalyzer):
+        super().__init__()
+
+        self.videoAnalyzer = videoAnalyzer
+        self.__layout()
+
+    
+    def __layout(self):
+        self.setFixedWidth(300)
+        hbox = QHBoxLayout()
+        hbox.setSpacing(5)
+        leftFormLayout = QFormLayout()    
+        
+        self.movementThresholdLineEdit = QLineEdit("0,001", parent=self)
+        self.movementThresholdLineEdit.setMaximumWidth(40)
+        self.movementThresholdLineEdit.setValidator(self.__movementThresholdValidator)
+        leftFormLayout.addRow(QLabel("Threshold:",parent=self),self.movementThresholdLineEdit)     
+        
+        self.kernelSizeLineEdit = QLineEdit("5",parent=self)
+        self.kernelSizeLineEdit.setMaximumWidth(40)   
+        self.kernelSizeLineEdit.setValidator(self.__kernerValidator)        
+        leftFormLayout.addRow(QLabel("Kernel:",parent=self),self.kernelSizeLineEdit)           
+        
+        self.backendComboBox = QComboBox(parent=self)
+        self.backendComboBox.addItems(list(BACKENDS))
+        self.backendComboBox.setCurrentText(self.videoAnalyzer.backend)
+        self.backendComboBox.setToolTip('Background model: mog2 is the most accurate, difference the fastest')
+        leftFormLayout.addRow(QLabel("Model:",parent=self),self.backendComboBox)           
+        
+        middleFormLayout = QFormLayout() 
+        self.historyLineEdit = QLineEdit("100",parent=self)
+        self.historyLineEdit.setMaximumWidth(40)
+        self.historyLineEdit.setValidator(self.__historyValidator)           
+        middleFormLayout.addRow(QLabel("History:",parent=self),self.historyLineEdit)      
+        
+        self.complexityReductionThresholdLineEdit = QLineEdit("0,05",parent=self)
+        self.complexityReductionThresholdLineEdit.setMaximumWidth(40)
+        self.complexityReductionThresholdLineEdit.setValidator(self.__complexityThresholdValidator)           
+        middleFormLayout.addRow(QLabel("CRT:",parent=self),self.complexityReductionThresholdLineEdit)            
+        
+        rightFormLayout = QFormLayout()   
+         
+        self.mixtureLineEdit = QLineEdit("5",parent=self)
+        self.mixtureLineEdit.setMaximumWidth(40)
+        self.mixtureLineEdit.setValidator(self.__mixtureValidator)              
+        rightFormLayout.addRow(QLabel("Mixtures:",parent=self),self.mixtureLineEdit) 
+        
+        self.backgroundRatioLineEdit = QLineEdit("0,8",parent=self)
+        self.backgroundRatioLineEdit.setMaximumWidth(40)
+        self.backgroundRatioLineEdit.setValidator(self.__backgroundRatioValidator)           
+        rightFormLayout.addRow(QLabel("Bg ratio:",parent=self),self.backgroundRatioLineEdit)         
+   
+        hbox.addLayout(leftFormLayout)
+
+        hbox.addLayout(middleFormLayout)   
+       
+        hbox.addLayout(rightFormLayout)
+        
+        self.movementThresholdLineEdit.textChanged.connect( lambda t: self.updateSettings(self.movementThresholdLineEdit,self.videoAnalyzer,'movement_threshold','updateParameters') )
+        self.kernelSizeLineEdit.textChanged.connect( lambda t: self.updateSettings(self.kernelSizeLineEdit,self.videoAnalyzer,'open_kernel_size','updateParameters')  )        
+        self.historyLineEdit.textChanged.connect( lambda t: self.updateSettings(self.historyLineEdit,self.videoAnalyzer,'history','updateParameters') )
+        self.complexityReductionThresholdLineEdit.textChanged.connect( lambda t: self.updateSettings(self.complexityReductionThresholdLineEdit,self.videoAnalyzer,'complexity_reduction_threshold','updateParameters')  )           
+        self.mixtureLineEdit.textChanged.connect( lambda t: self.updateSettings(self.mixtureLineEdit,self.videoAnalyzer,'mixtures','updateParameters')  ) 
+        self.backgroundRatioLineEdit.textChanged.connect( lambda t: self.updateSettings(self.backgroundRatioLineEdit,self.videoAnalyzer,'background_ratio','updateParameters')  )
+        self.backendComboBox.currentTextChanged.connect(self.updateBackend)
+        
+        self.setLayout(hbox)
+        
+    def allSettingsValid(self):
+        for setting in self.findChildren(QLineEdit):
+            if setting.validator().validate(setting.text(), 0)[0] != QtGui.QValidator.Acceptable:
+                return False        
+        return True
+        
+    def updateBackend(self, backend):
+        self.videoAnalyzer.backend = backend
+        self.videoAnalyzer.updateParameters()
+        self.updatedSignal.emit()
+        
+    def updateSettings(self, source, target, setting, update_function_name=None):
+        
+        validator = source.validator() 
+        color = '#f6989d'
+      
+        if validator.validate(source.text(), 0)[0] == QtGui.QValidator.Acceptable:
+            color = 'white'
+            setattr( target, setting, float( source.text().replace(',', '.')))     
+
+        update_function = getattr(target, update_function_name)
+        source.setStyleSheet('QLineEdit { background-color: %s }'%color)
+        update_function()
+        self.updatedSignal.emit()
+        
+    
+class VideoThread(QThread):
+    """
+        Plays a video while analyzing it. Frames are presented at deadlines
+        computed from their positions with a monotonic clock. While paused or
+        at the end of the video the thread blocks on a condition until it is
+        resumed, moved or stopped.
+        
+        Every frame is analyzed, but a preview is rendered at most display_fps
+        times per second, downscaled to the preview size before the movement
+        overlay is drawn. A frame already late by more than a frame period is
+        not rendered, at most MAX_SKIPPED_RENDERS times in a row, so playback
+        stays in sync whenever the analysis keeps up. If playback falls more
+        than RESYNC_SECONDS behind, the schedule is restarted from the current
+        frame. Moves requested with changePosition are made by the thread
+        itself, never by the GUI thread, and a newer move or a stop ends a
+        move in progress. The latest preview is kept for the GUI thread,
+        which is notified by previewReady and takes it with takePreview;
+        previews rendered before the GUI thread takes the pending one replace
+        it.
+    """
+    previewReady = pyqtSignal()
+    changecurrentTime = pyqtSignal([float])   
+    
+    MAX_SKIPPED_RENDERS = 10
+    RESYNC_SECONDS = 1.0
+    DISPLAY_FPS = 30
+    #Milliseconds waited for the thread to return when stopped
+    STOP_TIMEOUT = 5000
+    
+    def __init__(self, parent=None ):
+        QThread.__init__(self, parent=parent)
+        self.jump_to_position = -1
+        self.videoReader = None
+        self.videoAnalyzer = None
+        self.paused = False
+        self.endOfVideo = False
+        self.stopped = False
+        self.restart = True
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.timer = StageTimer()
+        self.display_fps = VideoThread.DISPLAY_FPS
+        self.preview_size = (1920, 1080)
+        self.preview = None
+        self.previewLock = threading.Lock()
+        
+    def setPreviewSize(self, width, height):
+        self.preview_size = (max(1, width), max(1, height))
+        
+    def takePreview(self):
+        """
+        Returns the latest (original, processed, frame, mask) preview not yet
+        taken, or None. The images refer to the data of the arrays.
+        """
+        with self.previewLock:
+            preview = self.preview
+            self.preview = None
+            return preview
+            
+    def renderPreview(self, frame, foreground_mask, movement):
+        """
+        Renders the frame and its foreground mask downscaled to the preview
+        size, with the moving regions outlined, and hands them to the GUI
+        thread.
+        """
+        height, width = foreground_mask.shape
+        scale = min(1.0, self.preview_size[0] / float(width), self.preview_size[1] / float(height))
+        if scale < 1.0:
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            foreground_mask = cv2.resize(foreground_mask, size, interpolation=cv2.INTER_NEAREST)
+        else:
+            #The frame belongs to the buffer ring of the reader
+            frame = frame.copy()
+            
+        if movement:
+            contours = cv2.findContours(foreground_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+            for cnt in contours:
+                x,y,w,h = cv2.boundingRect(cnt)
+                cv2.rectangle(frame,(x,y),(x+w,y+h),(0,255,0),2)
+                
+        height, width = foreground_mask.shape
+        originalImage = QImage(frame.data, width, height, frame.strides[0], QImage.Format_RGB888)
+        processedImage = QImage(foreground_mask.data, width, height, foreground_mask.strides[0], QImage.Format_Grayscale8)
+        with self.previewLock:
+            pending = self.preview is not None
+            self.preview = (originalImage, processedImage, frame, foreground_mask)
+        if not pending:
+            self.previewReady.emit()
+
+    def openVideo(self, videoReader, videoAnalyzer):
+        """
+        Plays the given video. A running thread is stopped and the reader of
+        the previous video closed once the thread no longer reads from it;
+        the thread has to be started again.
+        """
+        self.closeVideo()
+        with self.condition:
+            self.videoReader = videoReader
+            self.videoAnalyzer = videoAnalyzer
+            self.endOfVideo = False
+            self.stopped = False
+            self.restart = True
+            self.condition.notify_all()
+
+    def pause(self):
+        with self.condition:
+            self.paused = True 
+        
+    def play(self):
+        with self.condition:
+            self.paused = False         
+            self.restart = True
+            self.condition.notify_all()
+
+    def waitForFrame(self):
+        """
+        Blocks while there is no frame to play.
+        
+        Outputs:
+            jump:   Position to move to before the next frame, or a negative
+                    value. None if the thread has been stopped.
+        """
+        with self.condition:
+            while not self.stopped and (self.videoReader is None or self.paused or self.endOfVideo) and self.jump_to_position < 0:
+                self.condition.wait()
+            if self.stopped:
+                return None
+            jump = self.jump_to_position
+            self.jump_to_position = -1
+            if jump >= 0:
+                self.endOfVideo = False
+                self.restart = True
+            return jump
+
+    def run(self):
+
+        movementTracker = MovementTracker()        
+        timer = self.timer
+        skipped_renders = 0
+        
+        while True:
+            
+            jump = self.waitForFrame()
+            if jump is None:
+                return
+            if jump >= 0:
+                #A newer move or a stop ends a move forward early
+                self.videoReader.setPositionInSeconds(jump, lambda: self.stopped or self.jump_to_position >= 0)
+            
+            if self.restart:
+                self.restart = False
+                anchor_time = time.monotonic()
+                anchor_position = self.videoReader.currentPositionInSeconds()
+                frame_period = 1.0 / self.videoReader.fps if self.videoReader.fps > 0 else 0.0
+                next_render = anchor_time
+            
+            start_time = timer.now()
+            frame = self.videoReader.nextFrame()    
+            start_time = timer.record('read', start_time)
+            
+            if frame is None:
+                with self.condition:
+                    self.endOfVideo = True
+                continue
+            
+            deadline = anchor_time + self.videoReader.currentPositionInSeconds() - anchor_position
+            late = time.monotonic() - deadline > frame_period
+            
+            self.videoAnalyzer.timer = timer
+            foreground_mask, movement = self.videoAnalyzer.detectMovement(frame)
+            
+            start_time = timer.now()
+            movementTracker.update(movement, self.videoReader.currentPositionInSeconds())
+            start_time = timer.record('track', start_time)
+            
+            now = time.monotonic()
+            if self.paused or (now >= next_render and (not late or skipped_renders >= VideoThread.MAX_SKIPPED_RENDERS)):
+                next_render = now + 1.0 / self.display_fps
+                skipped_renders = 0
+                self.renderPreview(frame, foreground_mask, movement)
+                self.changecurrentTime.emit(round(self.videoReader.currentPositionInSeconds()))
+                timer.record('render', start_time)
+            elif now >= next_render:
+                self.dropped += 1
+                skipped_renders += 1
+            
+            wait_time = deadline - time.monotonic()
+            if wait_time > 0:
+                #Waiting on the condition lets a pause, move or stop interrupt the wait
+                with self.condition:
+                    self.condition.wait(wait_time)
+            elif -wait_time > VideoThread.RESYNC_SECONDS:
+                self.restart = True
+            
+    def changePosition(self,position):
+        with self.condition:
+            self.jump_to_position = position
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops the playback loop.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def closeVideo(self):
+        """
+        Stops the playback loop, waits for the thread to return and closes
+        the reader, so that the thread is never left reading a closed pipe.
+        """
+        self.stop()
+        if not self.wait(VideoThread.STOP_TIMEOUT):
+            super().terminate()
+            self.wait()
+        if self.videoReader is not None:
+            self.videoReader.close()
+            self.videoReader = None
+
+    def terminate(self):
+        self.closeVideo()
+        
+        
+        
+if __name__ == '__main__':
+    #Set up logging
+
+    #logging.config.fileConfig('logging.conf')
+    #logging.getLogger('eventLog').info("Testing")
+    app=0  
+
+    locale.setlocale(locale.LC_ALL, '') 
+    app = QApplication(sys.argv)
+    ex = MotionDetector()
+    app.exec_()
     #sys.exit(app.exec_())
\ No newline at end of file
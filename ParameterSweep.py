@@ -0,0 +1,273 @@
+"""
+Author: rciszek
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import time
+import numpy as np
+from VideoAnalyzer import FrameSeries, detectEvents
+from BatchProcessor import BatchProcessor, PROGRESS_INTERVAL
+from FrameTransport import SharedFrameRing, FrameTransport
+from JobManifest import JobManifest
+
+def expandGrid(grid, base=None):
+    """
+    Expands a parameter grid into a list of VideoAnalyzer parameter dicts.
+
+    Arguments:
+        grid:   Dict mapping parameter names to lists of values, or a list of
+                such dicts whose expansions are concatenated.
+        base:   Optional parameter dict supplying the parameters missing from
+                the grid.
+
+    Outputs:
+        configurations: List of parameter dicts.
+    """
+    if isinstance(grid, list):
+        return [configuration for g in grid for configuration in expandGrid(g, base)]
+    names = sorted(grid.keys())
+    values = [grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names]
+    configurations = []
+    for combination in itertools.product(*values):
+        configuration = dict(base or {})
+        configuration.update(zip(names, combination))
+        configurations.append(configuration)
+    return configurations
+
+def _analyzeFrames(videoAnalyzer, frameSubscriber, capacity):
+    frameSeries = FrameSeries(capacity)
+    seconds = 0.0
+    for index, position, frame in frameSubscriber.frames():
+        stage_time = time.perf_counter()
+        foreground_mask, ratio = videoAnalyzer.foregroundRatio(frame)
+        frameSeries.append(position, ratio)
+        seconds += time.perf_counter() - stage_time
+    return frameSeries, seconds
+
+def _analyzeGroup(processor, group, region_mask, frameSubscriber, capacity, results):
+    """
+    Analyzes the frames of a FrameSubscriber in a process of its own and puts
+    the group index, the times, the ratios and the analysis time into the
+    results queue.
+    """
+    videoAnalyzer = processor.createAnalyzer(processor.configurations[processor.groups[group][0]], region_mask=region_mask)
+    try:
+        frameSeries, seconds = _analyzeFrames(videoAnalyzer, frameSubscriber, capacity)
+    finally:
+        frameSubscriber.close()
+    results.put((group, frameSeries.times(), frameSeries.ratios(), seconds))
+
+
+class ParameterSweep(BatchProcessor):
+    """
+        Analyzes videos with several VideoAnalyzer configurations in a single
+        pass. Every frame is decoded once and passed to each configuration.
+        Configurations differing only by the movement threshold share one
+        background model, as the threshold is applied to the foreground ratio
+        only. The events of configuration i are written into the folder
+        target/config_<i>.
+
+        Arguments:
+            configurations: List of VideoAnalyzer parameter dicts.
+            target:         Folder into which the configuration folders are
+                            written.
+            analysis_width: Optional width into which the frames are
+                            downscaled before the analysis.
+            prefetch:       Depth of the queue of frames decoded ahead of the
+                            analysis.
+            min_duration:   Events shorter than this many seconds are dropped.
+            merge_gap:      Events separated by at most this many seconds are
+                            merged.
+            index_path:     Optional path of a VideoIndex database.
+            results_path:   Optional path of a ResultStore database into
+                            which the events of every configuration are
+                            written instead of the configuration folders.
+            group_processes: If True, every configuration group is analyzed
+                            in a process of its own. The frames are decoded
+                            once into a ring of RING_SLOTS frames in shared
+                            memory, from which the group processes read them
+                            without copying.
+    """
+
+    REPORT_FILE = 'configurations.json'
+    #Frames in the shared memory ring of group processes
+    RING_SLOTS = 16
+
+    def __init__(self, configurations, target, analysis_width=None, prefetch=4, min_duration=0.0, merge_gap=0.0, index_path=None, group_processes=False, results_path=None):
+        super().__init__(configurations[0], target, analysis_width, prefetch, min_duration=min_duration, merge_gap=merge_gap, index_path=index_path, results_path=results_path)
+        self.configurations = [dict(configuration) for configuration in configurations]
+        self.group_processes = group_processes
+        self.groups = self.groupConfigurations()
+        for i in range(0, len(self.configurations)):
+            os.makedirs(self.configurationFolder(i), exist_ok=True)
+
+    def groupConfigurations(self):
+        """
+        Groups the indices of configurations sharing a background model.
+        """
+        groups = {}
+        for i in range(0, len(self.configurations)):
+            key = tuple(sorted((k, v if isinstance(v, str) else float(v)) for k, v in self.configurations[i].items() if k != 'movement_threshold'))
+            groups.setdefault(key, []).append(i)
+        return list(groups.values())
+
+    def configurationFolder(self, index):
+        return os.path.join(self.target, 'config_%03d' % index)
+
+    def segmentFile(self, file_path):
+        return [(0.0, None, 0.0)]
+
+    def processFile(self, file_path, cancel=None, progress=None):
+        """
+        Detects the movement events of a single video file with every
+        configuration.
+
+        Outputs:
+            result:     Dict with the keys 'completed', 'frames', 'seconds',
+                        'decode_seconds', the time spent waiting for frames,
+                        and 'group_seconds', the analysis time of every
+                        configuration group.
+        """
+        file_path = file_path.replace('\\','/')
+        file_name = self.outputName(file_path)
+        result = dict(completed = False, frames = 0, seconds = 0.0, decode_seconds = 0.0, group_seconds = [0.0] * len(self.groups))
+
+        if file_name is None or (cancel is not None and cancel.is_set()):
+            return result
+        if self.group_processes and len(self.groups) > 1:
+            return self.processShared(file_path, file_name, result, cancel, progress)
+
+        begin_time = time.perf_counter()
+        videoReader, region = self.openVideo(file_path)
+        videoAnalyzers = [self.createAnalyzer(self.configurations[group[0]], videoReader, region) for group in self.groups]
+        frameSeries = [FrameSeries(videoReader.frames + 1) for group in self.groups]
+
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    break
+
+                stage_time = time.perf_counter()
+                frame = videoReader.nextFrame()
+                result['decode_seconds'] += time.perf_counter() - stage_time
+
+                if frame is None:
+                    result['completed'] = True
+                    break
+
+                position = videoReader.currentPositionInSeconds()
+                for g in range(0, len(self.groups)):
+                    stage_time = time.perf_counter()
+                    foreground_mask, ratio = videoAnalyzers[g].foregroundRatio(frame)
+                    frameSeries[g].append(position, ratio)
+                    result['group_seconds'][g] += time.perf_counter() - stage_time
+                result['frames'] += 1
+                if progress is not None and result['frames'] % PROGRESS_INTERVAL == 0:
+                    progress(PROGRESS_INTERVAL)
+        finally:
+            videoReader.close()
+
+        if result['completed']:
+            self.writeConfigurationEvents(file_path, file_name, [(frameSeries[g].times(), frameSeries[g].ratios()) for g in range(0, len(self.groups))])
+
+        result['seconds'] = time.perf_counter() - begin_time
+        return result
+
+    def processShared(self, file_path, file_name, result, cancel=None, progress=None):
+        """
+        Detects the movement events of a single video file with every
+        configuration group in a process of its own, fed through a
+        FrameTransport by this process. Decoding waits for the slowest
+        group once it is a full ring behind.
+        """
+        begin_time = time.perf_counter()
+        videoReader, region = self.openVideo(file_path, prefetch=0)
+        region_mask = self.regionMask(videoReader, region)
+        frameTransport = FrameTransport(SharedFrameRing(videoReader.frameShape(), ParameterSweep.RING_SLOTS), len(self.groups))
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_analyzeGroup, args=(self, g, region_mask, frameTransport.subscriber(g), videoReader.frames + 1, results), daemon=True)
+                     for g in range(0, len(self.groups))]
+        series = {}
+
+        def reportProgress(index):
+            if progress is not None and (index + 1) % PROGRESS_INTERVAL == 0:
+                progress(PROGRESS_INTERVAL)
+
+        try:
+            for process in processes:
+                process.start()
+            stage_time = time.perf_counter()
+            result['completed'] = frameTransport.publish(videoReader, cancel, reportProgress, lambda: all(p.is_alive() for p in processes))
+            result['decode_seconds'] = time.perf_counter() - stage_time - frameTransport.wait_seconds
+            result['frames'] = int(round(videoReader.currentPositionInFrames))
+            while len(series) < len(processes):
+                try:
+                    g, times, ratios, seconds = results.get(timeout=FrameTransport.WAIT_PERIOD)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in processes) and results.empty():
+                        raise RuntimeError("A configuration group process failed")
+                    continue
+                series[g] = (times, ratios)
+                result['group_seconds'][g] = seconds
+        finally:
+            videoReader.close()
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            frameTransport.close()
+            results.close()
+
+        if result['completed']:
+            self.writeConfigurationEvents(file_path, file_name, [series[g] for g in range(0, len(self.groups))])
+
+        result['seconds'] = time.perf_counter() - begin_time
+        return result
+
+    def writeConfigurationEvents(self, file_path, file_name, series):
+        """
+        Writes the events of every configuration, given the (times, ratios)
+        series of every configuration group. With a results store, the events
+        of every configuration are written in a single transaction.
+        """
+        detections = []
+        for g in range(0, len(self.groups)):
+            times, ratios = series[g]
+            for i in self.groups[g]:
+                events = detectEvents(times, ratios > self.configurations[i]['movement_threshold'], self.min_duration, self.merge_gap)
+                if self.resultStore is not None:
+                    detections.append((self.resultSettings(self.configurations[i]), events))
+                else:
+                    np.savetxt(self.configurationFolder(i) + "/" + file_name + ".csv", events, delimiter=",", fmt='%.2f')
+        if detections:
+            self.resultStore.addEvents(file_path, file_name, detections)
+
+    def writeReport(self, results):
+        """
+        Writes the configurations and their analysis costs into the target
+        folder.
+
+        Arguments:
+            results:    Dict mapping file paths to the results of processFile.
+
+        Outputs:
+            report:     The written report as a dict.
+        """
+        frames = sum(r['frames'] for r in results.values())
+        decode_seconds = sum(r['decode_seconds'] for r in results.values())
+        configurations = []
+        for g in range(0, len(self.groups)):
+            group_seconds = sum(r['group_seconds'][g] for r in results.values())
+            for i in self.groups[g]:
+                configurations.append(dict( index = i, folder = os.path.basename(self.configurationFolder(i)), parameters = self.configurations[i],
+                                            analysis_seconds = round(group_seconds, 3), shared_with = [j for j in self.groups[g] if j != i],
+                                            frames_per_second = round(frames / group_seconds, 1) if group_seconds > 0 else 0.0,
+                                            settings = JobManifest.settingsKey(self.resultSettings(self.configurations[i])) ))
+        configurations.sort(key=lambda c: c['index'])
+        report = dict( frames = frames, decode_seconds = round(decode_seconds, 3), configurations = configurations )
+        with open(os.path.join(self.target, ParameterSweep.REPORT_FILE), 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
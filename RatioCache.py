@@ -0,0 +1,73 @@
+"""
+Author: rciszek
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+class RatioCache:
+    """
+        Persists the per-frame foreground ratio series of analyzed videos, so
+        that the movement threshold can be changed without decoding the
+        videos and running the background model again.
+
+        Series are keyed by the fingerprint of the video file (path, size and
+        modification time) and by every analysis setting except the movement
+        threshold, which is applied only when the events are derived. Ratios
+        are stored as float64, the type the live analysis compares with the
+        threshold, so events derived from the cache equal those of the live
+        analysis.
+
+        Arguments:
+            folder:     Folder in which the series are stored.
+    """
+
+    IGNORED_PARAMETERS = ('movement_threshold',)
+    #Changed whenever the stored series change, so that older series are not used
+    FORMAT = 2
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, file_path, parameters, settings=None):
+        """
+        Returns the cache key of the given video and analysis settings.
+
+        Arguments:
+            file_path:  Path of the video file.
+            parameters: VideoAnalyzer parameters.
+            settings:   Optional dict of other settings affecting the ratios,
+                        such as the analysis width.
+        """
+        stat = os.stat(file_path)
+        fingerprint = dict( format = RatioCache.FORMAT, path = os.path.abspath(file_path).replace('\\','/'), size = stat.st_size, mtime = stat.st_mtime_ns,
+                            parameters = { k : v if isinstance(v, str) else float(v) for k, v in parameters.items() if k not in RatioCache.IGNORED_PARAMETERS },
+                            settings = settings or {} )
+        return hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.npz')
+
+    def load(self, key):
+        """
+        Returns the cached (times, ratios) series of the key or None.
+        """
+        try:
+            with np.load(self.path(key)) as series:
+                return series['times'], series['ratios']
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def contains(self, key):
+        return os.path.isfile(self.path(key))
+
+    def store(self, key, times, ratios):
+        """
+        Stores the series of the key. Times and ratios are stored as float64.
+        """
+        temporary_path = self.path(key) + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, times = np.asarray(times, dtype=np.float64), ratios = np.asarray(ratios, dtype=np.float64))
+        os.replace(temporary_path, self.path(key))
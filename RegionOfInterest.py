@@ -0,0 +1,86 @@
+"""
+Author: rciszek
+"""
+import json
+import os
+import cv2
+import numpy as np
+
+REGION_FILE = 'roi.json'
+REGION_SUFFIX = '.roi.json'
+
+class RegionOfInterest:
+    """
+        Region of a video in which movement is detected. Coordinates are
+        given in the pixels of the source video.
+
+        A region is defined in a JSON file, either next to the video as
+        <video name>.roi.json or as roi.json in the folder of the video or in
+        any of its parent folders. The nearest definition is used. Example:
+
+            { "crop": [100, 50, 640, 480],
+              "polygon": [[120, 60], [700, 60], [700, 500], [120, 500]] }
+
+        Arguments:
+            crop:       Optional [x, y, width, height] rectangle. The frames
+                        are cropped by ffmpeg, so pixels outside it are never
+                        piped or analyzed.
+            polygon:    Optional list of [x, y] vertices. Only foreground
+                        pixels inside the polygon are counted.
+    """
+
+    def __init__(self, crop=None, polygon=None):
+        self.crop = tuple(int(v) for v in crop) if crop is not None else None
+        self.polygon = [(float(x), float(y)) for x, y in polygon] if polygon is not None else None
+
+    def toDict(self):
+        return dict( crop = list(self.crop) if self.crop is not None else None, polygon = [list(p) for p in self.polygon] if self.polygon is not None else None )
+
+    def createMask(self, frame_width, frame_height, source_width, source_height, crop=None):
+        """
+        Rasterizes the polygon into a mask matching the analyzed frames.
+
+        Arguments:
+            frame_width:    Width of the analyzed frames.
+            frame_height:   Height of the analyzed frames.
+            source_width:   Width of the source video.
+            source_height:  Height of the source video.
+            crop:           The (x, y, width, height) rectangle the frames
+                            were actually cropped to, as clipped to the video
+                            by VideoReader, or None if they were not cropped.
+
+        Outputs:
+            mask:           uint8 mask with 255 inside the polygon, or None if
+                            the region has no polygon.
+        """
+        if self.polygon is None:
+            return None
+        x, y, width, height = crop if crop is not None else (0, 0, source_width, source_height)
+        scale_x = frame_width / float(width)
+        scale_y = frame_height / float(height)
+        points = np.array([[(px - x) * scale_x, (py - y) * scale_y] for px, py in self.polygon], dtype=np.float64)
+        mask = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(points).astype(np.int32)], 255)
+        return mask
+
+
+def loadRegion(file_path):
+    """
+    Returns the region of interest defined for the given video or None.
+    """
+    file_path = os.path.abspath(file_path)
+    candidates = [os.path.splitext(file_path)[0] + REGION_SUFFIX]
+    folder = os.path.dirname(file_path)
+    while True:
+        candidates.append(os.path.join(folder, REGION_FILE))
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            with open(candidate) as f:
+                definition = json.load(f)
+            return RegionOfInterest(definition.get('crop'), definition.get('polygon'))
+    return None
@@ -0,0 +1,308 @@
+"""
+Author: rciszek
+
+Consolidated store of the movement events of every analyzed video.
+
+Usage:
+    python ResultStore.py STORE events [--file NAME] [--start S] [--end S] [--settings KEY]
+    python ResultStore.py STORE summary [--min-events N] [--settings KEY]
+    python ResultStore.py STORE settings
+    python ResultStore.py STORE export-csv FOLDER [--settings KEY]
+    python ResultStore.py STORE export-parquet FILE [--settings KEY]
+
+Query results are printed as lines of JSON.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import numpy as np
+from JobManifest import JobManifest
+
+class ResultStore:
+    """
+        SQLite database of the movement events of every analyzed video,
+        replacing the event file of every video. The events of a video are
+        written in a single transaction once its analysis is complete,
+        replacing any earlier events of the video with the same settings.
+        Every analysis is recorded, so videos without events are told apart
+        from videos not analyzed.
+
+        Every event is stored with the video it belongs to, the hash of the
+        settings it was detected with, and its start, end and duration in
+        seconds, and is indexed by video and time, so questions spanning the
+        whole archive are answered by a single query. The event files of
+        earlier versions can still be exported from the store.
+
+        Every thread opens a connection of its own, and the store holds only
+        the path of the database when pickled, so it can be passed to worker
+        processes.
+
+        Arguments:
+            path:   Path of the SQLite file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self):
+        """
+        Returns the connection of the store for the calling thread, creating
+        the database if needed.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS files (
+                                      id INTEGER PRIMARY KEY, path TEXT UNIQUE, name TEXT, size INTEGER, mtime INTEGER)''')
+            connection.execute('''CREATE TABLE IF NOT EXISTS settings (
+                                      key TEXT PRIMARY KEY, settings TEXT)''')
+            connection.execute('''CREATE TABLE IF NOT EXISTS analyses (
+                                      file INTEGER, settings TEXT, written REAL, PRIMARY KEY (file, settings))''')
+            connection.execute('''CREATE TABLE IF NOT EXISTS events (
+                                      file INTEGER, settings TEXT, start REAL, end REAL, duration REAL)''')
+            connection.execute('CREATE INDEX IF NOT EXISTS files_name ON files (name)')
+            connection.execute('CREATE INDEX IF NOT EXISTS events_file ON events (file, settings, start)')
+            connection.execute('CREATE INDEX IF NOT EXISTS events_start ON events (start)')
+            connection.commit()
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def addEvents(self, file_path, name, detections):
+        """
+        Stores the events of a video detected with one or more settings.
+
+        Arguments:
+            file_path:  Path of the video file.
+            name:       Output name of the video.
+            detections: List of (settings, events) tuples, where settings is
+                        a dict of every setting affecting the events and
+                        events an array of [start, end] rows.
+        """
+        try:
+            stat = os.stat(file_path)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime = None, None
+        path = JobManifest.key(file_path)
+        now = time.time()
+        connection = self.connect()
+        with connection:
+            connection.execute('INSERT OR IGNORE INTO files (path) VALUES (?)', (path,))
+            connection.execute('UPDATE files SET name = ?, size = ?, mtime = ? WHERE path = ?', (name, size, mtime, path))
+            file_id = connection.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()[0]
+            for settings, events in detections:
+                key = JobManifest.settingsKey(settings)
+                connection.execute('INSERT OR IGNORE INTO settings VALUES (?, ?)', (key, json.dumps(settings, sort_keys=True)))
+                connection.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?)', (file_id, key, now))
+                connection.execute('DELETE FROM events WHERE file = ? AND settings = ?', (file_id, key))
+                connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?)',
+                                       [(file_id, key, float(start), float(end), float(end - start)) for start, end in np.reshape(events, (-1, 2))])
+
+    def analyzed(self, settings):
+        """
+        Returns the set of paths of the videos analyzed with the given
+        settings dict or key.
+        """
+        conditions = []
+        arguments = []
+        self.settingsFilter('analyses.settings', settings, conditions, arguments)
+        rows = self.connect().execute('SELECT files.path FROM analyses JOIN files ON files.id = analyses.file WHERE ' + ' AND '.join(conditions), arguments)
+        return set(path for path, in rows)
+
+    def settings(self):
+        """
+        Returns the settings stored, as dicts with the keys 'key', 'settings'
+        and 'files', the number of videos analyzed with them.
+        """
+        rows = self.connect().execute('''SELECT settings.key, settings.settings, COUNT(analyses.file) FROM settings
+                                         LEFT JOIN analyses ON analyses.settings = settings.key GROUP BY settings.key ORDER BY settings.key''')
+        return [dict( key = key, settings = json.loads(settings), files = count ) for key, settings, count in rows]
+
+    def settingsFilter(self, column, settings, conditions, arguments):
+        """
+        Adds the condition selecting the rows of the given settings, which
+        may be a settings dict or its key.
+        """
+        if settings is None:
+            return
+        conditions.append(column + ' = ?')
+        arguments.append(settings if isinstance(settings, str) else JobManifest.settingsKey(settings))
+
+    def events(self, name=None, start=None, end=None, settings=None, min_duration=None):
+        """
+        Returns the stored events matching the given criteria.
+
+        Arguments:
+            name:           Optional output name or path of a video.
+            start:          Optional time in seconds. Only events ending after
+                            it are returned.
+            end:            Optional time in seconds. Only events starting
+                            before it are returned.
+            settings:       Optional settings dict or key.
+            min_duration:   Optional minimum duration in seconds.
+
+        Outputs:
+            events:     List of dicts with the keys 'file', 'name',
+                        'settings', 'start', 'end' and 'duration', ordered by
+                        video and time.
+        """
+        conditions = []
+        arguments = []
+        if name is not None:
+            conditions.append('(files.name = ? OR files.path = ?)')
+            arguments.extend([name, JobManifest.key(name)])
+        if start is not None:
+            conditions.append('events.end > ?')
+            arguments.append(start)
+        if end is not None:
+            conditions.append('events.start < ?')
+            arguments.append(end)
+        if min_duration is not None:
+            conditions.append('events.duration >= ?')
+            arguments.append(min_duration)
+        self.settingsFilter('events.settings', settings, conditions, arguments)
+        rows = self.connect().execute('''SELECT files.path, files.name, events.settings, events.start, events.end, events.duration
+                                         FROM events JOIN files ON files.id = events.file %s ORDER BY files.path, events.start'''
+                                      % ('WHERE ' + ' AND '.join(conditions) if conditions else ''), arguments)
+        return [dict( file = path, name = name, settings = key, start = start, end = end, duration = duration )
+                for path, name, key, start, end, duration in rows]
+
+    def summary(self, settings=None, min_events=None):
+        """
+        Returns the number of events and the total movement time of every
+        analyzed video.
+
+        Arguments:
+            settings:       Optional settings dict or key.
+            min_events:     Optional minimum number of events of the videos
+                            returned.
+
+        Outputs:
+            summary:    List of dicts with the keys 'file', 'name',
+                        'settings', 'events' and 'movement_seconds'.
+        """
+        conditions = []
+        arguments = []
+        self.settingsFilter('analyses.settings', settings, conditions, arguments)
+        having = ''
+        if min_events is not None:
+            having = 'HAVING COUNT(events.start) >= ?'
+            arguments.append(min_events)
+        rows = self.connect().execute('''SELECT files.path, files.name, analyses.settings, COUNT(events.start), COALESCE(SUM(events.duration), 0)
+                                         FROM analyses JOIN files ON files.id = analyses.file
+                                         LEFT JOIN events ON events.file = analyses.file AND events.settings = analyses.settings %s
+                                         GROUP BY analyses.file, analyses.settings %s ORDER BY files.path'''
+                                      % ('WHERE ' + ' AND '.join(conditions) if conditions else '', having), arguments)
+        return [dict( file = path, name = name, settings = key, events = count, movement_seconds = round(seconds, 2) )
+                for path, name, key, count, seconds in rows]
+
+    def exportCsv(self, folder, settings=None):
+        """
+        Writes the events of every video analyzed with the given settings
+        into folder/<name>.csv in the format of the event files.
+
+        Arguments:
+            folder:     Folder into which the files are written.
+            settings:   Settings dict or key. May be omitted if the store
+                        holds events of a single setting only.
+
+        Outputs:
+            files:      The number of files written.
+        """
+        if settings is None:
+            keys = [s['key'] for s in self.settings()]
+            if len(keys) > 1:
+                raise ValueError("The store holds several settings; select one of: %s" % ', '.join(keys))
+            if not keys:
+                return 0
+            settings = keys[0]
+        os.makedirs(folder, exist_ok=True)
+        events = {}
+        for video in self.summary(settings):
+            events[video['name']] = []
+        for event in self.events(settings=settings):
+            events[event['name']].append([event['start'], event['end']])
+        for name, rows in events.items():
+            np.savetxt(os.path.join(folder, name + '.csv'), np.array(rows).reshape(-1, 2), delimiter=",", fmt='%.2f')
+        return len(events)
+
+    def exportParquet(self, path, settings=None):
+        """
+        Writes the events, optionally of the given settings only, into a
+        Parquet file with the columns of events. Requires pyarrow.
+        """
+        import pyarrow
+        import pyarrow.parquet
+        events = self.events(settings=settings)
+        table = pyarrow.table({ column : [event[column] for event in events] for column in ('file', 'name', 'settings', 'start', 'end', 'duration') })
+        pyarrow.parquet.write_table(table, path)
+        return len(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Queries and exports the events of a results store.')
+    parser.add_argument('store', help='Path of the results store.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    events = commands.add_parser('events', help='Prints the matching events.')
+    events.add_argument('--file', default=None, help='Output name or path of a video.')
+    events.add_argument('--start', type=float, default=None, help='Only events ending after this many seconds.')
+    events.add_argument('--end', type=float, default=None, help='Only events starting before this many seconds.')
+    events.add_argument('--min-duration', type=float, default=None, help='Only events lasting at least this many seconds.')
+    summary = commands.add_parser('summary', help='Prints the number of events and the movement time of every video.')
+    summary.add_argument('--min-events', type=int, default=None, help='Only videos with at least this many events.')
+    commands.add_parser('settings', help='Prints the settings of the stored events.')
+    export_csv = commands.add_parser('export-csv', help='Writes an event file for every video.')
+    export_csv.add_argument('folder', help='Folder into which the event files are written.')
+    export_parquet = commands.add_parser('export-parquet', help='Writes the events into a Parquet file.')
+    export_parquet.add_argument('file', help='Path of the Parquet file.')
+    for command in (events, summary, export_csv, export_parquet):
+        command.add_argument('--settings', default=None, help='Key of the settings, as printed by the settings command.')
+    arguments = parser.parse_args(argv)
+
+    if not os.path.isfile(arguments.store):
+        print("Results store not found: %s" % arguments.store, file=sys.stderr)
+        return 1
+    resultStore = ResultStore(arguments.store)
+    if arguments.command == 'events':
+        rows = resultStore.events(arguments.file, arguments.start, arguments.end, arguments.settings, arguments.min_duration)
+    elif arguments.command == 'summary':
+        rows = resultStore.summary(arguments.settings, arguments.min_events)
+    elif arguments.command == 'settings':
+        rows = resultStore.settings()
+    else:
+        try:
+            if arguments.command == 'export-csv':
+                count = resultStore.exportCsv(arguments.folder, arguments.settings)
+            else:
+                count = resultStore.exportParquet(arguments.file, arguments.settings)
+        except (ValueError, ImportError) as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        rows = [dict( written = count )]
+    for row in rows:
+        print(json.dumps(row))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Author: rciszek
+"""
+import collections
+import threading
+import numpy as np
+from VideoReader import VideoReader
+
+class ThumbnailCache:
+    """
+        Least recently used cache of decoded thumbnails.
+
+        Arguments:
+            capacity:   The number of thumbnails kept.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = max(1, int(capacity))
+        self.thumbnails = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            thumbnail = self.thumbnails.get(key)
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(key)
+            return thumbnail
+
+    def put(self, key, thumbnail):
+        with self.lock:
+            self.thumbnails[key] = thumbnail
+            self.thumbnails.move_to_end(key)
+            while len(self.thumbnails) > self.capacity:
+                self.thumbnails.popitem(last=False)
+
+
+class ScrubPreview:
+    """
+        Serves low resolution previews of a video while its position is being
+        dragged, without touching the playback decoder. Positions are snapped
+        to the preceding keyframe, which ffmpeg reaches without decoding any
+        other frame, so a thumbnail costs the decoding of a single frame and
+        is shared by every position up to the next keyframe.
+
+        Requests are coalesced: a single worker thread decodes thumbnails,
+        and a request made while the worker is busy replaces any request
+        still waiting, so only the latest position is decoded. The keyframe
+        index is built by the worker on start.
+
+        Arguments:
+            file_path:  Path of the video file.
+            properties: (width, height, fps, duration, frames) of the video.
+            width:      Width of the thumbnails.
+            capacity:   The number of thumbnails cached.
+    """
+
+    def __init__(self, file_path, properties, width=160, capacity=256):
+        self.file_path = file_path
+        self.properties = properties
+        self.width = width
+        self.thumbnailCache = ThumbnailCache(capacity)
+        self.keyframes = None
+        self.pending = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.serveRequests, daemon=True)
+        self.thread.start()
+
+    def keyframeTime(self, position):
+        """
+        Returns the time of the keyframe at or before the position, or the
+        position rounded to a second if the keyframes are not known.
+        """
+        keyframes = self.keyframes
+        if keyframes is None or len(keyframes) == 0:
+            return float(round(position))
+        index = max(0, int(np.searchsorted(keyframes, position, side='right')) - 1)
+        return float(keyframes[index])
+
+    def request(self, position, callback):
+        """
+        Requests the thumbnail of the given position. The callback receives
+        the position and the RGB thumbnail, immediately if it is cached and
+        otherwise from the worker thread.
+        """
+        thumbnail = self.thumbnailCache.get(self.keyframeTime(position))
+        if thumbnail is not None:
+            callback(position, thumbnail)
+            return
+        with self.condition:
+            self.pending = (position, callback)
+            self.condition.notify()
+
+    def stop(self):
+        """
+        Stops the worker thread. No callback is called after stop returns,
+        except one already running.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def serveRequests(self):
+        try:
+            self.keyframes = VideoReader.getKeyframeTimes(self.file_path)
+        except (OSError, ValueError):
+            self.keyframes = np.empty(0)
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                position, callback = self.pending
+                self.pending = None
+            key = self.keyframeTime(position)
+            thumbnail = self.thumbnailCache.get(key)
+            if thumbnail is None:
+                thumbnail = self.decodeThumbnail(key)
+                if thumbnail is None:
+                    continue
+                self.thumbnailCache.put(key, thumbnail)
+            with self.condition:
+                #The owner of the callback may be gone once stopped
+                if self.stopped:
+                    return
+            callback(position, thumbnail)
+
+    def decodeThumbnail(self, position):
+        videoReader = VideoReader(self.file_path, target_width=self.width, position=position, properties=self.properties)
+        try:
+            return videoReader.nextFrame()
+        finally:
+            videoReader.close()
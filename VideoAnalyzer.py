@@ -1,103 +1,298 @@
-"""
-Author: rciszek
-"""
-import cv2
-import numpy as np
-
-class VideoAnalyzer:
-    """
-        Performs analyses on video frames.
-        
-        Arguments:
-            movement_threshold:             Threshold for the ratio of changed pixels between 
-                                            frames. If the ratio is exceeded, the frame is
-                                            concluded to contain movement.
-            open_kernel_size:               Size of the opening kernel used for removing small 
-                                            changes such as noise from the frame.
-            history:                        The number of past frames included in the analysis.
-            mixtures:                       The number of mixtures used for foreground segmentation.
-            background_ratio:               Background ratio parameter for foreground segmentation.
-            complexity_reduction_threshold: Complexity reduction threshold for foreground segmentation.       
-    """
-    
-    def __init__(self, movement_threshold=0.001, open_kernel_size=3, history = 100, mixtures=5, background_ratio = 0.8, complexity_reduction_threshold=0.05):
-        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
-        self.movement_threshold = movement_threshold
-        self.history = history
-        self.mixtures = mixtures
-        self.background_ratio = background_ratio
-        self.complexity_reduction_threshold = complexity_reduction_threshold
-        self.open_kernel_size = open_kernel_size
-        self.open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(open_kernel_size,open_kernel_size))
-        
-    def updateParameters(self):
-        """
-        Updates the foreground separator to take account the current settings.
-        """
-        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
-        self.fgbg.setHistory(int(self.history))
-        self.fgbg.setNMixtures(int(self.mixtures))
-        self.fgbg.setBackgroundRatio(float(self.background_ratio))
-        self.fgbg.setComplexityReductionThreshold(float(self.complexity_reduction_threshold))
-        self.open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(int(self.open_kernel_size),int(self.open_kernel_size)))
-        
-    def getParameters(self):
-        """
-        Return the current parameters as a dict.
-        """        
-        return dict( movement_threshold = self.movement_threshold, history = self.mixtures, mixtures = self.mixtures, background_ratio = self.background_ratio, open_kernel_size = self.open_kernel_size )
-        
-    def detectMovement(self, frame):
-        """
-        Detects movement from the given frame.
-        
-        Arguments:
-            frame: Videoframe
-            
-        Outputs:
-            foreground_mask: The input videoframe masked to highlight the 
-                             foreground object.
-            movement:        Boolean value indicating the presence of movement.
-        """
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        foreground_mask = self.fgbg.apply(frame,learningRate=-1)
-        foreground_mask = cv2.morphologyEx(foreground_mask, cv2.MORPH_OPEN, self.open_kernel)
-        
-        movement = False
-        
-        if self.movement_threshold < float(np.count_nonzero(foreground_mask)) / float((foreground_mask.shape[0]*foreground_mask.shape[1])):
-            movement = True
-            
-        return foreground_mask, movement
-
-class MovementTracker:
-    """
-    Encapsulates the tracking of movements.
-    """
-    def __init__(self):
-        self.events = []
-        self.previously_moving = False
-        self.startTime = 0
-        
-    def update(self, currently_moving, time):
-        """
-        Updates the current movement state
-        
-        Arguments:
-            currently_moving:   Boolean value indicating current movement state.
-            time:               Current time  
-        """
-        
-        if currently_moving == True and self.previously_moving == False:
-            self.previously_moving = True
-            self.startTime = time          
-        if currently_moving == False and self.previously_moving == True:         
-            self.events.append([self.startTime, time])
-            self.previously_moving = False
-            self.startTime = 0         
-            
-    def getEvents(self):
-        """
-        Returns the event array
-        """
-        return np.array(self.events)
+"""
+Author: rciszek
+"""
+import cv2
+import numpy as np
+from Instrumentation import StageTimer
+
+class MOG2Backend:
+    """
+    Gaussian mixture background model of OpenCV. The most accurate and the
+    most expensive backend.
+    """
+    def __init__(self, history=100, mixtures=5, background_ratio=0.8, complexity_reduction_threshold=0.05):
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self.fgbg.setHistory(int(history))
+        self.fgbg.setNMixtures(int(mixtures))
+        self.fgbg.setBackgroundRatio(float(background_ratio))
+        self.fgbg.setComplexityReductionThreshold(float(complexity_reduction_threshold))
+        
+    def apply(self, frame):
+        return self.fgbg.apply(frame,learningRate=-1)
+        
+class KNNBackend:
+    """
+    K-nearest neighbours background model of OpenCV.
+    """
+    def __init__(self, history=100, **parameters):
+        self.fgbg = cv2.createBackgroundSubtractorKNN(history=int(history), detectShadows=False)
+        
+    def apply(self, frame):
+        return self.fgbg.apply(frame,learningRate=-1)
+        
+class FrameDifferenceBackend:
+    """
+    Marks as foreground the pixels differing from the previous frame by more
+    than DIFFERENCE_THRESHOLD gray levels. The cheapest backend; only the
+    edges of moving objects are detected.
+    """
+    DIFFERENCE_THRESHOLD = 25
+    
+    def __init__(self, **parameters):
+        self.previous = None
+        
+    def apply(self, frame):
+        previous = self.previous
+        self.previous = frame.copy()
+        if previous is None or previous.shape != frame.shape:
+            return np.zeros(frame.shape, dtype=np.uint8)
+        difference = cv2.absdiff(frame, previous)
+        return cv2.threshold(difference, FrameDifferenceBackend.DIFFERENCE_THRESHOLD, 255, cv2.THRESH_BINARY)[1]
+        
+class RunningAverageBackend:
+    """
+    Exponential running average of the frames computed with NumPy. Pixels
+    differing from the average by more than DIFFERENCE_THRESHOLD gray levels
+    are foreground. The average adapts with the rate 1 / history.
+    """
+    DIFFERENCE_THRESHOLD = 25
+    
+    def __init__(self, history=100, **parameters):
+        self.rate = 1.0 / max(1.0, float(history))
+        self.average = None
+        
+    def apply(self, frame):
+        if self.average is None or self.average.shape != frame.shape:
+            self.average = frame.astype(np.float32)
+            return np.zeros(frame.shape, dtype=np.uint8)
+        difference = np.abs(frame - self.average)
+        self.average += self.rate * (frame - self.average)
+        return np.where(difference > RunningAverageBackend.DIFFERENCE_THRESHOLD, 255, 0).astype(np.uint8)
+
+#Background model backends by name, in the order they are offered
+BACKENDS = { 'mog2' : MOG2Backend, 'knn' : KNNBackend, 'difference' : FrameDifferenceBackend, 'average' : RunningAverageBackend }
+
+class VideoAnalyzer:
+    """
+        Performs analyses on video frames.
+        
+        Arguments:
+            movement_threshold:             Threshold for the ratio of changed pixels between 
+                                            frames. If the ratio is exceeded, the frame is
+                                            concluded to contain movement.
+            open_kernel_size:               Size of the opening kernel used for removing small 
+                                            changes such as noise from the frame.
+            history:                        The number of past frames included in the analysis.
+            mixtures:                       The number of mixtures used for foreground segmentation.
+            background_ratio:               Background ratio parameter for foreground segmentation.
+            complexity_reduction_threshold: Complexity reduction threshold for foreground segmentation.       
+            backend:                        Name of the background model in BACKENDS. The
+                                            mixture parameters apply to 'mog2' only, the
+                                            history to every backend but 'difference'.
+    """
+    
+    def __init__(self, movement_threshold=0.001, open_kernel_size=3, history = 100, mixtures=5, background_ratio = 0.8, complexity_reduction_threshold=0.05, backend='mog2'):
+        if backend not in BACKENDS:
+            raise ValueError("Unsupported backend: %s" % backend)
+        self.backend = backend
+        self.movement_threshold = movement_threshold
+        self.history = history
+        self.mixtures = mixtures
+        self.background_ratio = background_ratio
+        self.complexity_reduction_threshold = complexity_reduction_threshold
+        self.open_kernel_size = open_kernel_size
+        self.region_mask = None
+        self.region_area = 0
+        self.timer = StageTimer()
+        self.updateParameters()
+        
+    def setRegionMask(self, mask):
+        """
+        Restricts the movement ratio to the nonzero pixels of the given mask.
+        
+        Arguments:
+            mask: uint8 mask of the frame size or None to use the whole frame.
+        """
+        self.region_mask = mask
+        self.region_area = int(np.count_nonzero(mask)) if mask is not None else 0
+        
+    def updateParameters(self):
+        """
+        Updates the foreground separator to take account the current settings.
+        """
+        self.fgbg = BACKENDS[self.backend](history = self.history, mixtures = self.mixtures, background_ratio = self.background_ratio, complexity_reduction_threshold = self.complexity_reduction_threshold)
+        self.open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(int(self.open_kernel_size),int(self.open_kernel_size)))
+        
+    def getParameters(self):
+        """
+        Return the current parameters as a dict.
+        """        
+        return dict( movement_threshold = self.movement_threshold, history = self.history, mixtures = self.mixtures, background_ratio = self.background_ratio, complexity_reduction_threshold = self.complexity_reduction_threshold, open_kernel_size = self.open_kernel_size, backend = self.backend )
+        
+    def detectMovement(self, frame):
+        """
+        Detects movement from the given frame.
+        
+        Arguments:
+            frame: Videoframe. Single channel frames are used as such, color
+                   frames are converted to grayscale.
+            
+        Outputs:
+            foreground_mask: The input videoframe masked to highlight the 
+                             foreground object.
+            movement:        Boolean value indicating the presence of movement.
+        """
+        foreground_mask, ratio = self.foregroundRatio(frame)
+        
+        movement = False
+        
+        if self.movement_threshold < ratio:
+            movement = True
+            
+        return foreground_mask, movement
+
+    def foregroundRatio(self, frame):
+        """
+        Computes the ratio of foreground pixels of the given frame.
+        
+        Arguments:
+            frame: Videoframe. Single channel frames are used as such, color
+                   frames are converted to grayscale.
+            
+        Outputs:
+            foreground_mask: The foreground mask of the frame.
+            ratio:           The ratio of foreground pixels in the mask.
+        """
+        timer = self.timer
+        start = timer.now()
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            start = timer.record('convert', start)
+        foreground_mask = self.fgbg.apply(frame)
+        start = timer.record('subtract', start)
+        foreground_mask = cv2.morphologyEx(foreground_mask, cv2.MORPH_OPEN, self.open_kernel)
+        start = timer.record('open', start)
+        
+        if self.region_mask is not None:
+            foreground_mask = cv2.bitwise_and(foreground_mask, self.region_mask)
+            ratio = float(np.count_nonzero(foreground_mask)) / float(max(self.region_area, 1))
+        else:
+            ratio = float(np.count_nonzero(foreground_mask)) / float((foreground_mask.shape[0]*foreground_mask.shape[1]))
+        timer.record('count', start)
+        
+        return foreground_mask, ratio
+
+class MovementTracker:
+    """
+    Encapsulates the tracking of movements.
+    """
+    def __init__(self):
+        self.events = []
+        self.previously_moving = False
+        self.startTime = 0
+        
+    def update(self, currently_moving, time):
+        """
+        Updates the current movement state
+        
+        Arguments:
+            currently_moving:   Boolean value indicating current movement state.
+            time:               Current time  
+            
+        Outputs:
+            event:              The [start, end] event closed by the update,
+                                or None, so that events can be handled as
+                                soon as they end.
+        """
+        
+        if currently_moving == True and self.previously_moving == False:
+            self.previously_moving = True
+            self.startTime = time          
+        if currently_moving == False and self.previously_moving == True:         
+            event = [self.startTime, time]
+            self.events.append(event)
+            self.previously_moving = False
+            self.startTime = 0         
+            return event
+        return None
+            
+    def getEvents(self):
+        """
+        Returns the event array
+        """
+        return np.array(self.events)
+
+class FrameSeries:
+    """
+    Growable per-frame series of frame times and foreground ratios. The
+    arrays are preallocated and doubled when full, so appending a frame does
+    not allocate.
+    
+    Arguments:
+        capacity:   Initial number of frames.
+    """
+    def __init__(self, capacity=1024):
+        capacity = max(1, int(capacity))
+        self.size = 0
+        self.time_array = np.empty(capacity, dtype=np.float64)
+        self.ratio_array = np.empty(capacity, dtype=np.float64)
+        
+    def append(self, time, ratio):
+        """
+        Appends the time and foreground ratio of a frame.
+        """
+        if self.size == len(self.time_array):
+            self.time_array = np.resize(self.time_array, 2 * self.size)
+            self.ratio_array = np.resize(self.ratio_array, 2 * self.size)
+        self.time_array[self.size] = time
+        self.ratio_array[self.size] = ratio
+        self.size += 1
+        
+    def times(self):
+        """
+        Returns a view of the frame times.
+        """
+        return self.time_array[:self.size]
+    
+    def ratios(self):
+        """
+        Returns a view of the foreground ratios.
+        """
+        return self.ratio_array[:self.size]
+
+def detectEvents(times, movement, min_duration=0.0, merge_gap=0.0):
+    """
+    Extracts movement events from a per-frame movement series in a single
+    vectorized pass. Without the optional rules the events are identical to
+    those produced by feeding the series frame by frame to MovementTracker.
+    
+    Arguments:
+        times:          Array of frame times.
+        movement:       Boolean array indicating the presence of movement.
+        min_duration:   Events shorter than this many seconds are dropped
+                        after merging.
+        merge_gap:      Events separated by at most this many seconds are
+                        merged.
+        
+    Outputs:
+        events:     Array of [start, end] events.
+    """
+    times = np.asarray(times)
+    movement = np.asarray(movement, dtype=bool)
+    previous = np.concatenate(([False], movement[:-1]))
+    starts = np.flatnonzero(movement & ~previous)
+    ends = np.flatnonzero(~movement & previous)
+    starts = starts[:len(ends)]
+    starts = times[starts]
+    ends = times[ends]
+    
+    if merge_gap > 0 and len(starts) > 1:
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] > merge_gap))
+        starts = starts[keep]
+        ends = ends[np.concatenate((keep[1:], [True]))]
+    if min_duration > 0:
+        keep = ends - starts >= min_duration
+        starts = starts[keep]
+        ends = ends[keep]
+        
+    return np.column_stack((starts, ends))
@@ -0,0 +1,173 @@
+"""
+Author: rciszek
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from VideoReader import VideoReader
+
+def probe(file_path):
+    """
+    Returns the properties of the given video, or zeros if it cannot be
+    probed.
+    """
+    try:
+        return VideoReader.getVideoProperties(file_path)
+    except Exception:
+        return 0, 0, 0.0, 0.0, 0
+
+def scanVideos(source, extensions=('.avi',)):
+    """
+    Walks the source tree with os.scandir.
+
+    Outputs:
+        files:  Dict mapping the absolute paths of the video files to their
+                (size, mtime) tuples.
+    """
+    files = {}
+    folders = [source]
+    while folders:
+        folder = folders.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    stat = entry.stat()
+                    files[VideoIndex.key(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+    return files
+
+class VideoIndex:
+    """
+        Persistent SQLite index of the video files of an archive and their
+        probed properties. The index is refreshed incrementally: the folder
+        tree is walked with os.scandir and only new or modified files, as
+        judged by their size and modification time, are probed, using a pool
+        of concurrent ffprobe processes.
+
+        Videos which cannot be probed, such as files still being written, are
+        indexed without properties and probed again on the next refresh.
+
+        Every thread opens a connection of its own, and the index holds only
+        the path of the database when pickled, so it can be shared by threads
+        and passed to worker processes. close closes the connections of every
+        thread.
+
+        Arguments:
+            path:           Path of the SQLite database.
+            probe_threads:  The number of concurrent ffprobe processes.
+    """
+
+    EXTENSIONS = ('.avi',)
+
+    def __init__(self, path, probe_threads=8):
+        self.path = path
+        self.probe_threads = probe_threads
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['local']
+        del state['connections']
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Returns the connection of the index for the calling thread, creating
+        the database if needed.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or connection not in self.connections:
+            #Connections are closed by close from whichever thread calls it
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS videos (
+                                           path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,
+                                           width INTEGER, height INTEGER, fps REAL, duration REAL, frames INTEGER,
+                                           probed REAL)''')
+            connection.commit()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def close(self):
+        """
+        Closes the connections of every thread. Threads reconnect on their
+        next use of the index.
+        """
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+        for connection in connections:
+            connection.close()
+        self.local.connection = None
+
+    @staticmethod
+    def key(file_path):
+        return os.path.abspath(file_path).replace('\\','/')
+
+    def refresh(self, source):
+        """
+        Brings the index of the source tree up to date.
+
+        Outputs:
+            files:  Sorted list of the video files in the source tree.
+        """
+        connection = self.connect()
+        files = scanVideos(source, VideoIndex.EXTENSIONS)
+        root = VideoIndex.key(source).rstrip('/') + '/'
+        indexed = {}
+        unprobed = set()
+        for path, size, mtime, width in connection.execute('SELECT path, size, mtime, width FROM videos WHERE substr(path, 1, ?) = ?', (len(root), root)):
+            indexed[path] = (size, mtime)
+            if width is None:
+                unprobed.add(path)
+
+        removed = [(path,) for path in indexed if path not in files]
+        changed = [path for path, fingerprint in files.items() if indexed.get(path) != fingerprint or path in unprobed]
+
+        with ThreadPoolExecutor(max_workers=self.probe_threads) as executor:
+            #Properties of videos which could not be probed are left NULL
+            properties = [p if p[0] > 0 and p[1] > 0 else (None,) * 5 for p in executor.map(probe, changed)]
+
+        now = time.time()
+        connection.executemany('DELETE FROM videos WHERE path = ?', removed)
+        connection.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               [(path, files[path][0], files[path][1]) + tuple(p) + (now,) for path, p in zip(changed, properties)])
+        connection.commit()
+        return sorted(files)
+
+    def properties(self, file_path):
+        """
+        Returns the indexed (width, height, fps, duration, frames) of the
+        given video, or None if the video is not indexed, could not be probed
+        or has changed since it was indexed.
+        """
+        row = self.connect().execute('SELECT size, mtime, width, height, fps, duration, frames FROM videos WHERE path = ?', (VideoIndex.key(file_path),)).fetchone()
+        if row is None or row[2] is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (row[0], row[1]):
+            return None
+        return tuple(row[2:])
@@ -1,113 +1,398 @@
-
-import numpy as np
-import subprocess as sp
-from deployment import resource_path
-import os
-
-class VideoReader:
-    
-    DEFAULT_FPS = 30
-    FFMPEG_BIN_WIN = "ffmpeg/ffmpeg.exe"
-    FFPROBE_BIN_WIN = "ffmpeg/ffprobe.exe"
-    NO_CONSOLE_FLAG = 0x08000000
-    
-    def __init__(self,file_path):
-        self.file_path = file_path
-        self.width, self.height, self.fps, self.duration, self.frames = self.getVideoProperties(file_path)  
-        self.currentPositionInFrames = 0
-        self.openPipe(file_path,0)
-        
-        
-                
-    def openPipe(self, file_name,position):
-        
-        command = [ resource_path(VideoReader.FFMPEG_BIN_WIN),
-                '-ss', str(position),                   
-                '-i', resource_path(file_name),
-                '-f', 'image2pipe',
-                '-pix_fmt', 'rgb24',
-                '-vcodec', 'rawvideo', '-']   
-        self.pipe = sp.Popen(command, stdout = sp.PIPE, creationflags  = VideoReader.NO_CONSOLE_FLAG  )
-
-    def getVideoProperties(self,file_path):  
-
-        command = [ resource_path(VideoReader.FFPROBE_BIN_WIN),
-               '-v', 'fatal',
-               '-show_entries', 'stream=width,height,r_frame_rate,duration,nb_frames',
-               '-of', 'default=noprint_wrappers=1:nokey=1',
-               file_path]
-        ffprobe = sp.Popen(command, stdout = sp.PIPE, creationflags  = VideoReader.NO_CONSOLE_FLAG )
-        out, error = ffprobe.communicate()
-        ffprobe.stdout.close()
-        ffprobe.kill()
-        width = 0
-        height = 0
-        fps = 0
-        duration = 0
-        frames = 0
-        out = out.decode("utf-8") 
-        out = out.split('\r\n')
-        if not error:
-            width = int(out[0])
-            height = int(out[1])
-            fps = float(out[2].split('/')[0])/float(out[2].split('/')[1])
-            duration = float(out[3])
-            frames = int(out[4])
-
-                
-        return width, height, fps, duration, frames
-        
-    def nextFrame(self):
-
-        if self.pipe.stdout.closed:
-            return None
-        
-        raw_image = self.pipe.stdout.read(self.width*self.height*3)
-        frame =  np.fromstring(raw_image, dtype='uint8')
-        if frame.shape[0] == 0:
-            return None
-        frame = frame.reshape((self.height,self.width,3))
-
-        self.currentPositionInFrames += 1
-        
-        return frame
-        
-    
-    def currentPositionInSeconds(self):
-        return float(self.currentPositionInFrames / self.fps)
-    
-    def lengthInSeconds(self):
-        return self.duration
-    
-    
-    def setPositionInSeconds(self, position):
-        self.currentPositionInFrames = position*self.fps 
-        self.close()
-        self.openPipe(self.file_path,position)
-    
-    def close(self):
-        self.pipe.stdout.close()
-        self.pipe.kill()
-        
-    def isClosed(self):
-        if self.pipe.poll() is None:
-            return True
-        else:
-            return False
-        
-    def getFrameData(self, frame):
-        height = 0
-        width = 0
-        channel = 0
-        bytesPerLine = 0
-        
-        if frame is None:
-             return height, width, channel, 0
-        
-        if frame.ndim == 3:
-            height, width, channel = frame.shape
-        if frame.ndim == 2:
-            height, width = frame.shape
-        bytesPerLine = 3 * width 
-        
-        return height, width, channel, bytesPerLine
+
+import numpy as np
+import subprocess as sp
+import os
+import queue
+import shutil
+import threading
+
+try:
+    from deployment import resource_path
+except ImportError:
+    #Outside the packaged application paths are used as given
+    def resource_path(relative_path):
+        return relative_path
+
+class VideoReader:
+    
+    DEFAULT_FPS = 30
+    FFMPEG_BIN_WIN = "ffmpeg/ffmpeg.exe"
+    FFPROBE_BIN_WIN = "ffmpeg/ffprobe.exe"
+    #Environment variables overriding the paths of the executables
+    FFMPEG_ENV = "FFMPEG_BINARY"
+    FFPROBE_ENV = "FFPROBE_BINARY"
+    NO_CONSOLE_FLAG = 0x08000000
+    #Moves forward by at most this many seconds are made by reading frames
+    #instead of restarting ffmpeg
+    FORWARD_SEEK_SECONDS = 2.0
+    
+    def __init__(self,file_path, grayscale=False, target_width=None, buffer_count=0, prefetch=0, position=0, crop=None, frame_step=1, properties=None):
+        """
+        Arguments:
+            file_path:      Path of the video file.
+            grayscale:      If True, ffmpeg decodes the frames directly into
+                            single channel grayscale frames.
+            target_width:   Optional width into which the frames are downscaled
+                            by ffmpeg. The aspect ratio is preserved and frames
+                            are never upscaled.
+            buffer_count:   If positive, frames are read into a ring of this
+                            many preallocated buffers instead of a new array
+                            per frame. A frame returned by nextFrame is then
+                            valid only until buffer_count further frames have
+                            been read, after which its buffer is overwritten.
+                            Frames that must live longer have to be copied.
+            prefetch:       If positive, frames are decoded by a background
+                            thread into a queue of this depth, so that decoding
+                            overlaps the processing of the previous frames. The
+                            buffer ring is enlarged to cover the queued frames,
+                            keeping the validity of returned frames unchanged.
+            position:       Position in seconds from which the reading starts.
+            crop:           Optional (x, y, width, height) rectangle into which
+                            ffmpeg crops the frames before any scaling. The
+                            rectangle is clipped to the frame.
+            frame_step:     If larger than one, ffmpeg passes only every
+                            frame_step:th frame and the position advances by
+                            frame_step frames per read frame.
+            properties:     Optional (width, height, fps, duration, frames)
+                            tuple, for example from a VideoIndex. The video
+                            is probed with ffprobe only if it is not given.
+        """
+        self.file_path = file_path
+        if properties is None:
+            properties = self.getVideoProperties(file_path)
+        self.width, self.height, self.fps, self.duration, self.frames = properties
+        self.channels = 1 if grayscale else 3
+        self.crop = self.clipCrop(crop)
+        self.frame_step = max(1, int(frame_step))
+        self.frame_width, self.frame_height = self.outputSize(target_width)
+        self.prefetch = int(prefetch)
+        if buffer_count > 0 and self.prefetch > 0:
+            buffer_count += self.prefetch + 1
+        self.frameBuffers = [np.empty(self.frameShape(), dtype=np.uint8) for i in range(0, int(buffer_count))]
+        self.bufferIndex = 0
+        self.prefetchThread = None
+        self.currentPositionInFrames = position*self.fps
+        self.openPipe(file_path,position)
+        
+    def clipCrop(self, crop):
+        """
+        Clips the crop rectangle to the frame. Returns None if the rectangle
+        covers the whole frame.
+        """
+        if crop is None or self.width == 0:
+            return None
+        x, y, width, height = [int(v) for v in crop]
+        x = min(max(x, 0), self.width - 1)
+        y = min(max(y, 0), self.height - 1)
+        width = max(1, min(width, self.width - x))
+        height = max(1, min(height, self.height - y))
+        if (x, y, width, height) == (0, 0, self.width, self.height):
+            return None
+        return (x, y, width, height)
+        
+    def inputSize(self):
+        """
+        Returns the width and height of the frames before scaling.
+        """
+        if self.crop is not None:
+            return self.crop[2], self.crop[3]
+        return self.width, self.height
+        
+    def outputSize(self, target_width):
+        """
+        Returns the width and height of the frames produced by the pipe.
+        """
+        width, height = self.inputSize()
+        if target_width is None or width == 0 or int(target_width) >= width:
+            return width, height
+        frame_width = max(2, int(target_width) // 2 * 2)
+        frame_height = max(2, int(round(height * frame_width / float(width) / 2.0)) * 2)
+        return frame_width, frame_height
+
+    def frameShape(self):
+        """
+        Returns the shape of the frames produced by the pipe.
+        """
+        if self.channels == 1:
+            return (self.frame_height, self.frame_width)
+        return (self.frame_height, self.frame_width, self.channels)
+                
+    def inputArguments(self, file_name, position):
+        """
+        Returns the ffmpeg arguments selecting the input.
+        """
+        return ['-ss', str(position), '-i', resource_path(file_name)]
+
+    @staticmethod
+    def executable(name):
+        """
+        Returns the path of the ffmpeg or ffprobe executable: the path given
+        by FFMPEG_ENV or FFPROBE_ENV if set, the bundled binary on Windows if
+        it exists, and otherwise the executable found on PATH.
+        """
+        environment, bundled = (VideoReader.FFMPEG_ENV, VideoReader.FFMPEG_BIN_WIN) if name == 'ffmpeg' else (VideoReader.FFPROBE_ENV, VideoReader.FFPROBE_BIN_WIN)
+        if os.environ.get(environment):
+            return os.environ[environment]
+        if os.name == 'nt' and os.path.isfile(resource_path(bundled)):
+            return resource_path(bundled)
+        return shutil.which(name) or name
+
+    @staticmethod
+    def popen(command):
+        """
+        Starts a process writing into a pipe, without a console window on
+        Windows.
+        """
+        if os.name == 'nt':
+            return sp.Popen(command, stdout = sp.PIPE, creationflags = VideoReader.NO_CONSOLE_FLAG)
+        return sp.Popen(command, stdout = sp.PIPE)
+
+    def pipeCommand(self, file_name, position):
+        """
+        Returns the ffmpeg command decoding the frames into the pipe.
+        """
+        command = [ VideoReader.executable('ffmpeg') ] + self.inputArguments(file_name, position)
+        filters = []
+        if self.crop is not None:
+            filters.append('crop=%d:%d:%d:%d' % (self.crop[2], self.crop[3], self.crop[0], self.crop[1]))
+        if self.frame_step > 1:
+            filters.append('framestep=%d' % self.frame_step)
+        if (self.frame_width, self.frame_height) != self.inputSize():
+            filters.append('scale=%d:%d' % (self.frame_width, self.frame_height))
+        if filters:
+            command += ['-vf', ','.join(filters)]
+        command += ['-f', 'image2pipe',
+                '-pix_fmt', 'gray' if self.channels == 1 else 'rgb24',
+                '-vcodec', 'rawvideo', '-']   
+        return command
+
+    def openPipe(self, file_name,position):
+        
+        self.pipe = VideoReader.popen(self.pipeCommand(file_name, position))
+        self.endOfStream = False
+        if self.prefetch > 0:
+            self.startPrefetch()
+
+    def startPrefetch(self):
+        """
+        Starts the thread decoding frames into the prefetch queue.
+        """
+        self.prefetchQueue = queue.Queue(maxsize=self.prefetch)
+        self.prefetchStop = threading.Event()
+        self.prefetchThread = threading.Thread(target=self.prefetchFrames, args=(self.prefetchQueue, self.prefetchStop), daemon=True)
+        self.prefetchThread.start()
+
+    def prefetchFrames(self, frameQueue, stop):
+        """
+        Decodes frames into the queue until the end of the video or until
+        stopped. The end of the video is marked by None.
+        """
+        while not stop.is_set():
+            try:
+                frame = self.readFrame()
+            except (ValueError, OSError):
+                frame = None
+            while not stop.is_set():
+                try:
+                    frameQueue.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if frame is None:
+                return
+
+    def stopPrefetch(self):
+        """
+        Stops the prefetch thread. The pipe has to be terminated beforehand
+        so that a pending read returns.
+        """
+        if self.prefetchThread is None:
+            return
+        self.prefetchStop.set()
+        self.prefetchThread.join()
+        self.prefetchThread = None
+
+    @staticmethod
+    def getVideoProperties(file_path):  
+        """
+        Probes the first video stream of the given file or URL. Properties
+        which are not available, such as the duration and the number of
+        frames of a live stream, are returned as zeros.
+        """
+        command = [ VideoReader.executable('ffprobe'),
+               '-v', 'fatal',
+               '-select_streams', 'v:0',
+               '-show_entries', 'stream=width,height,r_frame_rate,duration,nb_frames',
+               '-of', 'default=noprint_wrappers=1:nokey=1',
+               file_path]
+        ffprobe = VideoReader.popen(command)
+        out, error = ffprobe.communicate()
+        ffprobe.stdout.close()
+        ffprobe.kill()
+        out = out.decode("utf-8").split()
+        
+        def value(index, convert):
+            try:
+                return convert(out[index])
+            except (IndexError, ValueError, ZeroDivisionError):
+                return 0
+            
+        width = value(0, int)
+        height = value(1, int)
+        fps = value(2, lambda rate: float(rate.split('/')[0])/float(rate.split('/')[1]) if '/' in rate else float(rate))
+        duration = value(3, float)
+        frames = value(4, int)
+                
+        return width, height, fps, duration, frames
+
+    @staticmethod
+    def getKeyframeTimes(file_path):
+        """
+        Lists the keyframes of the first video stream by reading its packets,
+        without decoding.
+        
+        Outputs:
+            times:  Sorted array of keyframe times in seconds.
+        """
+        command = [ VideoReader.executable('ffprobe'),
+               '-v', 'fatal',
+               '-select_streams', 'v:0',
+               '-show_entries', 'packet=pts_time,dts_time,flags',
+               '-of', 'csv=p=0',
+               file_path]
+        ffprobe = VideoReader.popen(command)
+        out, error = ffprobe.communicate()
+        times = []
+        for line in out.decode("utf-8").split():
+            fields = line.split(',')
+            if len(fields) < 3 or 'K' not in fields[-1]:
+                continue
+            for field in fields[:-1]:
+                try:
+                    times.append(float(field))
+                    break
+                except ValueError:
+                    continue
+        return np.unique(np.array(times, dtype=np.float64))
+        
+    def nextFrame(self):
+
+        if self.pipe.stdout.closed or self.endOfStream:
+            return None
+        
+        if self.prefetchThread is not None:
+            frame = self.prefetchQueue.get()
+        else:
+            frame = self.readFrame()
+            
+        if frame is None:
+            self.endOfStream = True
+            return None
+
+        self.currentPositionInFrames += self.frame_step
+        
+        return frame
+        
+    def nextFrameInto(self, frame):
+        """
+        Reads the next frame directly into the given contiguous array, such as
+        a slot of shared memory, and advances the position. The reader must
+        not prefetch. Returns False at the end of the video.
+        """
+        if self.pipe.stdout.closed or self.endOfStream:
+            return False
+        if not self.readInto(frame):
+            self.endOfStream = True
+            return False
+        self.currentPositionInFrames += self.frame_step
+        return True
+
+    def readFrame(self):
+        """
+        Reads the next frame from the pipe into a new array or into the next
+        buffer of the ring. Returns None at the end of the video.
+        """
+        if self.frameBuffers:
+            frame = self.frameBuffers[self.bufferIndex]
+            self.bufferIndex = (self.bufferIndex + 1) % len(self.frameBuffers)
+        else:
+            frame = np.empty(self.frameShape(), dtype=np.uint8)
+            
+        if not self.readInto(frame):
+            return None
+        return frame
+        
+    def readInto(self, frame):
+        """
+        Reads the next frame from the pipe directly into the given contiguous
+        array. Returns False if the pipe ended before the frame was complete,
+        or if the frame is empty as the video could not be probed.
+        """
+        if frame.nbytes == 0:
+            return False
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = self.pipe.stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+        
+    
+    def currentPositionInSeconds(self):
+        return float(self.currentPositionInFrames / self.fps)
+    
+    def lengthInSeconds(self):
+        return self.duration
+    
+    
+    def setPositionInSeconds(self, position, interrupted=None):
+        """
+        Moves the reading position. Short moves forward are made by reading
+        and discarding frames from the running pipe, other moves restart
+        ffmpeg at the new position. A move forward decodes up to
+        FORWARD_SEEK_SECONDS of frames, so it belongs to the thread reading
+        the video; the optional interrupted callable is checked between the
+        frames and ends the move early when it returns True.
+        """
+        current = self.currentPositionInSeconds()
+        if not self.endOfStream and not self.pipe.stdout.closed and 0 <= position - current <= VideoReader.FORWARD_SEEK_SECONDS:
+            while self.currentPositionInSeconds() + 0.5 * self.frame_step / self.fps < position:
+                if (interrupted is not None and interrupted()) or self.nextFrame() is None:
+                    break
+            return
+        self.currentPositionInFrames = position*self.fps 
+        self.close()
+        self.openPipe(self.file_path,position)
+    
+    def close(self):
+        if self.prefetchThread is not None:
+            self.pipe.kill()
+            self.stopPrefetch()
+        self.pipe.stdout.close()
+        self.pipe.kill()
+        
+    def isClosed(self):
+        if self.pipe.poll() is None:
+            return True
+        else:
+            return False
+        
+    def getFrameData(self, frame):
+        height = 0
+        width = 0
+        channel = 0
+        bytesPerLine = 0
+        
+        if frame is None:
+             return height, width, channel, 0
+        
+        if frame.ndim == 3:
+            height, width, channel = frame.shape
+        if frame.ndim == 2:
+            height, width = frame.shape
+            channel = 1
+        bytesPerLine = channel * width 
+        
+        return height, width, channel, bytesPerLine
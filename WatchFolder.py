@@ -0,0 +1,252 @@
+"""
+Author: rciszek
+"""
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from BatchProcessor import initWorker, processInWorker
+from VideoIndex import VideoIndex, scanVideos
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+class FileEvents:
+    """
+        Collects the paths of created, modified and moved video files reported
+        by a watchdog observer.
+    """
+
+    def __init__(self, extensions):
+        self.extensions = extensions
+        self.paths = queue.Queue()
+
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path and path.lower().endswith(self.extensions):
+                self.paths.put(VideoIndex.key(path))
+
+class WatchFolder:
+    """
+        Watches a source tree and analyzes video files as they arrive. A file
+        is analyzed once its size and modification time have not changed for
+        settle_seconds, so files still being recorded or copied are left
+        alone. At most workers files are analyzed at a time, each in a worker
+        process, and the events are written by the processor as in a batch.
+
+        New files are noticed through filesystem notifications if the
+        watchdog package is installed, and by rescanning the tree every
+        poll_interval seconds otherwise. With notifications the tree is still
+        rescanned every RESCAN_PERIOD seconds, as network shares do not
+        reliably report changes. Files found current in the job manifest of
+        the processor are not analyzed again, so a restarted watch continues
+        where it stopped. The watch itself keeps track only of the files not
+        yet recorded in the manifest.
+
+        A file whose analysis fails is analyzed again after RETRY_DELAY
+        seconds, the delay doubling after every further failure up to
+        RETRY_MAX_DELAY seconds.
+
+        Arguments:
+            processor:      BatchProcessor used for the individual files.
+            source:         Folder watched recursively for .avi files.
+            workers:        The number of worker processes.
+            settle_seconds: Seconds a file must stay unchanged before it is
+                            analyzed.
+            poll_interval:  Seconds between the rescans of the tree without
+                            notifications.
+            report:         Optional callable receiving the path and the
+                            result of every finished file, or the path and the
+                            exception of a failed file.
+    """
+
+    #Seconds between the rescans of the tree when notifications are used
+    RESCAN_PERIOD = 300.0
+    #Seconds between the checks of the candidate files
+    TICK = 1.0
+    #Seconds before a failed file is analyzed again
+    RETRY_DELAY = 60.0
+    RETRY_MAX_DELAY = 3600.0
+
+    def __init__(self, processor, source, workers=None, settle_seconds=30.0, poll_interval=10.0, report=None):
+        self.processor = processor
+        self.source = source
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.report = report
+        self.cancel_event = multiprocessing.Event()
+        self.candidates = {}
+        self.finished = {}
+        self.retries = {}
+        self.waiting = []
+        self.next_scan = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def cancel(self):
+        """
+        Stops watching. Running workers stop at their next frame.
+        """
+        self.cancel_event.set()
+
+    def startObserver(self, fileEvents):
+        """
+        Starts a watchdog observer of the source tree, or returns None if
+        watchdog is not available.
+        """
+        if Observer is None:
+            return None
+        try:
+            observer = Observer()
+            observer.schedule(fileEvents, self.source, recursive=True)
+            observer.start()
+        except Exception:
+            return None
+        return observer
+
+    def observe(self, path, fingerprint=None):
+        """
+        Adds a file to the candidates unless it has been finished with the
+        given fingerprint or is already waiting or running.
+        """
+        if path in self.candidates or path in self.waiting or (fingerprint is not None and self.finished.get(path) == fingerprint):
+            return
+        self.candidates[path] = [None, 0.0]
+
+    def settledFiles(self, now):
+        """
+        Updates the fingerprints of the candidates and returns the files
+        which have stayed unchanged for settle_seconds.
+        """
+        settled = []
+        for path in list(self.candidates):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.candidates[path]
+                self.finished.pop(path, None)
+                self.retries.pop(path, None)
+                continue
+            candidate = self.candidates[path]
+            fingerprint = (stat.st_size, stat.st_mtime_ns)
+            if candidate[0] != fingerprint:
+                candidate[0] = fingerprint
+                candidate[1] = now
+            elif now - candidate[1] >= self.settle_seconds and stat.st_size > 0:
+                settled.append(path)
+        return settled
+
+    def run(self):
+        """
+        Watches the source tree until cancelled.
+        """
+        fileEvents = FileEvents(VideoIndex.EXTENSIONS)
+        observer = self.startObserver(fileEvents)
+        scan_period = self.poll_interval if observer is None else WatchFolder.RESCAN_PERIOD
+        progress_queue = multiprocessing.Queue()
+        running = {}
+        self.next_scan = 0.0
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker, initargs=(self.cancel_event, progress_queue)) as executor:
+                while not self.cancel_event.is_set():
+                    try:
+                        self.step(executor, fileEvents, progress_queue, running, scan_period)
+                    except KeyboardInterrupt:
+                        self.cancel()
+                        raise
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            progress_queue.close()
+
+    def step(self, executor, fileEvents, progress_queue, running, scan_period):
+        """
+        Rescans the tree if due, submits the settled files and collects the
+        finished ones.
+        """
+        now = time.time()
+        if now >= self.next_scan:
+            scanned = [(path, fingerprint) for path, fingerprint in scanVideos(self.source, VideoIndex.EXTENSIONS).items()
+                       if self.finished.get(path) != fingerprint and path not in self.candidates and path not in self.waiting]
+            #Files recorded in the manifest are not tracked by the watch
+            pending = set(self.processor.pendingFiles([path for path, fingerprint in scanned]))
+            for path, fingerprint in scanned:
+                if path in pending:
+                    self.observe(path, fingerprint)
+            self.next_scan = now + scan_period
+        while True:
+            try:
+                self.observe(fileEvents.paths.get_nowait())
+            except queue.Empty:
+                break
+        for path, retry in self.retries.items():
+            if retry[1] is not None and now >= retry[1]:
+                retry[1] = None
+                self.finished.pop(path, None)
+                self.observe(path)
+
+        settled = self.settledFiles(now)
+        if settled:
+            pending = set(self.processor.pendingFiles(settled))
+            for path in settled:
+                fingerprint = self.candidates.pop(path)[0]
+                if path in pending and self.finished.get(path) != fingerprint:
+                    self.waiting.append(path)
+                    self.finished[path] = fingerprint
+
+        while self.waiting and len(running) < self.workers:
+            path = self.waiting.pop(0)
+            running[executor.submit(processInWorker, self.processor, path)] = path
+
+        while True:
+            try:
+                progress_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if not running:
+            self.cancel_event.wait(WatchFolder.TICK)
+            return
+        done, not_done = wait(running, timeout=WatchFolder.TICK, return_when=FIRST_COMPLETED)
+        for future in done:
+            self.collect(running.pop(future), future)
+
+    def retry(self, path):
+        """
+        Schedules a failed file to be analyzed again after a delay doubling
+        with every failure.
+        """
+        retry = self.retries.setdefault(path, [0, None])
+        retry[0] += 1
+        retry[1] = time.time() + min(WatchFolder.RETRY_MAX_DELAY, WatchFolder.RETRY_DELAY * 2 ** (retry[0] - 1))
+
+    def collect(self, path, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failed += 1
+            self.retry(path)
+            if self.report is not None:
+                self.report(path, e)
+            return
+        if result['completed']:
+            self.completed += 1
+            self.retries.pop(path, None)
+            try:
+                self.processor.recordCompleted(path)
+                self.finished.pop(path, None)
+            except Exception as e:
+                result = e
+                self.retry(path)
+        elif self.cancel_event.is_set():
+            #Interrupted files are analyzed again when the watch is restarted
+            self.finished.pop(path, None)
+        if self.report is not None:
+            self.report(path, result)
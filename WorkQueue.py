@@ -0,0 +1,374 @@
+"""
+Author: rciszek
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+class SQLiteWorkQueue:
+    """
+        Queue of batch jobs in an SQLite file, shared by a coordinator and
+        workers on any number of machines which see the file and the videos
+        at the same paths.
+
+        A job is a video of a batch. Every batch stores the options of the
+        processor analyzing its videos as JSON, from which the workers create
+        the processor, so they need only the path of the queue. No code is
+        loaded from the shared file.
+        A worker leases a job for lease_seconds and extends the lease with
+        heartbeats while analyzing it. A job whose lease expires, as its
+        worker has died or lost the shared filesystem, is leased again by the
+        next worker, at most max_attempts times in total, after which it is
+        marked as failed. Leasing takes an exclusive lock of the file, so a
+        job is never leased by two workers at once.
+
+        The rollback journal is used instead of WAL, as WAL requires shared
+        memory between the processes and does not work on network
+        filesystems. Locking on network filesystems is only as reliable as
+        the filesystem; a single machine is always safe.
+
+        Every thread opens a connection of its own, and the queue holds only
+        its settings when pickled.
+
+        Another queue backend has to provide the public methods of this class
+        and be added to QUEUE_BACKENDS.
+
+        Arguments:
+            path:           Path of the SQLite file.
+            lease_seconds:  Seconds a job stays leased without a heartbeat.
+            max_attempts:   The number of times a job is leased before it is
+                            marked as failed.
+    """
+
+    LEASE_SECONDS = 300.0
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = int(max_attempts)
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self):
+        """
+        Returns the connection of the queue for the calling thread, creating
+        the database if needed. Transactions are begun explicitly.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('''CREATE TABLE IF NOT EXISTS batches (
+                                      id INTEGER PRIMARY KEY, options TEXT, created REAL)''')
+            connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                      id INTEGER PRIMARY KEY, batch INTEGER, path TEXT, state TEXT, worker TEXT, expires REAL,
+                                      attempts INTEGER, frames INTEGER, seconds REAL, error TEXT, UNIQUE (batch, path))''')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, expires)')
+            connection.execute('''CREATE TABLE IF NOT EXISTS workers (
+                                      name TEXT PRIMARY KEY, heartbeat REAL, job INTEGER, frames INTEGER)''')
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def transaction(self, statements):
+        """
+        Runs the callable with the connection inside an exclusive transaction
+        and returns its result.
+        """
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def submit(self, options, video_files):
+        """
+        Adds a batch of videos analyzed with a processor created from the
+        given options.
+
+        Arguments:
+            options:        Dict of the processor options. Must be
+                            serializable as JSON.
+            video_files:    List of the video file paths.
+
+        Outputs:
+            batch:  The id of the batch.
+        """
+        data = json.dumps(options, sort_keys=True)
+        def insert(connection):
+            batch = connection.execute('INSERT INTO batches (options, created) VALUES (?, ?)', (data, time.time())).lastrowid
+            connection.executemany('INSERT OR IGNORE INTO jobs (batch, path, state, attempts, frames) VALUES (?, ?, ?, 0, 0)',
+                                   [(batch, os.path.abspath(file_path).replace('\\','/'), 'queued') for file_path in video_files])
+            return batch
+        return self.transaction(insert)
+
+    def options(self, batch):
+        """
+        Returns the processor options of the given batch.
+        """
+        row = self.connect().execute('SELECT options FROM batches WHERE id = ?', (batch,)).fetchone()
+        if row is None:
+            raise KeyError("Unknown batch: %s" % batch)
+        return json.loads(row[0])
+
+    def expire(self, connection, now):
+        connection.execute("UPDATE jobs SET state = 'failed', error = 'Lease expired' WHERE state = 'leased' AND expires < ? AND attempts >= ?",
+                           (now, self.max_attempts))
+        connection.execute("UPDATE jobs SET state = 'queued', worker = NULL WHERE state = 'leased' AND expires < ?", (now,))
+
+    def requeueExpired(self):
+        """
+        Returns the jobs with expired leases to the queue, or marks them as
+        failed after max_attempts leases.
+        """
+        self.transaction(lambda connection: self.expire(connection, time.time()))
+
+    def lease(self, worker):
+        """
+        Leases the oldest queued job for the worker.
+
+        Outputs:
+            job:    (job id, batch id, file path) tuple, or None if no job is
+                    queued.
+        """
+        def take(connection):
+            now = time.time()
+            self.expire(connection, now)
+            row = connection.execute("SELECT id, batch, path FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET state = 'leased', worker = ?, expires = ?, attempts = attempts + 1, frames = 0 WHERE id = ?",
+                               (worker, now + self.lease_seconds, row[0]))
+            connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, ?, 0)', (worker, now, row[0]))
+            return row
+        return self.transaction(take)
+
+    def heartbeat(self, worker, job, frames):
+        """
+        Extends the lease of the job and records the frames analyzed so far.
+
+        Outputs:
+            leased:     False if the lease has been lost to another worker,
+                        in which case the job should be abandoned.
+        """
+        def extend(connection):
+            now = time.time()
+            leased = connection.execute("UPDATE jobs SET expires = ?, frames = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                        (now + self.lease_seconds, frames, job, worker)).rowcount > 0
+            connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)', (worker, now, job if leased else None, frames))
+            return leased
+        return self.transaction(extend)
+
+    def complete(self, worker, job, result):
+        """
+        Marks the leased job as done with the given result of processFile.
+        """
+        def finish(connection):
+            connection.execute("UPDATE jobs SET state = 'done', frames = ?, seconds = ?, error = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+                               (result['frames'], result['seconds'], job, worker))
+            connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, NULL, 0)', (worker, time.time()))
+        self.transaction(finish)
+
+    def fail(self, worker, job, error):
+        """
+        Returns the leased job to the queue after a failure, or marks it as
+        failed after max_attempts leases.
+        """
+        def finish(connection):
+            connection.execute("UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, worker = NULL, error = ? "
+                               "WHERE id = ? AND worker = ? AND state = 'leased'", (self.max_attempts, error, job, worker))
+            connection.execute('INSERT OR REPLACE INTO workers VALUES (?, ?, NULL, 0)', (worker, time.time()))
+        self.transaction(finish)
+
+    def release(self, worker, job):
+        """
+        Returns an interrupted job to the queue without counting the lease as
+        an attempt.
+        """
+        def finish(connection):
+            connection.execute("UPDATE jobs SET state = 'queued', worker = NULL, attempts = attempts - 1 WHERE id = ? AND worker = ? AND state = 'leased'",
+                               (job, worker))
+            connection.execute('DELETE FROM workers WHERE name = ?', (worker,))
+        self.transaction(finish)
+
+    def status(self, batch=None):
+        """
+        Returns the progress of every worker combined.
+
+        Arguments:
+            batch:      Optional batch id. All batches by default.
+
+        Outputs:
+            status:     Dict with the number of jobs in each state, the frames
+                        analyzed, the failed files and the workers which have
+                        sent a heartbeat within lease_seconds.
+        """
+        connection = self.connect()
+        condition, arguments = ('batch = ?', (batch,)) if batch is not None else ('1', ())
+        counts = { state : 0 for state in ('queued', 'leased', 'done', 'failed') }
+        counts.update(connection.execute('SELECT state, COUNT(*) FROM jobs WHERE %s GROUP BY state' % condition, arguments).fetchall())
+        frames = connection.execute('SELECT COALESCE(SUM(frames), 0) FROM jobs WHERE %s' % condition, arguments).fetchone()[0]
+        failed = [dict( file = path, error = error ) for path, error in
+                  connection.execute("SELECT path, error FROM jobs WHERE state = 'failed' AND %s" % condition, arguments)]
+        now = time.time()
+        workers = [dict( name = name, job = job, frames = frames, heartbeat = round(now - heartbeat, 1) ) for name, heartbeat, job, frames in
+                   connection.execute('SELECT name, heartbeat, job, frames FROM workers WHERE heartbeat >= ? ORDER BY name', (now - self.lease_seconds,))]
+        return dict( files = sum(counts.values()), frames = frames, workers = workers, failed_files = failed, **counts )
+
+
+QUEUE_BACKENDS = { 'sqlite' : SQLiteWorkQueue }
+
+
+class QueueWorker:
+    """
+        Analyzes the jobs of a work queue one at a time. While a job is
+        analyzed, a heartbeat thread extends its lease and reports the frames
+        analyzed every heartbeat_interval seconds. If the lease has been lost,
+        the analysis is cancelled, as another worker has taken the job over.
+        The events are written by the processor of the batch, and completed
+        videos are recorded into its job manifest if it keeps one.
+
+        Arguments:
+            workQueue:          The work queue.
+            createProcessor:    Callable creating the processor of a batch from
+                                its options.
+            name:               Name of the worker, by default the host name
+                                and the process id.
+            heartbeat_interval: Seconds between heartbeats. Must be well below
+                                the lease time of the queue.
+            idle_interval:      Seconds waited for new jobs when the queue is
+                                empty.
+            exit_when_empty:    If True, the worker stops once no job is
+                                queued or leased.
+    """
+
+    HEARTBEAT_INTERVAL = 30.0
+    IDLE_INTERVAL = 10.0
+
+    def __init__(self, workQueue, createProcessor, name=None, heartbeat_interval=HEARTBEAT_INTERVAL, idle_interval=IDLE_INTERVAL, exit_when_empty=False):
+        self.workQueue = workQueue
+        self.createProcessor = createProcessor
+        self.name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_interval = idle_interval
+        self.exit_when_empty = exit_when_empty
+        self.stopEvent = threading.Event()
+        self.jobCancel = None
+        self.processors = {}
+        self.completed = 0
+        self.failed = 0
+
+    def stop(self):
+        """
+        Stops the worker. The job being analyzed is returned to the queue.
+        """
+        self.stopEvent.set()
+        jobCancel = self.jobCancel
+        if jobCancel is not None:
+            jobCancel.set()
+
+    def run(self):
+        """
+        Analyzes jobs until stopped, or until the queue is empty if
+        exit_when_empty is set.
+        """
+        while not self.stopEvent.is_set():
+            try:
+                job = self.workQueue.lease(self.name)
+            except sqlite3.OperationalError:
+                #The queue is locked by the coordinator or the other workers
+                self.stopEvent.wait(self.idle_interval)
+                continue
+            if job is None:
+                if self.exit_when_empty:
+                    status = self.workQueue.status()
+                    if status['leased'] == 0:
+                        return
+                self.stopEvent.wait(self.idle_interval)
+                continue
+            self.processJob(*job)
+
+    def sendHeartbeats(self, job, frames, done, lost):
+        while not done.wait(self.heartbeat_interval):
+            try:
+                leased = self.workQueue.heartbeat(self.name, job, frames[0])
+            except sqlite3.Error:
+                #A missed heartbeat is retried; the lease outlives several
+                continue
+            if not leased:
+                lost.set()
+                self.jobCancel.set()
+                return
+
+    def processJob(self, job, batch, file_path):
+        """
+        Analyzes a leased job and reports its outcome to the queue.
+        """
+        processor = self.processors.get(batch)
+        if processor is None:
+            try:
+                processor = self.processors[batch] = self.createProcessor(self.workQueue.options(batch))
+            except Exception as e:
+                self.failed += 1
+                self.workQueue.fail(self.name, job, "Processor not created: %s" % e)
+                return
+
+        frames = [0]
+        def progress(count):
+            frames[0] += count
+        done = threading.Event()
+        lost = threading.Event()
+        self.jobCancel = threading.Event()
+        if self.stopEvent.is_set():
+            self.jobCancel.set()
+        heartbeatThread = threading.Thread(target=self.sendHeartbeats, args=(job, frames, done, lost), daemon=True)
+        heartbeatThread.start()
+        try:
+            result = processor.processFile(file_path, self.jobCancel, progress)
+            if result['completed']:
+                processor.recordCompleted(file_path)
+        except KeyboardInterrupt:
+            done.set()
+            self.workQueue.release(self.name, job)
+            raise
+        except Exception as e:
+            done.set()
+            self.failed += 1
+            self.workQueue.fail(self.name, job, str(e))
+            return
+        finally:
+            done.set()
+            heartbeatThread.join()
+            self.jobCancel = None
+
+        if lost.is_set():
+            return
+        if result['completed']:
+            self.completed += 1
+            self.workQueue.complete(self.name, job, result)
+        elif self.stopEvent.is_set():
+            self.workQueue.release(self.name, job)
+        else:
+            #Files without an output name are never completed
+            self.failed += 1
+            self.workQueue.fail(self.name, job, "Not completed")
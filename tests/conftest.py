@@ -0,0 +1,8 @@
+"""
+Author: rciszek
+"""
+import os
+import sys
+
+#The modules of the application are top-level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+"""
+Author: rciszek
+"""
+import pytest
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from VideoAnalyzer import MovementTracker, FrameSeries, detectEvents
+
+def trackedEvents(times, movement, min_duration=0.0, merge_gap=0.0):
+    """
+    Events of the series fed frame by frame to MovementTracker, merged and
+    filtered one event at a time.
+    """
+    movementTracker = MovementTracker()
+    for time, moving in zip(times, movement):
+        movementTracker.update(bool(moving), time)
+    events = []
+    for start, end in movementTracker.events:
+        if events and start - events[-1][1] <= merge_gap:
+            events[-1][1] = end
+        else:
+            events.append([start, end])
+    return np.array([event for event in events if event[1] - event[0] >= min_duration]).reshape(-1, 2)
+
+def series(pattern, fps=10.0):
+    movement = np.array([c == '#' for c in pattern])
+    return np.arange(len(movement)) / fps, movement
+
+@pytest.mark.parametrize('pattern', ['', '.', '#', '####', '#..', '..#', '#.#.#', '##..##..', '.##.', '...###...#'])
+def test_events_equal_movement_tracker(pattern):
+    times, movement = series(pattern)
+    np.testing.assert_array_equal(detectEvents(times, movement).reshape(-1, 2), trackedEvents(times, movement))
+
+def test_run_at_the_start_is_an_event():
+    times, movement = series('##...')
+    np.testing.assert_allclose(detectEvents(times, movement), [[0.0, 0.2]])
+
+def test_run_at_the_end_is_not_closed():
+    times, movement = series('.#..##')
+    np.testing.assert_allclose(detectEvents(times, movement), [[0.1, 0.2]])
+
+def test_merge_gap_merges_gaps_up_to_the_limit():
+    times, movement = series('#.#..#...#.')
+    np.testing.assert_allclose(detectEvents(times, movement, merge_gap=0.2), [[0.0, 0.6], [0.9, 1.0]])
+    np.testing.assert_allclose(detectEvents(times, movement, merge_gap=0.2), trackedEvents(times, movement, merge_gap=0.2))
+
+def test_min_duration_applies_after_merging():
+    times, movement = series('#.#......##.......#.')
+    events = detectEvents(times, movement, min_duration=0.25, merge_gap=0.1)
+    np.testing.assert_allclose(events, [[0.0, 0.3]])
+    np.testing.assert_allclose(events, trackedEvents(times, movement, min_duration=0.25, merge_gap=0.1))
+
+def test_random_series_equal_movement_tracker():
+    random = np.random.default_rng(1)
+    for i in range(0, 50):
+        movement = random.random(500) < random.uniform(0.1, 0.9)
+        times = np.cumsum(random.uniform(0.01, 0.1, 500))
+        min_duration = random.choice([0.0, 0.05, 0.3])
+        merge_gap = random.choice([0.0, 0.05, 0.3])
+        np.testing.assert_allclose(detectEvents(times, movement, min_duration, merge_gap).reshape(-1, 2),
+                                   trackedEvents(times, movement, min_duration, merge_gap))
+
+def test_frame_series_grows():
+    frameSeries = FrameSeries(2)
+    for i in range(0, 5):
+        frameSeries.append(i / 10.0, i * 0.001)
+    np.testing.assert_allclose(frameSeries.times(), [0.0, 0.1, 0.2, 0.3, 0.4])
+    np.testing.assert_array_equal(frameSeries.ratios(), np.arange(5) * 0.001)
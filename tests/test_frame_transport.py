@@ -0,0 +1,67 @@
+"""
+Author: rciszek
+"""
+import threading
+import time
+import pytest
+np = pytest.importorskip('numpy')
+from FrameTransport import SharedFrameRing, FrameTransport
+
+class FakeReader:
+    """
+    Reader of frames filled with their index, at 10 fps.
+    """
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def nextFrameInto(self, buffer):
+        if self.index >= self.frames:
+            return False
+        buffer[:] = self.index
+        self.index += 1
+        return True
+
+    def currentPositionInSeconds(self):
+        return self.index / 10.0
+
+@pytest.fixture
+def transport():
+    frameTransport = FrameTransport(SharedFrameRing((2, 3), 2), 2)
+    yield frameTransport
+    frameTransport.close()
+
+def consume(subscriber, received, delay=0.0):
+    for index, position, frame in subscriber.frames():
+        time.sleep(delay)
+        #The slot must not have been overwritten while it is held
+        received.append((index, position, int(frame.min()), int(frame.max())))
+
+def test_every_subscriber_receives_every_frame(transport):
+    received = [[], []]
+    threads = [threading.Thread(target=consume, args=(transport.subscriber(g), received[g], 0.01 * g)) for g in range(0, 2)]
+    for thread in threads:
+        thread.start()
+    assert transport.publish(FakeReader(7))
+    for thread in threads:
+        thread.join(5.0)
+    expected = [(i, pytest.approx((i + 1) / 10.0), i, i) for i in range(0, 7)]
+    assert received[0] == expected and received[1] == expected
+
+def test_publisher_waits_for_slowest_subscriber(transport, monkeypatch):
+    monkeypatch.setattr(FrameTransport, 'WAIT_PERIOD', 0.01)
+    cancel = threading.Event()
+    published = []
+    timer = threading.Timer(0.2, cancel.set)
+    timer.start()
+    assert not transport.publish(FakeReader(7), cancel, published.append)
+    timer.cancel()
+    #No subscriber has released a slot, so only the ring is filled
+    assert published == [0, 1]
+
+def test_failed_subscriber_stops_publisher(transport, monkeypatch):
+    monkeypatch.setattr(FrameTransport, 'WAIT_PERIOD', 0.01)
+    with pytest.raises(RuntimeError):
+        transport.publish(FakeReader(7), alive=lambda: False)
+    #The subscribers are told the video has ended
+    assert [message for message in iter(transport.messages[0].get, None)] == [(0, 0.1), (1, 0.2)]
@@ -0,0 +1,26 @@
+"""
+Author: rciszek
+"""
+import json
+import pytest
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from HeadlessBatch import main, EXIT_USAGE
+
+@pytest.fixture
+def folders(tmp_path):
+    source = tmp_path / 'videos'
+    source.mkdir()
+    grid = tmp_path / 'grid.json'
+    grid.write_text(json.dumps(dict( history = [50, 100] )))
+    return str(source), str(tmp_path / 'events'), str(grid)
+
+def test_group_processes_requires_sweep(folders, capsys):
+    source, target, grid = folders
+    assert main([source, target, '--group-processes']) == EXIT_USAGE
+    assert 'Requires --sweep: --group-processes' in capsys.readouterr().err
+
+def test_sweep_rejects_unsupported_options(folders, capsys):
+    source, target, grid = folders
+    assert main([source, target, '--sweep', grid, '--two-pass', '--resume']) == EXIT_USAGE
+    assert 'Not supported with --sweep: --two-pass, --resume' in capsys.readouterr().err
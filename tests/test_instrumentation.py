@@ -0,0 +1,74 @@
+"""
+Author: rciszek
+"""
+import json
+import pytest
+from Instrumentation import StageTimer
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1.0]
+    monkeypatch.setattr('Instrumentation.time.perf_counter', lambda: clock[0])
+    return clock
+
+def test_disabled_timer_records_nothing(clock):
+    timer = StageTimer()
+    start = timer.now()
+    clock[0] += 1.0
+    assert start == 0 and timer.record('decode', start) == 0
+    assert timer.stages == [] and timer.totalSeconds() == 0.0
+    assert timer.summary() == 'no timings recorded'
+
+def test_stages_are_recorded_in_order(clock):
+    timer = StageTimer(True)
+    start = timer.now()
+    clock[0] += 0.01
+    start = timer.record('decode', start)
+    clock[0] += 0.03
+    start = timer.record('analyze', start)
+    clock[0] += 0.01
+    timer.record('decode', start)
+    assert timer.stages == ['decode', 'analyze']
+    assert timer.calls == dict( decode = 2, analyze = 1 )
+    assert timer.seconds['decode'] == pytest.approx(0.02) and timer.totalSeconds() == pytest.approx(0.05)
+    assert timer.summary() == 'decode 0.02s (40%) | analyze 0.03s (60%)'
+
+def test_stage_started_while_disabled_is_not_recorded(clock):
+    timer = StageTimer()
+    start = timer.now()
+    timer.enabled = True
+    clock[0] += 1.0
+    assert timer.record('decode', start) == clock[0]
+    assert timer.stages == []
+
+def test_percentiles_are_estimated_from_histogram(clock):
+    timer = StageTimer(True)
+    for duration in [0.001] * 90 + [0.1] * 10:
+        start = timer.now()
+        clock[0] += duration
+        timer.record('decode', start)
+    assert timer.percentile('decode', 50) == pytest.approx(0.001, rel=0.1)
+    assert timer.percentile('decode', 99) == pytest.approx(0.1, rel=0.1)
+
+def test_merged_timers_add_up(clock):
+    timers = [StageTimer(True), StageTimer(True)]
+    for timer, stage in zip(timers, ['decode', 'write']):
+        start = timer.now()
+        clock[0] += 0.5
+        timer.record(stage, start)
+    timers[0].merge(timers[1])
+    timers[0].merge(timers[1])
+    assert timers[0].stages == ['decode', 'write']
+    assert timers[0].calls['write'] == 2 and sum(timers[0].histograms['write']) == 2
+    assert timers[0].totalSeconds() == pytest.approx(1.5)
+
+def test_report_is_written_as_json(clock, tmp_path):
+    timer = StageTimer(True)
+    start = timer.now()
+    clock[0] += 0.25
+    timer.record('decode', start)
+    timer.write(str(tmp_path / 'timing.json'))
+    with open(str(tmp_path / 'timing.json')) as f:
+        report = json.load(f)
+    assert report['total_seconds'] == 0.25
+    assert report['stages']['decode']['calls'] == 1 and report['stages']['decode']['share'] == 1.0
@@ -0,0 +1,80 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from JobManifest import JobManifest
+from BatchProcessor import BatchProcessor, ParallelBatch
+
+SETTINGS = dict( parameters = dict( movement_threshold = 0.001 ) )
+OTHER_SETTINGS = dict( parameters = dict( movement_threshold = 0.005 ) )
+PARAMETERS = dict( movement_threshold = 0.001, open_kernel_size = 3 )
+
+@pytest.fixture
+def videos(tmp_path):
+    source = tmp_path / 'videos'
+    source.mkdir()
+    paths = []
+    for name in ('cage01', 'cage02'):
+        path = source / (name + '.avi')
+        path.write_bytes(b'video')
+        paths.append(str(path).replace('\\','/'))
+    return paths
+
+@pytest.fixture
+def manifest(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir()
+    manifest = JobManifest(str(target))
+    yield manifest
+    manifest.close()
+
+def jobs(videos, settings=SETTINGS):
+    return [(video, settings, None) for video in videos]
+
+def test_new_videos_are_pending(manifest, videos, tmp_path):
+    assert manifest.pending(jobs(videos)) == videos
+
+def test_completed_videos_are_not_pending(manifest, videos, tmp_path):
+    manifest.complete(videos[0], SETTINGS)
+    assert manifest.pending(jobs(videos)) == [videos[1]]
+
+def test_modified_video_is_pending(manifest, videos, tmp_path):
+    manifest.complete(videos[0], SETTINGS)
+    with open(videos[0], 'ab') as video:
+        video.write(b'more')
+    assert manifest.pending(jobs(videos[:1])) == videos[:1]
+
+def test_changed_settings_are_pending(manifest, videos, tmp_path):
+    manifest.complete(videos[0], SETTINGS)
+    assert manifest.pending(jobs(videos[:1], OTHER_SETTINGS)) == videos[:1]
+
+def test_missing_output_is_pending(manifest, videos, tmp_path):
+    output_path = str(tmp_path / 'cage01.csv')
+    manifest.complete(videos[0], SETTINGS)
+    assert manifest.pending([(videos[0], SETTINGS, output_path)]) == videos[:1]
+    open(output_path, 'w').close()
+    assert manifest.pending([(videos[0], SETTINGS, output_path)]) == []
+
+def test_checkpoints_are_stored_and_discarded(manifest, videos):
+    key = manifest.checkpoints.key(videos[0], PARAMETERS)
+    assert manifest.loadCheckpoint(key) is None
+    manifest.storeCheckpoint(key, np.array([0.0, 0.5]), np.array([0.25, 0.75]))
+    times, ratios = manifest.loadCheckpoint(key)
+    assert times.tolist() == [0.0, 0.5] and ratios.tolist() == [0.25, 0.75]
+    manifest.discardCheckpoint(key)
+    assert manifest.loadCheckpoint(key) is None
+
+def test_batch_of_current_files_reports_completion(tmp_path, videos):
+    target = tmp_path / 'target'
+    target.mkdir()
+    processor = BatchProcessor(PARAMETERS, str(target), resume=True)
+    for video in videos:
+        name = os.path.splitext(os.path.basename(video))[0]
+        open(str(target / (name + '.csv')), 'w').close()
+        processor.recordCompleted(video)
+    reports = []
+    assert ParallelBatch(processor, 1).run(videos, lambda *report: reports.append(report)) == []
+    assert reports == [(0, 0, 0, 0)]
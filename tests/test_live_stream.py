@@ -0,0 +1,75 @@
+"""
+Author: rciszek
+"""
+import threading
+import time
+import pytest
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from VideoReader import VideoReader
+from LiveStream import LiveReader
+
+PROPERTIES = (8, 4, 100.0, 0.0, 0)
+
+class FakeOutput:
+    """
+    Pipe output delivering a frame every 10 ms until the process is killed.
+    """
+    def __init__(self, killed):
+        self.killed = killed
+
+    def readinto(self, view):
+        if self.killed.wait(0.01):
+            return 0
+        view[:] = b'\x01' * len(view)
+        return len(view)
+
+    def close(self):
+        pass
+
+class FakeProcess:
+    def __init__(self):
+        self.killed = threading.Event()
+        self.stdout = FakeOutput(self.killed)
+
+    def kill(self):
+        self.killed.set()
+
+    def poll(self):
+        return 0 if self.killed.is_set() else None
+
+@pytest.fixture
+def pipes(monkeypatch):
+    pipes = []
+    def popen(command):
+        pipes.append(FakeProcess())
+        return pipes[-1]
+    monkeypatch.setattr(VideoReader, 'popen', staticmethod(popen))
+    return pipes
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_close_stops_receiver_and_pipe(pipes):
+    liveReader = LiveReader('stream', properties=PROPERTIES)
+    assert liveReader.nextFrame() is not None
+    liveReader.close()
+    assert liveReader.prefetchThread is None
+    assert len(pipes) == 1 and pipes[0].killed.is_set()
+
+def test_restarted_pipe_is_killed_on_close(pipes):
+    liveReader = LiveReader('stream', properties=PROPERTIES, policy='degrade')
+    liveReader.targetLevel = 1
+    assert waitFor(lambda: len(pipes) == 2)
+    liveReader.close()
+    assert all(pipe.killed.is_set() for pipe in pipes)
+    assert liveReader.frame_width == 4
+
+def test_no_pipe_is_started_once_closed(pipes):
+    liveReader = LiveReader('stream', properties=PROPERTIES, policy='degrade')
+    liveReader.close()
+    assert not liveReader.reopen(1)
+    assert len(pipes) == 1 and pipes[0].killed.is_set()
@@ -0,0 +1,29 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from ParameterSweep import ParameterSweep, expandGrid
+
+BASE = dict( movement_threshold = 0.001, open_kernel_size = 3, history = 100 )
+
+def test_grid_is_expanded_over_base():
+    configurations = expandGrid(dict( history = [50, 100], movement_threshold = [0.001, 0.002] ), BASE)
+    assert [(c['history'], c['movement_threshold']) for c in configurations] == [(50, 0.001), (50, 0.002), (100, 0.001), (100, 0.002)]
+    assert all(c['open_kernel_size'] == 3 for c in configurations)
+
+def test_scalar_grid_values_are_fixed():
+    assert expandGrid(dict( history = 200 ), BASE) == [dict(BASE, history = 200)]
+
+def test_grid_lists_are_concatenated():
+    configurations = expandGrid([dict( history = [50] ), dict( backend = ['knn'], history = [200] )], BASE)
+    assert configurations == [dict(BASE, history = 50), dict(BASE, backend = 'knn', history = 200)]
+
+def test_thresholds_share_background_model(tmp_path):
+    configurations = expandGrid(dict( history = [50, 100.0], movement_threshold = [0.001, 0.002] ), BASE)
+    configurations.append(dict(BASE, history = 100))
+    sweep = ParameterSweep(configurations, str(tmp_path))
+    assert sweep.groups == [[0, 1], [2, 3, 4]]
+    assert sorted(os.listdir(str(tmp_path))) == ['config_%03d' % i for i in range(0, 5)]
@@ -0,0 +1,59 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+np = pytest.importorskip('numpy')
+from RatioCache import RatioCache
+
+PARAMETERS = dict( movement_threshold = 0.001, open_kernel_size = 3, history = 100, backend = 'mog2' )
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'cage01.avi'
+    path.write_bytes(b'video')
+    return str(path)
+
+@pytest.fixture
+def ratioCache(tmp_path):
+    return RatioCache(str(tmp_path / 'cache'))
+
+def test_movement_threshold_does_not_change_key(ratioCache, video):
+    assert ratioCache.key(video, PARAMETERS) == ratioCache.key(video, dict(PARAMETERS, movement_threshold = 0.01))
+
+def test_analysis_parameters_change_key(ratioCache, video):
+    key = ratioCache.key(video, PARAMETERS)
+    assert key != ratioCache.key(video, dict(PARAMETERS, history = 200))
+    assert key != ratioCache.key(video, dict(PARAMETERS, backend = 'knn'))
+    assert key != ratioCache.key(video, PARAMETERS, dict( analysis_width = 320 ))
+
+def test_integer_and_float_parameters_share_key(ratioCache, video):
+    assert ratioCache.key(video, PARAMETERS) == ratioCache.key(video, dict(PARAMETERS, history = 100.0))
+
+def test_modified_video_changes_key(ratioCache, video):
+    key = ratioCache.key(video, PARAMETERS)
+    with open(video, 'ab') as f:
+        f.write(b'more')
+    assert key != ratioCache.key(video, PARAMETERS)
+
+def test_format_changes_key(ratioCache, video, monkeypatch):
+    key = ratioCache.key(video, PARAMETERS)
+    monkeypatch.setattr(RatioCache, 'FORMAT', RatioCache.FORMAT + 1)
+    assert key != ratioCache.key(video, PARAMETERS)
+
+def test_series_are_stored_as_float64(ratioCache, video):
+    key = ratioCache.key(video, PARAMETERS)
+    assert not ratioCache.contains(key) and ratioCache.load(key) is None
+    ratios = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+    ratioCache.store(key, [0.0, 0.04, 0.08], ratios)
+    times, loaded = ratioCache.load(key)
+    assert ratioCache.contains(key)
+    assert times.dtype == np.float64 and loaded.dtype == np.float64
+    assert loaded.tolist() == ratios.astype(np.float64).tolist()
+    assert not os.path.exists(ratioCache.path(key) + '.tmp')
+
+def test_corrupt_series_is_not_loaded(ratioCache, video):
+    key = ratioCache.key(video, PARAMETERS)
+    with open(ratioCache.path(key), 'wb') as f:
+        f.write(b'corrupt')
+    assert ratioCache.load(key) is None
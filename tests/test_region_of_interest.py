@@ -0,0 +1,54 @@
+"""
+Author: rciszek
+"""
+import json
+import pytest
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from RegionOfInterest import RegionOfInterest, loadRegion
+from VideoReader import VideoReader
+
+def unopenedReader(width, height):
+    videoReader = VideoReader.__new__(VideoReader)
+    videoReader.width, videoReader.height = width, height
+    return videoReader
+
+def test_crop_is_clipped_to_frame():
+    videoReader = unopenedReader(640, 480)
+    assert videoReader.clipCrop((100, 50, 200, 100)) == (100, 50, 200, 100)
+    assert videoReader.clipCrop((-10, -10, 700, 100)) == (0, 0, 640, 100)
+    assert videoReader.clipCrop((600, 400, 100, 100)) == (600, 400, 40, 80)
+    assert videoReader.clipCrop((700, 500, 10, 10)) == (639, 479, 1, 1)
+
+def test_crop_covering_frame_is_dropped():
+    videoReader = unopenedReader(640, 480)
+    assert videoReader.clipCrop((0, 0, 640, 480)) is None
+    assert videoReader.clipCrop((-5, 0, 1000, 1000)) is None
+    assert videoReader.clipCrop(None) is None
+    assert unopenedReader(0, 0).clipCrop((0, 0, 10, 10)) is None
+
+def test_region_without_polygon_has_no_mask():
+    assert RegionOfInterest(crop=(0, 0, 10, 10)).createMask(10, 10, 10, 10) is None
+
+def test_polygon_is_scaled_to_analyzed_frames():
+    region = RegionOfInterest(polygon=[[0, 0], [39, 0], [39, 19], [0, 19]])
+    mask = region.createMask(20, 15, 80, 60)
+    assert mask.shape == (15, 20) and mask.dtype == np.uint8
+    assert mask[:5, :10].min() == 255 and mask[6:, :].max() == 0 and mask[:, 11:].max() == 0
+
+def test_polygon_is_offset_by_clipped_crop():
+    region = RegionOfInterest(crop=(-20, 40, 100, 40), polygon=[[10, 50], [29, 50], [29, 59], [10, 59]])
+    mask = region.createMask(40, 20, 80, 60, crop=(0, 40, 80, 20))
+    assert mask.shape == (20, 40)
+    assert mask[10:, 5:14].min() == 255
+    assert mask[:9, :].max() == 0 and mask[:, :4].max() == 0 and mask[:, 16:].max() == 0
+
+def test_nearest_region_definition_is_loaded(tmp_path):
+    folder = tmp_path / 'day1'
+    folder.mkdir()
+    (tmp_path / 'roi.json').write_text(json.dumps(dict( crop = [0, 0, 10, 10] )))
+    assert loadRegion(str(folder / 'cage01.avi')).crop == (0, 0, 10, 10)
+    (folder / 'cage01.roi.json').write_text(json.dumps(dict( polygon = [[0, 0], [5, 0], [5, 5]] )))
+    region = loadRegion(str(folder / 'cage01.avi'))
+    assert region.crop is None and region.polygon == [(0.0, 0.0), (5.0, 0.0), (5.0, 5.0)]
+    assert loadRegion(str(folder / 'cage02.avi')).crop == (0, 0, 10, 10)
@@ -0,0 +1,71 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+np = pytest.importorskip('numpy')
+from ResultStore import ResultStore, main
+from JobManifest import JobManifest
+
+SETTINGS = dict( parameters = dict( movement_threshold = 0.001 ) )
+OTHER_SETTINGS = dict( parameters = dict( movement_threshold = 0.005 ) )
+
+@pytest.fixture
+def videos(tmp_path):
+    paths = []
+    for name in ('cage01', 'cage02'):
+        path = tmp_path / (name + '.avi')
+        path.write_bytes(b'video')
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture
+def resultStore(tmp_path, videos):
+    resultStore = ResultStore(str(tmp_path / 'results.sqlite'))
+    resultStore.addEvents(videos[0], 'cage01', [(SETTINGS, np.array([[1.0, 2.5], [10.0, 11.0]])), (OTHER_SETTINGS, np.array([[1.0, 2.0]]))])
+    resultStore.addEvents(videos[1], 'cage02', [(SETTINGS, np.empty((0, 2)))])
+    yield resultStore
+    resultStore.close()
+
+def test_events_are_queried_by_video_time_and_duration(resultStore, videos):
+    events = resultStore.events(settings=SETTINGS)
+    assert [(e['name'], e['start'], e['end'], e['duration']) for e in events] == [('cage01', 1.0, 2.5, 1.5), ('cage01', 10.0, 11.0, 1.0)]
+    assert [e['start'] for e in resultStore.events(videos[0], start=3.0, settings=SETTINGS)] == [10.0]
+    assert [e['start'] for e in resultStore.events('cage01', end=5.0, settings=SETTINGS)] == [1.0]
+    assert [e['start'] for e in resultStore.events(min_duration=1.2)] == [1.0]
+    assert len(resultStore.events(settings=JobManifest.settingsKey(OTHER_SETTINGS))) == 1
+
+def test_summary_includes_videos_without_events(resultStore):
+    summary = { row['name'] : row for row in resultStore.summary(SETTINGS) }
+    assert summary['cage01']['events'] == 2 and summary['cage01']['movement_seconds'] == 2.5
+    assert summary['cage02']['events'] == 0 and summary['cage02']['movement_seconds'] == 0
+    assert [row['name'] for row in resultStore.summary(SETTINGS, min_events=1)] == ['cage01']
+
+def test_events_are_replaced_when_added_again(resultStore, videos):
+    resultStore.addEvents(videos[0], 'cage01', [(SETTINGS, np.array([[5.0, 6.0]]))])
+    assert [(e['start'], e['end']) for e in resultStore.events('cage01', settings=SETTINGS)] == [(5.0, 6.0)]
+    assert len(resultStore.events('cage01', settings=OTHER_SETTINGS)) == 1
+
+def test_settings_and_analyzed_videos(resultStore, videos):
+    settings = { s['key'] : s for s in resultStore.settings() }
+    assert settings[JobManifest.settingsKey(SETTINGS)]['files'] == 2
+    assert settings[JobManifest.settingsKey(OTHER_SETTINGS)]['settings'] == OTHER_SETTINGS
+    assert resultStore.analyzed(SETTINGS) == set(JobManifest.key(path) for path in videos)
+    assert resultStore.analyzed(OTHER_SETTINGS) == set([JobManifest.key(videos[0])])
+    assert resultStore.analyzed(dict( parameters = {} )) == set()
+
+def test_export_csv_writes_an_event_file_per_video(resultStore, tmp_path):
+    folder = str(tmp_path / 'export')
+    assert resultStore.exportCsv(folder, SETTINGS) == 2
+    np.testing.assert_allclose(np.loadtxt(os.path.join(folder, 'cage01.csv'), delimiter=',').reshape(-1, 2), [[1.0, 2.5], [10.0, 11.0]])
+    with open(os.path.join(folder, 'cage02.csv')) as f:
+        assert f.read().strip() == ''
+
+def test_export_csv_requires_settings_when_several_are_stored(resultStore, tmp_path):
+    with pytest.raises(ValueError):
+        resultStore.exportCsv(str(tmp_path / 'export'))
+
+def test_command_line_prints_json_lines(resultStore, capsys):
+    assert main([resultStore.path, 'summary', '--settings', JobManifest.settingsKey(OTHER_SETTINGS)]) == 0
+    assert '"events": 1' in capsys.readouterr().out
+    assert main([resultStore.path + '.missing', 'settings']) == 1
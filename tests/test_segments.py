@@ -0,0 +1,69 @@
+"""
+Author: rciszek
+"""
+import pytest
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from BatchProcessor import BatchProcessor, combineSegments
+from Instrumentation import StageTimer
+
+PARAMETERS = dict( movement_threshold = 0.001, open_kernel_size = 3, history = 100 )
+FPS = 25.0
+
+def segmentResult(times, ratios, end_time=None, completed=True):
+    return dict(completed = completed, frames = len(times), seconds = 1.0, end_time = end_time, timings = StageTimer(False),
+                times = np.array(times, dtype=np.float64), ratios = np.array(ratios, dtype=np.float64))
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    processor = BatchProcessor(PARAMETERS, str(tmp_path), segment_length=60.0)
+    monkeypatch.setattr(processor, 'videoProperties', lambda file_path: (640, 480, FPS, processor.duration, int(processor.duration * FPS)))
+    return processor
+
+def test_long_video_is_split_into_segments(processor):
+    processor.duration = 200.0
+    segments = processor.segmentFile('videos/cage01.avi')
+    assert [(start, end) for start, end, warmup_start in segments] == [(0.0, 60.0), (60.0, 120.0), (120.0, None)]
+    #The default warm-up is twice the history of the background model
+    assert [warmup_start for start, end, warmup_start in segments] == [0.0, 52.0, 112.0]
+
+def test_short_tail_is_joined_to_the_last_segment(processor):
+    processor.duration = 145.0
+    segments = processor.segmentFile('videos/cage01.avi')
+    assert [(start, end) for start, end, warmup_start in segments] == [(0.0, 60.0), (60.0, None)]
+
+def test_video_shorter_than_one_and_half_segments_is_not_split(processor):
+    processor.duration = 89.0
+    assert processor.segmentFile('videos/cage01.avi') == [(0.0, None, 0.0)]
+
+def test_warmup_start_is_frame_aligned(processor):
+    processor.segment_warmup = 1.01
+    assert processor.warmupStart(10.0, FPS) == pytest.approx(8.96)
+    assert processor.warmupStart(0.5, FPS) == 0.0
+
+def test_contiguous_segments_are_concatenated():
+    times, ratios = combineSegments([segmentResult([0.0, 1.0], [0.0, 0.5], 2.0), segmentResult([2.0, 3.0], [0.5, 0.0])])
+    assert times.tolist() == [0.0, 1.0, 2.0, 3.0] and ratios.tolist() == [0.0, 0.5, 0.5, 0.0]
+    assert times.dtype == np.float64 and ratios.dtype == np.float64
+
+def test_separate_windows_are_closed_at_their_end():
+    times, ratios = combineSegments([segmentResult([0.0, 1.0], [0.5, 0.5], 2.0), segmentResult([5.0, 6.0], [0.5, 0.5])], contiguous=False)
+    assert times.tolist() == [0.0, 1.0, 2.0, 5.0, 6.0] and ratios.tolist() == [0.5, 0.5, 0.0, 0.5, 0.5]
+
+def test_no_segments():
+    times, ratios = combineSegments([])
+    assert times.size == 0 and ratios.size == 0
+
+def test_finished_segments_are_written(processor, tmp_path):
+    result = processor.finishSegments('videos/cage01.avi', [segmentResult([0.0, 1.0, 2.0], [0.0, 0.5, 0.5], 3.0), segmentResult([3.0, 4.0], [0.5, 0.0])])
+    assert result['completed'] and result['frames'] == 5 and result['seconds'] == 2.0
+    assert np.loadtxt(str(tmp_path / 'cage01.csv'), delimiter=',', ndmin=2).tolist() == [[1.0, 4.0]]
+
+def test_incomplete_segments_are_not_written(processor, tmp_path):
+    result = processor.finishSegments('videos/cage01.avi', [segmentResult([0.0], [0.5], 1.0), segmentResult([1.0], [0.5], completed=False)])
+    assert not result['completed']
+    assert not (tmp_path / 'cage01.csv').exists()
+
+def test_failed_segment_is_raised(processor):
+    with pytest.raises(RuntimeError):
+        processor.finishSegments('videos/cage01.avi', [segmentResult([0.0], [0.5]), RuntimeError('decoding failed')])
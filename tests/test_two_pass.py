@@ -0,0 +1,36 @@
+"""
+Author: rciszek
+"""
+import pytest
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from BatchProcessor import mergeWindows, skippedFraction
+
+def test_overlapping_windows_are_merged():
+    assert mergeWindows([[5.0, 7.0], [1.0, 3.0], [2.0, 4.0]]) == [[1.0, 4.0], [5.0, 7.0]]
+
+def test_contained_window_does_not_shrink_merged_window():
+    assert mergeWindows([[1.0, 10.0], [2.0, 3.0]]) == [[1.0, 10.0]]
+
+def test_windows_within_gap_are_merged():
+    windows = [[1.0, 2.0], [3.0, 4.0], [6.0, 7.0]]
+    assert mergeWindows(windows, gap=1.0) == [[1.0, 4.0], [6.0, 7.0]]
+    assert mergeWindows(windows, gap=0.5) == [[1.0, 2.0], [3.0, 4.0], [6.0, 7.0]]
+
+def test_no_windows():
+    assert mergeWindows([]) == []
+    assert skippedFraction([], 100.0) == 1.0
+
+def test_skipped_fraction_counts_warmup_as_decoded():
+    assert skippedFraction([[20.0, 30.0, 10.0]], 100.0) == pytest.approx(0.8)
+
+def test_skipped_fraction_does_not_count_overlapping_warmup_twice():
+    windows = [[10.0, 20.0, 5.0], [25.0, 30.0, 15.0]]
+    assert skippedFraction(windows, 100.0) == pytest.approx(0.75)
+
+def test_skipped_fraction_of_window_reaching_the_end():
+    assert skippedFraction([[50.0, None, 40.0]], 100.0) == pytest.approx(0.4)
+    assert skippedFraction([[0.0, None, 0.0]], 100.0) == 0.0
+
+def test_skipped_fraction_of_empty_video():
+    assert skippedFraction([[0.0, None, 0.0]], 0.0) == 0.0
@@ -0,0 +1,36 @@
+"""
+Author: rciszek
+"""
+import pytest
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+from VideoAnalyzer import VideoAnalyzer, BACKENDS
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_analyzer_uses_requested_backend(backend):
+    videoAnalyzer = VideoAnalyzer(backend=backend)
+    assert isinstance(videoAnalyzer.fgbg, BACKENDS[backend])
+
+def test_analyzer_applies_constructor_parameters():
+    videoAnalyzer = VideoAnalyzer(history=40, mixtures=3, background_ratio=0.6, complexity_reduction_threshold=0.1)
+    subtractor = videoAnalyzer.fgbg.fgbg
+    assert subtractor.getHistory() == 40 and subtractor.getNMixtures() == 3
+    assert subtractor.getBackgroundRatio() == pytest.approx(0.6)
+    assert subtractor.getComplexityReductionThreshold() == pytest.approx(0.1)
+    assert VideoAnalyzer(backend='knn', history=40).fgbg.fgbg.getHistory() == 40
+    assert VideoAnalyzer(backend='average', history=40).fgbg.rate == pytest.approx(0.025)
+
+def test_unsupported_backend_is_rejected():
+    with pytest.raises(ValueError):
+        VideoAnalyzer(backend='unknown')
+
+def test_analyzer_matches_updated_analyzer():
+    frames = [np.full((24, 32), 20, dtype=np.uint8) for i in range(0, 5)]
+    frames[4][4:20, 4:20] = 200
+    parameters = dict( history = 3, backend = 'average', open_kernel_size = 1 )
+    created = VideoAnalyzer(**parameters)
+    updated = VideoAnalyzer(**parameters)
+    updated.updateParameters()
+    ratios = [created.foregroundRatio(frame)[1] for frame in frames]
+    assert ratios == [updated.foregroundRatio(frame)[1] for frame in frames]
+    assert ratios[-1] == pytest.approx(16 * 16 / (24.0 * 32))
@@ -0,0 +1,67 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+pytest.importorskip('numpy')
+from VideoIndex import VideoIndex
+
+PROPERTIES = (640, 480, 25.0, 60.0, 1500)
+
+@pytest.fixture
+def probed(monkeypatch):
+    probed = []
+    def probe(file_path):
+        probed.append(os.path.basename(file_path))
+        return (0, 0, 0.0, 0.0, 0) if 'partial' in file_path else PROPERTIES
+    monkeypatch.setattr('VideoIndex.probe', probe)
+    return probed
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'videos'
+    (source / 'day1').mkdir(parents=True)
+    (source / 'day1' / 'cage01.avi').write_bytes(b'video')
+    (source / 'cage02.avi').write_bytes(b'video')
+    (source / 'notes.txt').write_bytes(b'text')
+    return source
+
+@pytest.fixture
+def videoIndex(tmp_path):
+    videoIndex = VideoIndex(str(tmp_path / 'index.sqlite'))
+    yield videoIndex
+    videoIndex.close()
+
+def test_videos_are_probed_once(videoIndex, source, probed):
+    files = videoIndex.refresh(str(source))
+    assert [os.path.basename(f) for f in files] == ['cage02.avi', 'cage01.avi']
+    assert sorted(probed) == ['cage01.avi', 'cage02.avi']
+    assert videoIndex.properties(str(source / 'cage02.avi')) == PROPERTIES
+    videoIndex.refresh(str(source))
+    assert len(probed) == 2
+
+def test_modified_video_is_stale(videoIndex, source, probed):
+    videoIndex.refresh(str(source))
+    video = source / 'cage02.avi'
+    video.write_bytes(b'longer video')
+    assert videoIndex.properties(str(video)) is None
+    videoIndex.refresh(str(source))
+    assert probed.count('cage02.avi') == 2
+    assert videoIndex.properties(str(video)) == PROPERTIES
+
+def test_removed_video_is_dropped(videoIndex, source, probed):
+    videoIndex.refresh(str(source))
+    os.remove(str(source / 'cage02.avi'))
+    assert [os.path.basename(f) for f in videoIndex.refresh(str(source))] == ['cage01.avi']
+    assert videoIndex.connect().execute('SELECT COUNT(*) FROM videos').fetchone()[0] == 1
+
+def test_unprobed_video_is_probed_again(videoIndex, source, probed):
+    video = source / 'partial.avi'
+    video.write_bytes(b'vid')
+    videoIndex.refresh(str(source))
+    assert videoIndex.properties(str(video)) is None
+    videoIndex.refresh(str(source))
+    assert probed.count('partial.avi') == 2
+
+def test_unknown_video_has_no_properties(videoIndex, source):
+    assert videoIndex.properties(str(source / 'cage02.avi')) is None
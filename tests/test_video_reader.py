@@ -0,0 +1,62 @@
+"""
+Author: rciszek
+"""
+import os
+import stat
+import pytest
+np = pytest.importorskip('numpy')
+from VideoReader import VideoReader
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='The stand-in executables are shell scripts')
+
+def writeScript(folder, name, body):
+    path = os.path.join(str(folder), name)
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n' + body + '\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+@pytest.fixture
+def executables(tmp_path, monkeypatch):
+    """
+    Stand-ins for ffprobe reporting a 4x2 video of three frames at 10 fps,
+    and for ffmpeg writing three grayscale frames of the values 0, 1 and 2.
+    """
+    folder = tmp_path / 'bin'
+    folder.mkdir()
+    writeScript(folder, 'ffprobe', 'printf "4\\n2\\n10/1\\n0.3\\n3\\n"')
+    writeScript(folder, 'ffmpeg', 'printf "\\000\\000\\000\\000\\000\\000\\000\\000\\001\\001\\001\\001\\001\\001\\001\\001\\002\\002\\002\\002\\002\\002\\002\\002"')
+    monkeypatch.setenv('PATH', str(folder) + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.delenv(VideoReader.FFMPEG_ENV, raising=False)
+    monkeypatch.delenv(VideoReader.FFPROBE_ENV, raising=False)
+    return folder
+
+def test_reader_uses_the_executables_on_path(executables):
+    assert VideoReader.executable('ffmpeg') == os.path.join(str(executables), 'ffmpeg')
+    assert VideoReader.getVideoProperties('video.avi') == (4, 2, 10.0, 0.3, 3)
+    videoReader = VideoReader('video.avi', grayscale=True)
+    try:
+        frames = []
+        frame = videoReader.nextFrame()
+        while frame is not None:
+            frames.append(frame.copy())
+            frame = videoReader.nextFrame()
+    finally:
+        videoReader.close()
+    assert [int(frame[0, 0]) for frame in frames] == [0, 1, 2]
+    assert frames[0].shape == (2, 4)
+    assert videoReader.currentPositionInSeconds() == pytest.approx(0.3)
+
+def test_environment_overrides_the_executables(executables, tmp_path, monkeypatch):
+    other = tmp_path / 'other'
+    other.mkdir()
+    ffprobe = writeScript(other, 'probe', 'printf "8\\n6\\n25/1\\n1.0\\n25\\n"')
+    monkeypatch.setenv(VideoReader.FFPROBE_ENV, ffprobe)
+    assert VideoReader.executable('ffprobe') == ffprobe
+    assert VideoReader.getVideoProperties('video.avi') == (8, 6, 25.0, 1.0, 25)
+
+def test_missing_executable_fails_on_open(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.delenv(VideoReader.FFMPEG_ENV, raising=False)
+    with pytest.raises(OSError):
+        VideoReader('video.avi', properties=(4, 2, 10.0, 0.3, 3))
@@ -0,0 +1,130 @@
+"""
+Author: rciszek
+"""
+import os
+import pytest
+from WorkQueue import SQLiteWorkQueue, QueueWorker
+
+class Processor:
+    """
+    Processor completing every video except those with 'bad' in the path.
+    """
+    def __init__(self, options):
+        self.options = options
+        self.recorded = []
+
+    def processFile(self, file_path, cancel=None, progress=None):
+        if 'bad' in file_path:
+            raise ValueError("Cannot read %s" % file_path)
+        if progress is not None:
+            progress(30)
+        return dict( completed = True, frames = 30, seconds = 0.5 )
+
+    def recordCompleted(self, file_path):
+        self.recorded.append(file_path)
+
+@pytest.fixture
+def workQueue(tmp_path):
+    workQueue = SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=60, max_attempts=2)
+    yield workQueue
+    workQueue.close()
+
+def expireLeases(workQueue):
+    workQueue.connect().execute("UPDATE jobs SET expires = 0 WHERE state = 'leased'")
+
+def test_submit_stores_options_and_absolute_paths(workQueue, tmp_path):
+    batch = workQueue.submit(dict( target = str(tmp_path), movement_threshold = 0.001 ), ['a.avi', 'b.avi'])
+    assert workQueue.options(batch) == dict( target = str(tmp_path), movement_threshold = 0.001 )
+    job, leased_batch, path = workQueue.lease('w1')
+    assert leased_batch == batch
+    assert path == os.path.abspath('a.avi').replace('\\','/')
+    with pytest.raises(KeyError):
+        workQueue.options(batch + 1)
+
+def test_lease_takes_each_job_once(workQueue):
+    workQueue.submit({}, ['a.avi', 'b.avi'])
+    first = workQueue.lease('w1')
+    second = workQueue.lease('w2')
+    assert first[2].endswith('a.avi') and second[2].endswith('b.avi')
+    assert workQueue.lease('w3') is None
+    status = workQueue.status()
+    assert status['leased'] == 2 and status['queued'] == 0
+    assert [worker['name'] for worker in status['workers']] == ['w1', 'w2']
+
+def test_heartbeat_of_another_worker_is_refused(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    job = workQueue.lease('w1')[0]
+    assert workQueue.heartbeat('w1', job, 10)
+    assert not workQueue.heartbeat('w2', job, 10)
+    assert workQueue.status()['frames'] == 10
+
+def test_expired_lease_is_requeued_then_failed(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    job = workQueue.lease('w1')[0]
+    expireLeases(workQueue)
+    assert workQueue.lease('w2')[0] == job
+    assert not workQueue.heartbeat('w1', job, 0)
+    expireLeases(workQueue)
+    workQueue.requeueExpired()
+    status = workQueue.status()
+    assert status['failed'] == 1 and status['queued'] == 0
+    assert status['failed_files'][0]['error'] == 'Lease expired'
+    assert workQueue.lease('w3') is None
+
+def test_failed_job_is_retried_up_to_max_attempts(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    job = workQueue.lease('w1')[0]
+    workQueue.fail('w1', job, 'first')
+    assert workQueue.status()['queued'] == 1
+    job = workQueue.lease('w1')[0]
+    workQueue.fail('w1', job, 'second')
+    status = workQueue.status()
+    assert status['failed'] == 1
+    assert status['failed_files'][0]['error'] == 'second'
+
+def test_release_does_not_count_an_attempt(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    for i in range(0, 3):
+        job = workQueue.lease('w1')[0]
+        workQueue.release('w1', job)
+    status = workQueue.status()
+    assert status['queued'] == 1 and status['failed'] == 0
+    assert status['workers'] == []
+
+def test_complete_records_the_result(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    job = workQueue.lease('w1')[0]
+    workQueue.complete('w1', job, dict( completed = True, frames = 120, seconds = 2.0 ))
+    status = workQueue.status()
+    assert status['done'] == 1 and status['frames'] == 120
+
+def test_status_of_a_batch(workQueue):
+    first = workQueue.submit({}, ['a.avi'])
+    second = workQueue.submit({}, ['a.avi', 'b.avi'])
+    assert workQueue.status(first)['files'] == 1
+    assert workQueue.status(second)['files'] == 2
+    assert workQueue.status()['files'] == 3
+
+def test_worker_processes_the_queue(workQueue):
+    batch = workQueue.submit(dict( target = 'events' ), ['a.avi', 'bad.avi', 'c.avi'])
+    processors = []
+    def createProcessor(options):
+        processors.append(Processor(options))
+        return processors[-1]
+    queueWorker = QueueWorker(workQueue, createProcessor, 'w1', heartbeat_interval=0.05, idle_interval=0.01, exit_when_empty=True)
+    queueWorker.run()
+    status = workQueue.status(batch)
+    assert status['done'] == 2 and status['failed'] == 1
+    assert status['failed_files'][0]['file'].endswith('bad.avi')
+    assert len(processors) == 1 and processors[0].options == dict( target = 'events' )
+    assert [os.path.basename(path) for path in processors[0].recorded] == ['a.avi', 'c.avi']
+    assert queueWorker.completed == 2 and queueWorker.failed == 2
+
+def test_worker_fails_jobs_whose_processor_is_not_created(workQueue):
+    workQueue.submit({}, ['a.avi'])
+    def createProcessor(options):
+        raise ValueError("Unknown option")
+    QueueWorker(workQueue, createProcessor, 'w1', idle_interval=0.01, exit_when_empty=True).run()
+    status = workQueue.status()
+    assert status['failed'] == 1
+    assert status['failed_files'][0]['error'] == 'Processor not created: Unknown option'